@@ -0,0 +1,102 @@
+import subprocess
+import threading
+
+from .settings import settings
+
+BACKENDS = ("docker", "docker_hosts", "local")
+
+
+class ExecutionBackend:
+    """
+    Where the build and test steps of a repo run. docker_runner writes the scripts of the steps,
+    the backend provides their environment and runs them with the repo at workspace(repo_path).
+    """
+
+    def prepare(self, repo_path: str) -> str:
+        """
+        Makes the environment with the repo dependencies ready and returns its name (e.g. the image tag)
+        """
+        raise NotImplementedError
+
+    def image_available(self, repo_path: str, image: str) -> bool:
+        """
+        Whether the environment returned by an earlier prepare, and the build outputs kept in it,
+        still exist where the repo runs
+        """
+        raise NotImplementedError
+
+    def workspace(self, repo_path: str) -> str:
+        """
+        Path of the repo as seen by the scripts
+        """
+        raise NotImplementedError
+
+    def default_build_dir(self, repo_path: str) -> str:
+        raise NotImplementedError
+
+    def run(self, repo_path: str, image: str, script: str, phase: str = "exec", log_name: str | None = None,
+            outputs: tuple[str, ...] = (), **trace_args) -> subprocess.CompletedProcess:
+        """
+        Runs a bash script in the repo workspace. outputs are the files (relative to the repo) the step writes
+        that have to end up in repo_path.
+        """
+        raise NotImplementedError
+
+    def seed(self, repo_path: str, source_path: str) -> None:
+        """
+        Lets a copy of a repo (a speculative sandbox) start from the build outputs and caches of the source repo
+        """
+
+    def stop(self, repo_path: str) -> None:
+        """
+        Releases whatever keeps running for the repo between steps
+        """
+
+
+def _execution_settings() -> dict:
+    return settings.get("execution", {})
+
+
+def create_backend(name: str | None = None) -> ExecutionBackend:
+    """
+    The backend named by execution.backend: "docker" (local daemon), "docker_hosts" (the execution.docker_hosts
+    endpoints, balanced by load) or "local" (plain subprocesses in the current environment, without Docker)
+    """
+    name = name or _execution_settings().get("backend", "docker")
+    if name == "docker":
+        from .docker_runner import DockerBackend
+        return DockerBackend()
+    if name == "docker_hosts":
+        from .docker_runner import DockerHostPool
+        hosts = _execution_settings().get("docker_hosts") or []
+        if not hosts:
+            raise Exception("The docker_hosts backend needs at least one endpoint in execution.docker_hosts.")
+        return DockerHostPool(hosts, _execution_settings().get("max_jobs_per_host"))
+    if name == "local":
+        from .local_runner import LocalBackend
+        return LocalBackend()
+    raise Exception(f"Unknown execution backend {name}, expected one of {', '.join(BACKENDS)}.")
+
+
+_backend: ExecutionBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> ExecutionBackend:
+    """
+    The backend of this process, created from the settings on first use
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+        return _backend
+
+
+def set_backend(backend: ExecutionBackend | str | None) -> None:
+    """
+    Switches the backend of this process (a backend, a backend name, or None to use the settings again)
+    """
+    global _backend
+    with _backend_lock:
+        _backend = create_backend(backend) if isinstance(backend, str) else backend
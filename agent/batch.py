@@ -0,0 +1,145 @@
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from .checkpoint import checkpoints_enabled, create_checkpointer, run_config
+from .config import AgentConfig
+from .docker_runner import set_max_docker_jobs
+from .fixer import set_max_llm_calls
+from .pipeline import create_graph
+from .settings import settings
+from .tracing import run_pipeline
+
+
+def load_manifest(manifest_path: str) -> list[dict[str, str]]:
+    """
+    Reads a batch manifest: either a JSON list of repo URLs/paths (or {"repo": ..., "name": ..., "ref": ...} objects)
+    or a text file with one repo URL/path per line, where empty lines and # comments are ignored.
+    """
+    text = Path(manifest_path).read_text(encoding="utf-8")
+    if manifest_path.endswith(".json"):
+        entries = json.loads(text)
+    else:
+        entries = [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith("#")]
+
+    jobs = []
+    names = set()
+    for entry in entries:
+        job = {"repo": entry} if isinstance(entry, str) else dict(entry)
+        base = job.get("name") or re.sub(r"\.git$", "", job["repo"].rstrip("/").split("/")[-1]) or "repo"
+        name, counter = base, 1
+        while name in names:
+            counter += 1
+            name = f"{base}_{counter}"
+        names.add(name)
+        job["name"] = name
+        jobs.append(job)
+    return jobs
+
+
+def initial_state(repo: str, ref: str | None = None) -> dict[str, Any] | None:
+    """
+    Initial pipeline state for a repo URL (optionally at a branch, tag or commit) or local path,
+    None if it is neither
+    """
+    state = {
+        "retries": 0,
+        "patch": 0,
+    }
+    if repo.endswith(".git"):
+        state["repo_url"] = repo
+        if ref:
+            state["repo_ref"] = ref
+    elif Path(repo).is_dir():
+        state["repo_path"] = repo
+    else:
+        return None
+    return state
+
+
+def pipeline_result(final_state: dict[str, Any]) -> dict[str, Any]:
+    """
+    Result of a finished pipeline in the protocol/pipeline_result.json format
+    """
+    if final_state.get("test_results"):
+        return dict(final_state["test_results"])
+    build_logs = final_state.get("build_logs") or {}
+    return {
+        "stage": "build",
+        "status": "failed" if build_logs.get("exit_code", 1) != 0 else "success",
+        "attempt": final_state.get("retries", 0),
+        "errors": [{"type": "BuildError", "message": build_logs.get("stderr", "")[-4000:], "file": "", "line": 0}]
+        if build_logs.get("exit_code", 1) != 0 else [],
+    }
+
+
+def _run_job(graph, job: dict[str, str], output_dir: Path, run_id: str | None = None) -> dict[str, Any]:
+    start = time.monotonic()
+    state = initial_state(job["repo"], job.get("ref"))
+    if state is None:
+        result = {"stage": "setup", "status": "failed", "attempt": 0,
+                  "errors": [{"type": "InvalidRepo", "message": f"Invalid repo path or URL: {job['repo']}", "file": "", "line": 0}]}
+    else:
+        try:
+            config = run_config(f"{run_id}-{job['name']}") if run_id else None
+            final_state, trace_summary = run_pipeline(graph, state, config, f"{run_id or 'batch'}-{job['name']}")
+            result = pipeline_result(final_state)
+            result["trace"] = trace_summary
+        except Exception as e:
+            result = {"stage": "pipeline", "status": "failed", "attempt": 0,
+                      "errors": [{"type": type(e).__name__, "message": str(e), "file": "", "line": 0}]}
+
+    result["repo"] = job["repo"]
+    result["duration_seconds"] = round(time.monotonic() - start, 3)
+    (output_dir / f"{job['name']}.json").write_text(json.dumps(result, indent=2, default=str), encoding="utf-8")
+    print(f"[{job['name']}] finished with status {result['status']} in {result['duration_seconds']}s.")
+    return result
+
+
+def run_batch(manifest_path: str, output_dir: str = "results", max_pipelines: int | None = None,
+              max_docker_jobs: int | None = None, max_llm_calls: int | None = None, graph=None,
+              config: AgentConfig | None = None) -> dict[str, Any]:
+    """
+    Runs the pipeline for every repo of the manifest, up to max_pipelines at the same time, with at most
+    max_docker_jobs containerized build/test steps and max_llm_calls LLM calls in flight across all of them.
+    Writes one result file per repo and summary.json to output_dir and returns the summary.
+    """
+    run_id = None
+    if graph is None:
+        if checkpoints_enabled():
+            run_id = f"batch-{time.strftime('%Y%m%d%H%M%S')}"
+            print(f"Checkpointing the pipelines under run id {run_id}-<name>.")
+            graph = create_graph(create_checkpointer(), config)
+        else:
+            graph = create_graph(config=config)
+
+    batch_settings = settings.get("batch", {})
+    max_pipelines = max_pipelines or batch_settings.get("max_pipelines", 4)
+    set_max_docker_jobs(max_docker_jobs or batch_settings.get("max_docker_jobs"))
+    set_max_llm_calls(max_llm_calls or batch_settings.get("max_llm_calls"))
+
+    jobs = load_manifest(manifest_path)
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max_pipelines) as executor:
+        results = list(executor.map(lambda job: _run_job(graph, job, output, run_id), jobs))
+
+    summary = {
+        "total": len(results),
+        "succeeded": sum(result["status"] == "success" for result in results),
+        "failed": sum(result["status"] != "success" for result in results),
+        "duration_seconds": round(time.monotonic() - start, 3),
+        "repos": [
+            {"name": job["name"], "repo": job["repo"], "status": result["status"], "stage": result["stage"],
+             "errors": len(result["errors"]), "duration_seconds": result["duration_seconds"]}
+            for job, result in zip(jobs, results)
+        ],
+    }
+    (output / "summary.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    print(f"Batch finished: {summary['succeeded']}/{summary['total']} repos passing.")
+    return summary
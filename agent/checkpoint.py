@@ -0,0 +1,90 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from .git_ops import BASE_DIR
+from .settings import settings
+
+DEFAULT_CHECKPOINT_PATH = BASE_DIR / ".checkpoints" / "pipeline.sqlite"
+
+_results_lock = threading.Lock()
+
+
+def _checkpoint_settings() -> dict:
+    return settings.get("checkpoints", {})
+
+
+def checkpoints_enabled() -> bool:
+    return _checkpoint_settings().get("enabled", False)
+
+
+def checkpoint_path() -> Path:
+    path = Path(_checkpoint_settings().get("path") or DEFAULT_CHECKPOINT_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def create_checkpointer():
+    """
+    SQLite-backed LangGraph checkpointer persisting the pipeline state after every node, keyed by run id (thread_id)
+    """
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    return SqliteSaver(sqlite3.connect(checkpoint_path(), check_same_thread=False))
+
+
+def run_config(run_id: str) -> dict[str, Any]:
+    return {"configurable": {"thread_id": run_id}}
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(checkpoint_path(), timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS step_results (
+            tree_hash TEXT NOT NULL,
+            step TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created REAL NOT NULL,
+            PRIMARY KEY (tree_hash, step)
+        )
+    """)
+    return conn
+
+
+def reuse_enabled() -> bool:
+    return _checkpoint_settings().get("reuse_results", True)
+
+
+def get_step_result(tree_hash: str, step: str) -> dict[str, Any] | None:
+    """
+    Result of a build or test step completed earlier for the same tree hash
+    """
+    if not reuse_enabled():
+        return None
+    with _results_lock:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT payload FROM step_results WHERE tree_hash = ? AND step = ?", (tree_hash, step)
+            ).fetchone()
+        finally:
+            conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def store_step_result(tree_hash: str, step: str, payload: dict[str, Any]) -> None:
+    if not reuse_enabled():
+        return
+    with _results_lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO step_results (tree_hash, step, payload, created) VALUES (?, ?, ?, ?)",
+                    (tree_hash, step, json.dumps(payload, default=str), time.time())
+                )
+        finally:
+            conn.close()
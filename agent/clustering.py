@@ -0,0 +1,107 @@
+import re
+from pathlib import PurePosixPath
+from typing import Iterable
+
+from .log_parser import FILE_LINE_PATTERN
+from .settings import settings
+
+PYTHON_FRAME_PATTERN = re.compile(r'File "([^"]+)", line (\d+)')
+ADDRESS_PATTERN = re.compile(r"\b0x[0-9a-fA-F]+\b")
+PATH_PATTERN = re.compile(r"(?<![\w.])(?:[\w.-]*/)+[\w.-]+")
+# whole numbers only, so value_1 and value_2 stay distinct names
+NUMBER_PATTERN = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?![\w.])")
+EXTERNAL_PATH_PATTERN = re.compile(r"site-packages/|dist-packages/|^/usr/|^<")
+TEST_DIRS = {"test", "tests", "testing"}
+MAX_FINGERPRINT_CHARS = 500
+
+
+def _clustering_settings() -> dict:
+    return settings.get("clustering", {})
+
+
+def clustering_enabled() -> bool:
+    return _clustering_settings().get("enabled", True)
+
+
+def _relative(path: str) -> str:
+    return path.removeprefix("/workspace/").removeprefix("./")
+
+
+def is_test_file(path: str) -> bool:
+    parts = PurePosixPath(_relative(path)).parts
+    if not parts:
+        return False
+    name = PurePosixPath(parts[-1]).stem
+    return (name.startswith("test_") or name.endswith(("_test", "_tests")) or name == "conftest"
+            or any(part in TEST_DIRS for part in parts[:-1]))
+
+
+def normalize_message(message: str) -> str:
+    """
+    The failure lines of a message (pytest's "E " lines, or its first line) with memory addresses,
+    paths and numbers replaced by placeholders, so that the same failure reads the same in every test
+    """
+    lines = [line[1:].strip() for line in message.splitlines() if line.startswith("E ")]
+    if not lines:
+        lines = message.strip().splitlines()[:1]
+    text = "\n".join(lines)
+    text = ADDRESS_PATTERN.sub("<addr>", text)
+    text = PATH_PATTERN.sub("<path>", text)
+    text = NUMBER_PATTERN.sub("<n>", text)
+    return text[:MAX_FINGERPRINT_CHARS]
+
+
+def innermost_source_frame(error: dict) -> tuple[str, int] | None:
+    """
+    The last traceback frame of the message that is neither in a test file nor outside the repo
+    """
+    message = error.get("message", "")
+    frames = [(match.start(), match.group(1), match.group(2)) for match in FILE_LINE_PATTERN.finditer(message)]
+    frames += [(match.start(), match.group(1), match.group(2)) for match in PYTHON_FRAME_PATTERN.finditer(message)]
+    for _, path, line in sorted(frames, reverse=True):
+        if EXTERNAL_PATH_PATTERN.search(path) or is_test_file(path) or _relative(path) == error["file"]:
+            continue
+        return _relative(path), int(line)
+    return None
+
+
+def fingerprint(error: dict) -> str:
+    """
+    Root cause of a failure: its exception type and innermost source frame,
+    or its normalized message when the failure is raised by the test itself
+    """
+    frame = innermost_source_frame(error)
+    if frame is not None:
+        return f"{error['type']} at {frame[0]}:{frame[1]}"
+    return f"{error['type']}: {normalize_message(error.get('message', ''))}"
+
+
+def _representatives(errors: list[dict], max_samples: int) -> list[dict]:
+    """
+    Up to max_samples errors, preferring one per test file so the samples cover different callers
+    """
+    first_by_file = {}
+    for error in errors:
+        first_by_file.setdefault(error["file"], error)
+    samples = list(first_by_file.values())[:max_samples]
+    if len(samples) < max_samples:
+        chosen = {id(error) for error in samples}
+        samples += [error for error in errors if id(error) not in chosen][:max_samples - len(samples)]
+    if len(errors) > 1:
+        samples = [dict(error, cluster_size=len(errors)) for error in samples]
+    return samples
+
+
+def cluster_errors(test_results: dict | Iterable[dict], max_samples: int | None = None) -> dict[str, list[dict]]:
+    """
+    Groups errors by root cause (see fingerprint) and keeps max_samples representative errors of each,
+    annotated with the size of their cluster
+    """
+    if max_samples is None:
+        max_samples = _clustering_settings().get("max_samples", 3)
+    errors = test_results["errors"] if isinstance(test_results, dict) else test_results
+
+    clusters = {}
+    for error in errors:
+        clusters.setdefault(fingerprint(error), []).append(error)
+    return {key: _representatives(cluster, max_samples) for key, cluster in clusters.items()}
@@ -0,0 +1,24 @@
+from typing import Any
+
+DEFAULT_MODEL = "gpt-5.1"
+
+
+class AgentConfig:
+    """
+    Configuration passed to create_graph. The LLM client (and LangChain with it) is only created
+    on first use, so building the graph or running steps that never call the LLM stays cheap.
+    """
+
+    def __init__(self, model: str | None = None, llm: Any = None):
+        self.model = model or DEFAULT_MODEL
+        self._llm = llm
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from dotenv import load_dotenv
+            from langchain_openai import ChatOpenAI
+
+            load_dotenv()
+            self._llm = ChatOpenAI(model=self.model)
+        return self._llm
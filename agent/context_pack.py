@@ -0,0 +1,156 @@
+import ast
+import re
+from pathlib import Path
+
+from .log_parser import FILE_LINE_PATTERN
+from .repo_index import RepoIndex
+
+FRAME_WINDOW = 8
+MAX_DEFINITION_LINES = 120
+CPP_SUFFIXES = (".cpp", ".cc", ".c", ".hpp", ".h")
+CPP_KEYWORDS = {"if", "for", "while", "switch", "return", "sizeof", "catch"}
+
+
+class _Slicer:
+    """
+    Collects line ranges of repo files in priority order and renders as many as fit in a character budget
+    """
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self.sections: list[tuple[str, int, int, str]] = []
+        self._lines: dict[str, list[str]] = {}
+        self._trees: dict[str, ast.Module | None] = {}
+
+    def lines(self, path: str) -> list[str]:
+        if path not in self._lines:
+            try:
+                self._lines[path] = (Path(self.repo_path) / path).read_text(encoding="utf-8").splitlines()
+            except (OSError, UnicodeDecodeError):
+                self._lines[path] = []
+        return self._lines[path]
+
+    def tree(self, path: str) -> ast.Module | None:
+        if path not in self._trees:
+            try:
+                self._trees[path] = ast.parse("\n".join(self.lines(path)))
+            except SyntaxError:
+                self._trees[path] = None
+        return self._trees[path]
+
+    def add(self, path: str, start: int, end: int, label: str) -> None:
+        lines = self.lines(path)
+        start, end = max(1, start), min(len(lines), end)
+        if start > end or any(p == path and s <= start and end <= e for p, s, e, _ in self.sections):
+            return
+        self.sections.append((path, start, end, label))
+
+    def render(self, budget_chars: int) -> tuple[str, list[str]]:
+        rendered = []
+        included = []
+        used = 0
+        for path, start, end, label in self.sections:
+            snippet = "\n".join(self.lines(path)[start - 1:end])
+            section = f"--- {path} (lines {start}-{end}, {label}) ---\n{snippet}\n"
+            if used + len(section) > budget_chars:
+                continue
+            used += len(section)
+            rendered.append(section)
+            if path not in included:
+                included.append(path)
+        return "\n".join(rendered), included
+
+
+def _enclosing_definition(tree: ast.Module, line: int) -> ast.AST | None:
+    best = None
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if node.lineno <= line <= node.end_lineno and (best is None or node.lineno >= best.lineno):
+                best = node
+    return best
+
+
+def _called_names(node: ast.AST) -> list[str]:
+    names = []
+    for child in ast.walk(node):
+        if isinstance(child, ast.Call):
+            func = child.func
+            name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+            if name and name not in names:
+                names.append(name)
+    return names
+
+
+def _cpp_called_names(lines: list[str]) -> list[str]:
+    names = []
+    for name in re.findall(r"\b([A-Za-z_]\w*)\s*\(", "\n".join(lines)):
+        if name not in names and name not in CPP_KEYWORDS and not name.isupper():
+            names.append(name)
+    return names
+
+
+def _add_frame(slicer: _Slicer, path: str, line: int, label: str) -> list[str]:
+    """
+    Adds the Python function around the line (or a window of lines) and returns the names it calls
+    """
+    tree = slicer.tree(path) if path.endswith(".py") else None
+    node = _enclosing_definition(tree, line) if tree else None
+    if node is not None and node.end_lineno - node.lineno <= MAX_DEFINITION_LINES:
+        slicer.add(path, node.lineno, node.end_lineno, label)
+        return _called_names(node)
+    slicer.add(path, line - FRAME_WINDOW, line + FRAME_WINDOW, label)
+    if path.endswith(CPP_SUFFIXES):
+        return _cpp_called_names(slicer.lines(path)[max(0, line - FRAME_WINDOW - 1):line + FRAME_WINDOW])
+    return []
+
+
+def _find_definition(slicer: _Slicer, paths: list[str], name: str) -> tuple[str, int, int] | None:
+    cpp_signature = re.compile(rf"\b{re.escape(name)}\s*\([^;]*$")
+    for path in paths:
+        if path.endswith(".py"):
+            tree = slicer.tree(path)
+            for node in ast.walk(tree) if tree else []:
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node.name == name:
+                    return path, node.lineno, node.end_lineno
+        elif path.endswith(CPP_SUFFIXES):
+            lines = slicer.lines(path)
+            for i, line in enumerate(lines):
+                if not cpp_signature.search(line) or line.lstrip().startswith(("return", "//")):
+                    continue
+                depth, opened = 0, False
+                for end in range(i, min(len(lines), i + MAX_DEFINITION_LINES)):
+                    depth += lines[end].count("{") - lines[end].count("}")
+                    opened = opened or "{" in lines[end]
+                    if opened and depth <= 0:
+                        return path, i + 1, end + 1
+    return None
+
+
+def build_context_pack(repo_path: str, errors: list[dict], repo_index: RepoIndex, budget_tokens: int,
+                       candidate_paths: list[str] | None = None) -> tuple[str, list[str]]:
+    """
+    Pre-assembles the code needed to fix a group of errors: the failing test functions, the source around
+    the traceback frames, and the definitions of the functions they call (searched in candidate_paths).
+    Sections are kept in that priority order until the token budget (~4 characters per token) is used up.
+    Returns the rendered context and the files it includes.
+    """
+    slicer = _Slicer(repo_path)
+    called = []
+
+    for error in errors:
+        if error["file"] in repo_index.files and error.get("line"):
+            called += _add_frame(slicer, error["file"], error["line"], "failing test")
+
+    for error in errors:
+        for match in FILE_LINE_PATTERN.finditer(error.get("message", "")):
+            path = match.group(1).removeprefix("/workspace/").removeprefix("./")
+            if path in repo_index.files:
+                called += _add_frame(slicer, path, int(match.group(2)), "traceback frame")
+
+    paths = candidate_paths if candidate_paths is not None else repo_index.source_files()
+    for name in dict.fromkeys(called):
+        definition = _find_definition(slicer, paths, name)
+        if definition is not None:
+            slicer.add(*definition, f"definition of {name}")
+
+    return slicer.render(budget_tokens * 4)
@@ -1,89 +1,730 @@
+import atexit
+import contextlib
+import hashlib
+import os
+import re
+import shlex
+import shutil
 import subprocess
+import tarfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
 
-def ensure_ci_image_exists():
-    check = subprocess.run(["docker", "build", "-t", "ci-image", "."], capture_output=True)
+from .backends import ExecutionBackend, get_backend
+from .git_ops import BASE_DIR, repo_key
+from .log_stream import TIMEOUT_EXIT_CODE, RotatingLog, stream_command
+from .log_parser import merge_reports, combine_reports, parse_test_durations
+from .repo_index import SKIPPED_DIRS
+from .settings import settings
+from .sharding import split_into_shards
+from .tracing import in_current_context, span
+
+DOCKER_DIR = Path(__file__).parent.parent / "docker"
+DEFAULT_LOGS_DIR = BASE_DIR / "logs"
+DEPENDENCY_MANIFESTS = ["requirements.txt", "pyproject.toml", "setup.py", "CMakeLists.txt"]
+
+# repo_path -> (container_id, image) of the long-lived worker container serving that repo
+_workers: dict[str, tuple[str, str]] = {}
+# repo_path -> docker host of the worker, for workers on a remote daemon
+_worker_hosts: dict[str, str] = {}
+# container_id -> (mtime, size) of every file copied into the workspace of a remote worker
+_synced: dict[str, dict[str, tuple[int, int]]] = {}
+_workers_lock = threading.Lock()
+# container_id -> lock serializing the syncs of the steps running concurrently in a remote worker (shards)
+_sync_locks: dict[str, threading.Lock] = {}
+# repo_path of a copy (a speculative sandbox) -> repo it was copied from, whose ccache it shares, see seed_build
+_seed_sources: dict[str, str] = {}
+
+# limits the docker build/test jobs running at the same time across pipelines, see set_max_docker_jobs
+_docker_slots: threading.BoundedSemaphore | None = None
+
+CI_IMAGE_LABEL = "ci.dockerfile.hash"
+# docker hosts (None for the local daemon) whose ci-image is known to be up to date
+_ci_images_ready: set[str | None] = set()
+_ci_image_lock = threading.Lock()
+# (docker host, image) -> lock held while the dependency image is built, see ensure_deps_image
+_deps_image_locks: dict[tuple[str | None, str], threading.Lock] = {}
+
+
+def set_max_docker_jobs(max_jobs: int | None) -> None:
+    global _docker_slots
+    _docker_slots = threading.BoundedSemaphore(max_jobs) if max_jobs else None
+
+
+def _docker_job():
+    return _docker_slots if _docker_slots is not None else contextlib.nullcontext()
+
+
+def _docker(host: str | None = None) -> list[str]:
+    """
+    The docker CLI talking to the given daemon (DOCKER_HOST syntax, e.g. ssh://ci@build-1) or the local one
+    """
+    return ["docker"] if host is None else ["docker", "-H", host]
+
+
+def _log_settings() -> dict:
+    return settings.get("logs", {})
+
+
+def log_path(repo_path: str | None, name: str) -> Path:
+    """
+    Log file of a step: logs/<repo>-<key>/<name>.log, or logs/<name>.log for steps not tied to a repo
+    """
+    logs_dir = Path(_log_settings().get("dir") or DEFAULT_LOGS_DIR)
+    if repo_path is None:
+        return logs_dir / f"{name}.log"
+    return logs_dir / f"{Path(repo_path).name}-{_repo_key(repo_path)}" / f"{name}.log"
+
+
+def _step_timeout(phase: str) -> float | None:
+    return settings.get("step_timeouts", {}).get(phase)
+
+
+def _stream_command(cmd: list[str], path: Path, timeout: float | None = None, on_timeout=None,
+                    cwd: str | Path | None = None) -> subprocess.CompletedProcess:
+    """
+    Runs a docker command streaming its output to a rotating log file (and the console when logs.live is set),
+    returning only the tail of the output
+    """
+    log_settings = _log_settings()
+    log = RotatingLog(path, log_settings.get("max_bytes", 10 * 1024 * 1024), log_settings.get("backups", 3))
+    try:
+        log.write(f"=== {time.strftime('%Y-%m-%d %H:%M:%S')} {path.stem} ===\n")
+        label = f"{path.parent.name}:{path.stem}" if log_settings.get("live", True) else None
+        return stream_command(cmd, log, timeout, log_settings.get("tail_lines", 200), label, on_timeout, cwd)
+    finally:
+        log.close()
+
+
+def _dockerfile_hash() -> str:
+    return hashlib.sha256((DOCKER_DIR / "Dockerfile").read_bytes()).hexdigest()[:16]
+
+
+def ensure_ci_image_exists(host: str | None = None):
+    """
+    Makes sure ci-image is built from the current docker/Dockerfile on the docker host.
+    The image is labeled with the Dockerfile hash and only rebuilt when the Dockerfile changes;
+    the check itself runs once per process and host.
+    """
+    with _ci_image_lock:
+        if host in _ci_images_ready:
+            return
+
+        if not DOCKER_DIR.exists():
+            raise Exception(f"Docker directory not found at {DOCKER_DIR}.")
+
+        dockerfile_hash = _dockerfile_hash()
+        inspect = subprocess.run(
+            [*_docker(host), "image", "inspect", "--format", f'{{{{ index .Config.Labels "{CI_IMAGE_LABEL}" }}}}', "ci-image"],
+            capture_output=True, text=True
+        )
+        if inspect.returncode == 0 and inspect.stdout.strip() == dockerfile_hash:
+            _ci_images_ready.add(host)
+            return
+
+        with span("build_ci_image", "docker", phase="image", host=host or "local"):
+            result = _stream_command(
+                [*_docker(host), "build", "-t", "ci-image", "--label", f"{CI_IMAGE_LABEL}={dockerfile_hash}", "."],
+                log_path(None, "ci-image"), _step_timeout("image"), cwd=DOCKER_DIR
+            )
+
+        if result.returncode != 0:
+            raise Exception(f"Failed to build CI image: {result.stderr}")
 
-    if check.returncode == 0:
         print("CI image built successfully.")
+        _ci_images_ready.add(host)
+
+
+def _dependency_hash(repo_path: str) -> str:
+    """
+    Hashes the dependency manifests of the repo, so that source-only changes keep the same hash.
+    The ci-image Dockerfile is part of the hash, since dependency images are derived from it.
+    """
+    digest = hashlib.sha256()
+    digest.update(_dockerfile_hash().encode())
+    for name in DEPENDENCY_MANIFESTS:
+        manifest = Path(repo_path) / name
+        if manifest.is_file():
+            digest.update(name.encode())
+            digest.update(manifest.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def dependency_image(repo_path: str) -> str:
+    """
+    Tag of the dependency image for the current manifests of the repo
+    """
+    return f"ci-deps:{_dependency_hash(repo_path)}"
+
+
+def image_exists(image: str, host: str | None = None) -> bool:
+    result = subprocess.run([*_docker(host), "image", "inspect", image], capture_output=True)
+    return result.returncode == 0
+
+
+def _deps_image_lock(image: str, host: str | None) -> threading.Lock:
+    with _ci_image_lock:
+        return _deps_image_locks.setdefault((host, image), threading.Lock())
+
+
+def ensure_deps_image(repo_path: str, host: str | None = None) -> str:
+    """
+    Returns a derived image of ci-image with the repo dependencies installed.
+    The image is tagged by the hash of the dependency manifests and reused as long as they do not change.
+    Pipelines needing the same image build it once, the others wait for it.
+    """
+    image = dependency_image(repo_path)
+    if image_exists(image, host):
+        print(f"Reusing dependency image {image}.")
+        return image
+    with _deps_image_lock(image, host):
+        if image_exists(image, host):
+            print(f"Reusing dependency image {image}.")
+            return image
+        return _build_deps_image(repo_path, image, host)
+
+
+def _build_deps_image(repo_path: str, image: str, host: str | None) -> str:
+    install_script = """
+    set -e
+    pip install -U pip
+    if [ -f requirements.txt ]; then
+        pip install -r requirements.txt
+    elif [ -f pyproject.toml ] || [ -f setup.py ]; then
+        pip install -e .
+    fi
+    pip install pytest async-timeout
+    """
+    docker = _docker(host)
+    # unique, so concurrent installs (e.g. of other agent processes) never remove each other's container
+    container = f"ci-deps-build-{image.split(':')[1]}-{uuid.uuid4().hex[:8]}"
+    if host is None:
+        cmd = [*docker, "run", "--name", container, "-v", f"{repo_path}:/workspace", "ci-image",
+               "bash", "-c", install_script]
+    else:
+        # a remote daemon cannot mount the repo: it is copied into the container before it starts
+        create = subprocess.run([*docker, "create", "--name", container, "ci-image", "bash", "-c", install_script],
+                                capture_output=True, text=True)
+        if create.returncode != 0:
+            raise Exception(f"Failed to create the dependency container on {host}: {create.stderr}")
+        _send_files(repo_path, host, container, list(_repo_files(repo_path)))
+        cmd = [*docker, "start", "-a", container]
+    with _docker_job(), span("install_dependencies", "docker", phase="install", image=image, host=host or "local"):
+        result = _stream_command(cmd, log_path(repo_path, "install"), _step_timeout("install"),
+                                 on_timeout=lambda: subprocess.run([*docker, "rm", "-f", container],
+                                                                   capture_output=True))
+    if result.returncode != 0:
+        subprocess.run([*docker, "rm", "-f", container], capture_output=True)
+        raise Exception(f"Failed to install dependencies: {result.stderr}")
+
+    commit = subprocess.run([*docker, "commit", container, image], capture_output=True, text=True)
+    subprocess.run([*docker, "rm", "-f", container], capture_output=True)
+    if commit.returncode != 0:
+        raise Exception(f"Failed to commit dependency image: {commit.stderr}")
+
+    print(f"Built dependency image {image}.")
+    return image
+
+
+def _repo_key(repo_path: str) -> str:
+    return hashlib.sha256(repo_path.encode()).hexdigest()[:12]
+
+
+def _ccache_key(repo_path: str) -> str:
+    # the repo identity rather than its path: every clone and sandbox of a repo shares one warm ccache
+    return hashlib.sha256(repo_key(_seed_sources.get(repo_path, repo_path)).encode()).hexdigest()[:12]
+
+
+def _build_volume(repo_path: str) -> str:
+    return f"ci-build-{_repo_key(repo_path)}"
+
+
+def _cpp_settings() -> dict:
+    return settings.get("cpp_build", {})
+
+
+def _is_cpp(repo_path: str) -> bool:
+    return (Path(repo_path) / "CMakeLists.txt").exists() or (Path(repo_path) / "Makefile").exists()
+
+
+def build_dir(repo_path: str | None = None) -> str:
+    """
+    CMake build directory of the steps: the configured cpp_build.build_dir relative to the repo
+    (e.g. "build" for an in-tree build), or else the default of the backend (the per-repo /build volume
+    of a docker worker)
+    """
+    return _cpp_settings().get("build_dir") or get_backend().default_build_dir(repo_path)
+
+
+def _cache_mounts(repo_path: str) -> list[str]:
+    """
+    Volumes keeping the build directory of a C++ repo between patch iterations (removed with the repo,
+    see remove_build_volume) and the ccache of the repo between runs
+    """
+    if not _is_cpp(repo_path):
+        return []
+    mounts = []
+    if not _cpp_settings().get("build_dir"):
+        mounts += ["-v", f"{_build_volume(repo_path)}:/build"]
+    if _cpp_settings().get("ccache", True):
+        mounts += ["-v", f"ci-ccache-{_ccache_key(repo_path)}:/ccache", "-e", "CCACHE_DIR=/ccache",
+                   "-e", f"CCACHE_MAXSIZE={_cpp_settings().get('ccache_max_size', '2G')}"]
+    return mounts
+
+
+def start_worker(repo_path: str, image: str, host: str | None = None) -> str:
+    """
+    Returns the id of a running worker container for the repo, starting one if needed.
+    A worker running an outdated image (e.g. after a dependency change) is replaced.
+    Workers on a remote docker host get a copy of the repo instead of a bind mount, see _sync_workspace.
+    """
+    with _workers_lock:
+        worker = _workers.get(repo_path)
+        if worker is not None and worker[1] == image and _worker_hosts.get(repo_path) == host:
+            return worker[0]
+        if worker is not None:
+            subprocess.run([*_docker(_worker_hosts.pop(repo_path, None)), "rm", "-f", worker[0]],
+                           capture_output=True)
+            _synced.pop(worker[0], None)
+
+        # a fixed name per repo lets a resumed run replace the worker orphaned by a crashed process
+        name = f"ci-worker-{_repo_key(repo_path)}"
+        subprocess.run([*_docker(host), "rm", "-f", name], capture_output=True)
+        workspace_mount = [] if host is not None else ["-v", f"{repo_path}:/workspace"]
+        result = subprocess.run([
+            *_docker(host), "run", "-d", "--rm", "--name", name,
+            *workspace_mount,
+            *_cache_mounts(repo_path),
+            image,
+            "sleep", "infinity"
+        ], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Failed to start worker container: {result.stderr}")
+
+        container_id = result.stdout.strip()
+        _workers[repo_path] = (container_id, image)
+        if host is not None:
+            _worker_hosts[repo_path] = host
+        print(f"Started worker container {container_id[:12]} for {repo_path}{f' on {host}' if host else ''}.")
+        return container_id
+
+
+def stop_worker(repo_path: str) -> None:
+    with _workers_lock:
+        worker = _workers.pop(repo_path, None)
+        host = _worker_hosts.pop(repo_path, None)
+    if worker is not None:
+        subprocess.run([*_docker(host), "rm", "-f", worker[0]], capture_output=True)
+        _synced.pop(worker[0], None)
+        _sync_locks.pop(worker[0], None)
+        print(f"Stopped worker container {worker[0][:12]}.")
+
+
+def remove_build_volume(repo_path: str, host: str | None = None) -> None:
+    """
+    Removes the build volume of a repo path once its pipeline is done (clones and sandboxes are never reused)
+    """
+    if _is_cpp(repo_path) and not _cpp_settings().get("build_dir"):
+        subprocess.run([*_docker(host), "volume", "rm", "-f", _build_volume(repo_path)], capture_output=True)
+
+
+def seed_build(repo_path: str, source_path: str, host: str | None = None) -> None:
+    """
+    Starts the C++ build of a copy of a repo from the build of the source repo: the copy shares its ccache
+    and gets a copy of its build directory, so only the files changed in the copy are recompiled.
+    Both are built at /workspace, so the CMake cache of the source stays valid in the copy.
+    """
+    _seed_sources[repo_path] = source_path
+    if not _is_cpp(source_path):
+        return
+    configured = _cpp_settings().get("build_dir")
+    if configured:
+        # an in-tree build dir of a remote worker only exists in its container
+        source_build = Path(source_path) / configured
+        if host is None and source_build.is_dir():
+            shutil.copytree(source_build, Path(repo_path) / configured, symlinks=True, dirs_exist_ok=True)
         return
+    docker = _docker(host)
+    if subprocess.run([*docker, "volume", "inspect", _build_volume(source_path)], capture_output=True).returncode != 0:
+        return
+    ensure_ci_image_exists(host)
+    with span("seed_build", "docker", phase="seed", host=host or "local"):
+        result = subprocess.run([*docker, "run", "--rm", "-v", f"{_build_volume(source_path)}:/from:ro",
+                                 "-v", f"{_build_volume(repo_path)}:/to", "ci-image", "cp", "-a", "/from/.", "/to/"],
+                                capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Could not copy the build of {source_path}, building {repo_path} from scratch: {result.stderr.strip()}")
+
+
+def stop_all_workers() -> None:
+    for repo_path in list(_workers):
+        stop_worker(repo_path)
+
+
+atexit.register(stop_all_workers)
+
+
+def _repo_files(repo_path: str) -> dict[str, tuple[int, int]]:
+    """
+    (mtime, size) of every file of the repo, except the directories never needed by the steps (.git, ...)
+    """
+    files = {}
+    for root, dirs, names in os.walk(repo_path):
+        dirs[:] = [name for name in dirs if name not in SKIPPED_DIRS]
+        for name in names:
+            path = Path(root) / name
+            if path.is_file():
+                stat = path.stat()
+                files[path.relative_to(repo_path).as_posix()] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def _send_files(repo_path: str, host: str, container: str, paths: list[str]) -> None:
+    """
+    Copies files of the repo into /workspace of a container on the docker host, streamed as one tar archive
+    """
+    process = subprocess.Popen([*_docker(host), "cp", "-", f"{container}:/workspace"],
+                               stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    with tarfile.open(fileobj=process.stdin, mode="w|") as archive:
+        for path in paths:
+            archive.add(Path(repo_path) / path, arcname=path)
+    process.stdin.close()
+    stderr = process.stderr.read().decode(errors="replace")
+    if process.wait() != 0:
+        raise Exception(f"Failed to copy {repo_path} to {host}: {stderr}")
+
+
+def _sync_workspace(repo_path: str, host: str, container_id: str) -> None:
+    """
+    Brings the workspace of a remote worker up to date with the repo: only the files changed since the last
+    sync are sent, and the files deleted since are removed
+    """
+    with _workers_lock:
+        lock = _sync_locks.setdefault(container_id, threading.Lock())
+    with lock:
+        current = _repo_files(repo_path)
+        synced = _synced.get(container_id, {})
+        changed = [path for path, stat in current.items() if synced.get(path) != stat]
+        deleted = [path for path in synced if path not in current]
+        with span("sync_workspace", "docker", phase="sync", host=host, files=len(changed)):
+            if changed:
+                _send_files(repo_path, host, container_id, changed)
+            if deleted:
+                subprocess.run([*_docker(host), "exec", "-w", "/workspace", container_id, "rm", "-f", "--", *deleted],
+                               capture_output=True)
+        _synced[container_id] = current
+
+
+def _fetch_outputs(repo_path: str, host: str, container_id: str, outputs: tuple[str, ...]) -> None:
+    for output in outputs:
+        target = Path(repo_path) / output
+        target.unlink(missing_ok=True)
+        subprocess.run([*_docker(host), "cp", f"{container_id}:/workspace/{output}", str(target)],
+                       capture_output=True)
+
+
+def _kill_step(host: str | None, container_id: str, step: str) -> None:
+    """
+    Kills the process group of one step, leaving the other steps running in the worker (e.g. concurrent shards)
+    """
+    pid_file = f"/tmp/ci-step-{step}.pid"
+    subprocess.run([*_docker(host), "exec", container_id, "bash", "-c",
+                    f"kill -KILL -- -$(cat {pid_file}); rm -f {pid_file}"], capture_output=True)
+
+
+def _exec(repo_path: str, image: str, script: str, phase: str = "exec", log_name: str | None = None,
+          host: str | None = None, outputs: tuple[str, ...] = (), **trace_args) -> subprocess.CompletedProcess:
+    """
+    Runs a script in the worker container of the repo, in its own process group. A step running over its
+    step_timeouts entry is killed with everything it started; the worker and the steps running next to it stay.
+    On a remote docker host the workspace is synced before the step and the outputs are copied back after it.
+    """
+    container_id = start_worker(repo_path, image, host)
+    step = uuid.uuid4().hex[:12]
+    # the group leader records its pid (= the process group id) and becomes the script
+    cmd = [*_docker(host), "exec", "-w", "/workspace", container_id, "setsid", "-w", "bash", "-c",
+           f'echo $$ > /tmp/ci-step-{step}.pid; exec bash -c "$0"', script]
+    with _docker_job():
+        if host is not None:
+            _sync_workspace(repo_path, host, container_id)
+        with span(f"docker_{phase}", "docker", phase=phase, host=host or "local", **trace_args) as trace:
+            result = _stream_command(cmd, log_path(repo_path, log_name or phase), _step_timeout(phase),
+                                     on_timeout=lambda: _kill_step(host, container_id, step))
+            trace["exit_code"] = result.returncode
+        if host is not None and result.returncode != TIMEOUT_EXIT_CODE:
+            _fetch_outputs(repo_path, host, container_id, outputs)
+        return result
+
+
+class DockerBackend(ExecutionBackend):
+    """
+    Runs the steps in a long-lived worker container per repo, on the local docker daemon
+    or on the remote one given by host
+    """
+
+    def __init__(self, host: str | None = None):
+        self.host = host
 
-    project_root = Path(__file__).parent.parent
-    docker_dir = project_root / "docker"
+    def prepare(self, repo_path: str) -> str:
+        ensure_ci_image_exists(self.host)
+        return ensure_deps_image(repo_path, self.host)
 
-    if not docker_dir.exists():
-        raise Exception(f"Docker directory not found at {docker_dir}.")
+    def image_available(self, repo_path: str, image: str) -> bool:
+        if not image_exists(image, self.host):
+            return False
+        # a build kept in a build volume is gone once the volume was removed at the end of a pipeline
+        if _is_cpp(repo_path) and not _cpp_settings().get("build_dir"):
+            inspect = subprocess.run([*_docker(self.host), "volume", "inspect", _build_volume(repo_path)],
+                                     capture_output=True)
+            return inspect.returncode == 0
+        return True
 
-    result = subprocess.run(["docker", "build", "-t", "ci-image", "."], cwd=docker_dir, capture_output=True, text=True)
+    def workspace(self, repo_path: str) -> str:
+        return "/workspace"
 
+    def default_build_dir(self, repo_path: str) -> str:
+        return "/build"
+
+    def run(self, repo_path: str, image: str, script: str, phase: str = "exec", log_name: str | None = None,
+            outputs: tuple[str, ...] = (), **trace_args) -> subprocess.CompletedProcess:
+        return _exec(repo_path, image, script, phase, log_name, self.host, outputs, **trace_args)
+
+    def seed(self, repo_path: str, source_path: str) -> None:
+        seed_build(repo_path, source_path, self.host)
+
+    def stop(self, repo_path: str) -> None:
+        stop_worker(repo_path)
+        remove_build_volume(repo_path, self.host)
+        _seed_sources.pop(repo_path, None)
+
+
+def host_load(host: str) -> int | None:
+    """
+    Containers running on the docker host, None if it cannot be reached
+    """
+    result = subprocess.run([*_docker(host), "ps", "-q"], capture_output=True, text=True, timeout=30)
     if result.returncode != 0:
-        raise Exception(f"Failed to build CI image: {result.stderr}")
+        return None
+    return len(result.stdout.split())
+
+
+class DockerHostPool(ExecutionBackend):
+    """
+    Spreads the repos over several docker hosts. A repo is assigned to the reachable host with the fewest
+    running containers when it is first prepared and stays there, next to its images, build and ccache volumes.
+    At most max_jobs_per_host steps run on a host at the same time.
+    """
+
+    def __init__(self, hosts: list[str], max_jobs_per_host: int | None = None):
+        self.backends = {host: DockerBackend(host) for host in hosts}
+        self._slots = {host: threading.BoundedSemaphore(max_jobs_per_host) if max_jobs_per_host
+                       else contextlib.nullcontext() for host in hosts}
+        self._assigned: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def host_for(self, repo_path: str) -> str:
+        with self._lock:
+            if repo_path in self._assigned:
+                return self._assigned[repo_path]
+        # the hosts are probed without the lock, so a slow host does not hold up the steps of assigned repos
+        running = {}
+        for host in self.backends:
+            try:
+                load = host_load(host)
+            except subprocess.TimeoutExpired:
+                load = None
+            if load is None:
+                print(f"Docker host {host} is unreachable, skipping it.")
+                continue
+            running[host] = load
+        with self._lock:
+            # assigned by a concurrent call in the meantime
+            if repo_path in self._assigned:
+                return self._assigned[repo_path]
+            # repos assigned but not started yet count as well
+            loads = {host: load + sum(assigned == host for assigned in self._assigned.values())
+                     for host, load in running.items()}
+            if not loads:
+                raise Exception(f"None of the docker hosts is reachable: {', '.join(self.backends)}.")
+            host = min(loads, key=loads.get)
+            self._assigned[repo_path] = host
+            print(f"Running {repo_path} on {host} ({loads[host]} containers running).")
+            return host
+
+    def prepare(self, repo_path: str) -> str:
+        return self.backends[self.host_for(repo_path)].prepare(repo_path)
+
+    def image_available(self, repo_path: str, image: str) -> bool:
+        return self.backends[self.host_for(repo_path)].image_available(repo_path, image)
+
+    def workspace(self, repo_path: str) -> str:
+        return "/workspace"
+
+    def default_build_dir(self, repo_path: str) -> str:
+        return "/build"
+
+    def run(self, repo_path: str, image: str, script: str, phase: str = "exec", log_name: str | None = None,
+            outputs: tuple[str, ...] = (), **trace_args) -> subprocess.CompletedProcess:
+        host = self.host_for(repo_path)
+        with self._slots[host]:
+            return self.backends[host].run(repo_path, image, script, phase, log_name, outputs, **trace_args)
+
+    def seed(self, repo_path: str, source_path: str) -> None:
+        # the copy runs next to the source, where its build volume and ccache are
+        host = self.host_for(source_path)
+        with self._lock:
+            self._assigned[repo_path] = host
+        self.backends[host].seed(repo_path, source_path)
+
+    def stop(self, repo_path: str) -> None:
+        with self._lock:
+            host = self._assigned.pop(repo_path, None)
+        if host is not None:
+            self.backends[host].stop(repo_path)
 
 
 def build_image(repo_path: str) -> dict[str, Any]:
-    ensure_ci_image_exists()
-    build_script = """
+    backend = get_backend()
+    image = backend.prepare(repo_path)
+    cpp_settings = _cpp_settings()
+    jobs = cpp_settings.get("jobs") or "$(nproc)"
+    build = shlex.quote(build_dir(repo_path))
+    ccache = "true" if cpp_settings.get("ccache", True) else "false"
+    ninja = "true" if cpp_settings.get("ninja", True) else "false"
+    # the build directory is only configured once; `cmake --build` reconfigures itself when CMakeLists.txt
+    # changes, so rebuilds after a patch are incremental
+    build_script = f"""
     set -e
-    if [ -f pyproject.toml ] || [ -f setup.py ] || [ -f requirements.txt ]; then
-        pip install -U pip 
-        pip install -r requirements.txt || pip install .
-    fi 
-    
+    if {ccache} && command -v ccache > /dev/null; then
+        LAUNCHER="-DCMAKE_C_COMPILER_LAUNCHER=ccache -DCMAKE_CXX_COMPILER_LAUNCHER=ccache"
+        export PATH=/usr/lib/ccache:$PATH
+    fi
+    if {ninja} && command -v ninja > /dev/null; then
+        GENERATOR="-G Ninja"
+    fi
     if [ -f CMakeLists.txt ] ; then
-        cmake -S . -B build
-        cmake --build build
+        if [ ! -f {build}/CMakeCache.txt ] ; then
+            cmake -S . -B {build} $GENERATOR $LAUNCHER
+        fi
+        cmake --build {build} -j {jobs}
     elif [ -f Makefile ] ; then
-        make
+        make -j {jobs}
     fi
     """
 
-    cmd = [
-        "docker", "run" , "--rm",
-        "-v", f"{repo_path}:/workspace",
-        "ci-image",
-        "bash", "-c", build_script
-    ]
+    result = backend.run(repo_path, image, build_script, "build")
     repo_path = Path(repo_path)
-    result = subprocess.run(cmd, capture_output=True, text=True)
     return {
         "exit_code": result.returncode,
         "stdout": result.stdout,
         "stderr": result.stderr,
+        "image": image,
+        "log_path": str(log_path(str(repo_path), "build")),
         "python_detected" : repo_path.joinpath("pyproject.toml").exists() or
                             repo_path.joinpath("setup.py").exists() or
                             repo_path.joinpath("requirements.txt").exists(),
         "cpp_detected" : repo_path.joinpath("CMakeLists.txt").exists() or repo_path.joinpath("Makefile").exists()
     }
 
-def run_tests(repo_path: str, is_python: bool, is_cpp: bool) -> dict[str, Any]:
+def _run_python_shards(repo_path: str, image: str, shards: int) -> dict[str, Any]:
+    """
+    Collects the pytest node ids, splits them into shards balanced by the durations of the previous report
+    and runs the shards concurrently in the worker container, combining their reports into report.xml.
+    """
+    collect_script = """
+    set -e
+    python -m pytest --version > /dev/null 2>&1 || pip install pytest async-timeout
+    pytest --collect-only -q
+    """
+    collected = get_backend().run(repo_path, image, collect_script, "collect")
+    test_ids = [line.strip() for line in collected.stdout.splitlines() if "::" in line]
+    if collected.returncode != 0 or len(test_ids) < 2:
+        print("Could not collect tests for sharding, running them serially.")
+        return run_tests(repo_path, True, False, image, shards=1)
+
+    groups = split_into_shards(test_ids, shards, parse_test_durations(repo_path))
+    shard_dir = Path(repo_path) / ".ci_shards"
+    shard_dir.mkdir(exist_ok=True)
+    for i, group in enumerate(groups):
+        (shard_dir / f"shard_{i}.txt").write_text("\n".join(group), encoding="utf-8")
+    print(f"Running {len(test_ids)} tests in {len(groups)} shards.")
+
+    def run_shard(i: int) -> subprocess.CompletedProcess:
+        # node ids as arguments rather than an @file, which pytest only reads since 8.2
+        shard_script = f"""
+        set -e
+        mapfile -t TESTS < .ci_shards/shard_{i}.txt
+        pytest --junitxml=report_shard_{i}.xml "${{TESTS[@]}}" || true
+        """
+        return get_backend().run(repo_path, image, shard_script, "test", f"test_shard_{i}",
+                                 (f"report_shard_{i}.xml",), shard=i)
+
+    with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+        results = list(executor.map(in_current_context(run_shard), range(len(groups))))
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    missing = combine_reports(repo_path, [f"report_shard_{i}.xml" for i in range(len(groups))])
+    # `|| true` hides the exit code of pytest, a shard without a report failed to run its tests
+    exit_code = max(result.returncode for result in results)
+    if missing and exit_code == 0:
+        print(f"{len(missing)} test shards wrote no report.")
+        exit_code = 1
+
+    return {
+        "exit_code": exit_code,
+        "stdout": "\n".join(result.stdout for result in results),
+        "stderr": "\n".join(result.stderr for result in results),
+        "log_path": str(log_path(repo_path, "test_shard_0").parent),
+    }
+
+
+def run_tests(repo_path: str, is_python: bool, is_cpp: bool, image: str | None = None,
+              test_ids: list[str] | None = None, shards: int | None = None) -> dict[str, Any]:
+    """
+    Runs the test suite in the worker container and writes the results to report.xml.
+    If test_ids are given only those tests are rerun and their results are merged into the existing report.
+    Full runs are split into `shards` concurrent runs (test_shards setting by default).
+    """
+    backend = get_backend()
+    image = image or dependency_image(repo_path)
+    shards = shards or settings.get("test_shards", 1)
+    report = "rerun.xml" if test_ids else "report.xml"
     if is_python:
-        test_script = """
+        if shards > 1 and not test_ids:
+            return _run_python_shards(repo_path, image, shards)
+        selection = " ".join(shlex.quote(test_id) for test_id in test_ids or [])
+        test_script = f"""
         set -e
-        if [ -f requirements.txt ]; then 
-            pip install -r requirements.txt;
-        fi
-        pip install pytest async-timeout
-        pytest --junitxml=report.xml || true
+        python -m pytest --version > /dev/null 2>&1 || pip install pytest async-timeout
+        pytest --junitxml={report} {selection} || true
         """
     elif is_cpp:
-        test_script = """
+        selection = f"-j {shards}" if shards > 1 else ""
+        if test_ids:
+            names = "|".join(re.escape(test_id.split("::")[-1]) for test_id in test_ids)
+            selection += f" -R {shlex.quote(f'^({names})$')}"
+        build = shlex.quote(build_dir(repo_path))
+        workspace = shlex.quote(backend.workspace(repo_path))
+        test_script = f"""
         set -e 
-        if [ -d build ]; then 
-            cd build;
-            ctest --output-on-failure --output-junit ../report.xml || true;
+        if [ -d {build} ]; then 
+            cd {build};
+            ctest --output-on-failure --output-junit {workspace}/{report} {selection} || true;
         else
             echo "No build directory found";
             exit 1;
         fi
         """
-    cmd = ["docker", "run", "--rm",
-           "-v", f"{repo_path}:/workspace",
-           "ci-image", "bash", "-c", test_script]
-
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    result = backend.run(repo_path, image, test_script, "test", outputs=(report,),
+                         tests=len(test_ids) if test_ids else "all")
+    if test_ids and result.returncode == 0:
+        merge_reports(repo_path, report)
     return {
         "exit_code": result.returncode,
         "stdout": result.stdout,
         "stderr": result.stderr,
-    }
\ No newline at end of file
+        "log_path": str(log_path(repo_path, "test")),
+    }
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from .settings import settings
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "autonomous-ci-agent" / "fix_cache.sqlite"
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+
+def _cache_settings() -> dict:
+    return settings.get("fix_cache", {})
+
+
+def cache_enabled() -> bool:
+    return _cache_settings().get("enabled", True)
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    path = Path(_cache_settings().get("path") or DEFAULT_CACHE_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fixes (
+                    key TEXT PRIMARY KEY,
+                    fixes TEXT NOT NULL,
+                    read_files TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            yield conn
+    finally:
+        conn.close()
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _file_hash(repo_path: str, relative_path: str) -> str | None:
+    try:
+        return content_hash((Path(repo_path) / relative_path).read_text(encoding="utf-8"))
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def cache_key(repo_path: str, errors: list[dict], prompt_template: str, model: str = "") -> str:
+    """
+    Hashes the grouped errors, the current content of the files they point to, the prompt template and the model
+    """
+    digest = hashlib.sha256()
+    digest.update(prompt_template.encode("utf-8"))
+    digest.update(model.encode("utf-8"))
+    digest.update(json.dumps(errors, sort_keys=True, default=str).encode("utf-8"))
+    for file_path in sorted({error["file"] for error in errors}):
+        digest.update(file_path.encode("utf-8"))
+        digest.update((_file_hash(repo_path, file_path) or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_cached_fix(key: str, repo_path: str) -> dict[str, str] | None:
+    """
+    Returns the stored fixes for the key, provided that every file the agent read
+    to produce them still has the same content.
+    """
+    with _connect() as conn:
+        row = conn.execute("SELECT fixes, read_files FROM fixes WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        read_files = json.loads(row[1])
+        if any(_file_hash(repo_path, path) != digest for path, digest in read_files.items()):
+            return None
+
+        conn.execute("UPDATE fixes SET last_used = ? WHERE key = ?", (time.time(), key))
+    return json.loads(row[0])
+
+
+def store_fix(key: str, fixes: dict[str, str], read_files: dict[str, str]) -> None:
+    """
+    Stores the fixes with the hashes of the files read to produce them, evicting the least recently used
+    entries once the cache grows over its size limit
+    """
+    payload = json.dumps(fixes)
+    max_bytes = _cache_settings().get("max_bytes", DEFAULT_MAX_BYTES)
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO fixes (key, fixes, read_files, size, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, payload, json.dumps(read_files), len(payload), time.time())
+        )
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM fixes").fetchone()[0]
+        for stale_key, size in conn.execute("SELECT key, size FROM fixes ORDER BY last_used").fetchall():
+            if total <= max_bytes:
+                break
+            conn.execute("DELETE FROM fixes WHERE key = ?", (stale_key,))
+            total -= size
@@ -1,31 +1,30 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import contextvars
 from pathlib import Path
 import difflib
-from langchain_core.tools import tool
-from langchain.agents import create_agent
+from typing import Iterable
 import re
-
-def _get_file_structure(repo_path: str) -> str:
-    """"
-    returns a string representation of the file structure of the repo
-    """
-    structure = []
-    for root, dirs, files in Path(repo_path).walk():
-
-        root_str = str(root)
-        if ".git" in root_str or "__pycache__" in root_str or ".venv" in root_str:
-            continue
-        for file in files:
-            if file.endswith((".py", ".cpp", ".h", ".c")):
-                rel_path = root.relative_to(repo_path)
-                structure.append(str(rel_path / file))
-
-    return "\n".join(structure)
-
-
-def _parse_fix_response(response_text: str) -> dict[str, str]:
+import threading
+
+from .clustering import cluster_errors, clustering_enabled
+from .context_pack import build_context_pack
+from .fix_cache import cache_enabled, cache_key, content_hash, get_cached_fix, store_fix
+from .repo_index import RepoIndex, get_repo_index
+from .patching import PatchConflictError, apply_edit_blocks, parse_edit_blocks
+from .rate_limit import RateLimiter, backoff_delay, is_rate_limit_error
+from .settings import settings
+from .tracing import span
+from .validation import max_reprompts, validate_fixes, validation_enabled
+
+_llm_slots: threading.BoundedSemaphore | None = None
+LLM_SLOT_POLL_SECONDS = 0.05
+# args of the "propose_fix" span of the current task, accumulating the LLM usage of that fix
+_fix_trace: contextvars.ContextVar[dict | None] = contextvars.ContextVar("fix_trace", default=None)
+
+def _parse_fix_response(response_text: str) -> dict[str, str | list[tuple[str, str]]]:
     """
-    Parses the response from the agent into a dictionary of source file paths and their updated content.
+    Parses the response from the agent into a dictionary of source file paths and either their
+    complete updated content (FIXED_CODE) or the list of their SEARCH/REPLACE edits (EDITS).
     """
     fixes = {}
     parts = re.split(r'(?=SOURCE_FILE:)', response_text)
@@ -38,15 +37,67 @@ def _parse_fix_response(response_text: str) -> dict[str, str]:
             continue
         file_path = file_match.group(1).strip()
         code_match = re.search(r"FIXED_CODE:\n```(?:\w+)?\n(.*)\n```", part, re.DOTALL)
+        edits = parse_edit_blocks(part)
         if code_match:
             new_code = code_match.group(1)
             fixes[file_path] = new_code
+        elif edits:
+            fixes[file_path] = edits
 
     if not fixes:
         print("[Parse Warning] No fixes found in the response.")
 
     return fixes
 
+def _resolve_fixes(repo_path: str, parsed: dict[str, str | list[tuple[str, str]]]) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Turns parsed fixes into complete file contents by applying the edits to the current files.
+    Returns the resolved fixes and, for files whose edits could not be applied, the conflict reason.
+    """
+    fixes = {}
+    conflicts = {}
+    for file_path, fix in parsed.items():
+        if isinstance(fix, str):
+            fixes[file_path] = fix
+            continue
+        try:
+            original = (Path(repo_path) / file_path).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            original = ""
+        try:
+            fixes[file_path] = apply_edit_blocks(original, fix)
+        except PatchConflictError as e:
+            conflicts[file_path] = str(e)
+    return fixes, conflicts
+
+def _edit_blocks(original: str, fixed: str) -> list[tuple[str, str]]:
+    """
+    SEARCH/REPLACE blocks turning original into fixed, each changed hunk with a few lines of context
+    """
+    old, new = original.splitlines(keepends=True), fixed.splitlines(keepends=True)
+    blocks = []
+    for group in difflib.SequenceMatcher(None, old, new, autojunk=False).get_grouped_opcodes(3):
+        blocks.append(("".join(old[group[0][1]:group[-1][2]]), "".join(new[group[0][3]:group[-1][4]])))
+    return blocks
+
+def _merge_fix(repo_path: str, file_path: str, base: str, other: str) -> str:
+    """
+    Applies the changes `other` makes to the current file on top of `base`, another fix of the same file.
+    Changes already made by base are skipped; overlapping ones raise PatchConflictError.
+    """
+    try:
+        original = (Path(repo_path) / file_path).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        original = ""
+    content = base
+    for search, replace in _edit_blocks(original, other):
+        try:
+            content = apply_edit_blocks(content, [(search, replace)])
+        except PatchConflictError:
+            if search in content or replace not in content:
+                raise
+    return content
+
 def _make_changes_log(repo_path: str, fixes: dict[str, str], patch: int) -> None:
     """
     Generates a markdown changes log with diff for all fixes
@@ -81,61 +132,18 @@ def _make_changes_log(repo_path: str, fixes: dict[str, str], patch: int) -> None
     print(f"Changes logged to {changes_file}")
 
 
-def group_errors_by_file(test_results: dict) -> dict:
+def group_errors_by_file(test_results: dict | Iterable[dict]) -> dict:
+    """
+    Groups errors by file. Accepts test results or a stream of errors such as log_parser.iter_test_errors.
+    """
     errors_by_file = {}
+    errors = test_results["errors"] if isinstance(test_results, dict) else test_results
 
-    for error in test_results["errors"]:
-        errors_by_file[error["file"]] = errors_by_file.get(error["file"], []) + [error]
+    for error in errors:
+        errors_by_file.setdefault(error["file"], []).append(error)
     return errors_by_file
 
-def propose_fix_parallel(llm, repo_path: str, test_results: dict) -> dict[str, str]:
-    file_structure = _get_file_structure(repo_path)
-
-    grouped_results = group_errors_by_file(test_results)
-
-    if not grouped_results:
-        print("No errors found, skipping fix proposal.")
-        return {}
-
-    all_fixes = {}
-
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        future_to_file = {
-            executor.submit(
-                _propose_fix, llm, repo_path, errors, file_structure
-            ) : file_path
-            for file_path, errors in grouped_results.items()
-        }
-        for future in as_completed(future_to_file):
-            try:
-                fixes = future.result()
-                if fixes:
-                    all_fixes.update(fixes)
-            except Exception as exc:
-                print(f"Error processing {future_to_file[future]}: {exc}")
-
-    return all_fixes
-
-def _propose_fix(llm, repo_path: str, errors: list[dict[str,str]], file_structure) -> dict[str, str]:
-
-    print("Running a propose fix in parallel.")
-
-    @tool
-    def read_repo_file(relative_path: str) -> str:
-        """
-        Reads a file from the repo.
-        :param relative_path:
-        :return: content of the file
-        """
-        full_path = Path(repo_path) / relative_path
-        try:
-            return full_path.read_text(encoding='utf-8')
-        except Exception as e:
-            return f"Error reading file {full_path}: {str(e)}"
-
-    tools = [read_repo_file]
-    agent_exec = create_agent(llm, tools=tools)
-    prompt = f"""
+FIX_PROMPT = """
     You are an expert dev ops developer debugging a CI pipeline. 
     
     REPO STRUCTURE:
@@ -144,6 +152,9 @@ def _propose_fix(llm, repo_path: str, errors: list[dict[str,str]], file_structur
     LOGS:
     {errors}
     
+    CODE CONTEXT (the failing tests, the code around the traceback frames and the definitions they call):
+    {code_context}
+    
     RULES:
     1. Make sure you only change the code that is not passing the tests and do not fix any other code no matter how minor the change would be.
     2. Do NOT change whitespace or formatting, and do NOT make any stylistic changes.
@@ -152,25 +163,312 @@ def _propose_fix(llm, repo_path: str, errors: list[dict[str,str]], file_structur
     
     YOUR TASK:
     1. Analyze the LOGS and FAILING TESTS to deduce which SOURCE FILES (implementation) are broken using REPO STRUCTURE.
-    2. Use the `read_repo_file` tool to read the contents of the suspected source code files (and tests if needed).
+    2. Start from the CODE CONTEXT. Use the `read_repo_file` tool only if you need code that is not in it.
     3. Analyze the code to find the bug/problem and understand it in detail.
     4. If there is no bug in the SOURCE FILE, analyze the test and if there is a bug propose a fix of the test file. 
-    4. Propose a fix by proposing the COMPLETE updated content of the fixed source file.
+    4. Propose a fix as SEARCH/REPLACE edits of the fixed source file.
     
     OUTPUT FORMAT:
-    It is crucial that you return the fix plan in the following format:
+    It is crucial that you return the fix plan in the following format, with one SEARCH/REPLACE block per change.
+    Each SEARCH section must copy a few complete lines of the current file exactly, so that it matches exactly one place:
+    SOURCE_FILE: <path>
+    EDITS:
+    <<<<<<< SEARCH
+    <exact lines of the current code>
+    =======
+    <replacement lines>
+    >>>>>>> REPLACE
+    
+    Only for new files, return the complete content instead:
     SOURCE_FILE: <path>
     FIXED_CODE:
     ```<language>
-    <complete updated source code>
+    <complete source code>
     ```
     """
 
-    response = agent_exec.invoke({"messages": [("user", prompt)]})
+CANDIDATE_PROMPT = """
+    This is candidate {candidate} of {candidates} fixes that are validated in parallel.
+    If more than one fix is plausible, propose one that differs from the most obvious one.
+    """
 
-    last_message = response["messages"][-1].content
+FULL_FILE_FALLBACK_PROMPT = """
+    Your edits could not be applied:
+    {conflicts}
     
-    return _parse_fix_response(last_message)
+    For each of these files return its COMPLETE updated content instead, in the following format:
+    SOURCE_FILE: <path>
+    FIXED_CODE:
+    ```<language>
+    <complete updated source code>
+    ```
+    """
+
+VALIDATION_PROMPT = """
+    Your fix was rejected before building, nothing has been applied and the files are unchanged:
+    {errors}
+    
+    Return a corrected fix for these files in the same format as before.
+    """
+
+def propose_fix_parallel(llm, repo_path: str, test_results: dict, use_cache: bool = True) -> dict[str, str]:
+    """
+    Synchronous entry point for the pipeline nodes, see propose_fix_async
+    """
+    return asyncio.run(propose_fix_async(llm, repo_path, test_results, use_cache))
+
+async def propose_fix_async(llm, repo_path: str, test_results: dict, use_cache: bool = True,
+                            limiter: RateLimiter | None = None, prompt_suffix: str = "") -> dict[str, str]:
+    """
+    Proposes fixes for all root causes of the failures concurrently, one request per cluster of errors
+    (see clustering.cluster_errors) or per failing test file when clustering is disabled.
+    LLM calls are bounded by the concurrency, requests per minute and tokens per minute limits of the
+    `llm` settings (or by a limiter shared with other proposals), retried with backoff when rate limited,
+    and each LLM call is given `timeout_seconds` (not counting the wait for those limits).
+    prompt_suffix is appended to the fix prompt.
+    """
+    repo_index = get_repo_index(repo_path)
+
+    if clustering_enabled():
+        grouped_results = cluster_errors(test_results)
+        if grouped_results:
+            print(f"{len(test_results['errors'])} failures clustered into {len(grouped_results)} root causes.")
+    else:
+        grouped_results = group_errors_by_file(test_results)
+
+    if not grouped_results:
+        print("No errors found, skipping fix proposal.")
+        return {}
+
+    all_fixes = {}
+    use_cache = use_cache and cache_enabled()
+    llm_settings = settings.get("llm", {})
+    limiter = limiter or create_limiter()
+
+    groups = list(grouped_results)
+    results = await asyncio.gather(*(
+        _traced_propose_fix(llm, repo_path, grouped_results[group], repo_index, limiter, use_cache, prompt_suffix)
+        for group in groups
+    ), return_exceptions=True)
+
+    failed = 0
+    # groups whose fixes changed each file, and the groups whose fixes of a shared file could not be merged
+    fixed_by = {}
+    conflicting = []
+    for group, result in zip(groups, results):
+        if isinstance(result, asyncio.TimeoutError):
+            print(f"Error processing {group}: timed out after {llm_settings.get('timeout_seconds')}s")
+            failed += 1
+        elif isinstance(result, Exception):
+            print(f"Error processing {group}: {result}")
+            failed += 1
+        elif result:
+            for file_path, code in result.items():
+                if file_path not in all_fixes:
+                    all_fixes[file_path] = code
+                    fixed_by[file_path] = [group]
+                    continue
+                try:
+                    all_fixes[file_path] = _merge_fix(repo_path, file_path, all_fixes[file_path], code)
+                except PatchConflictError:
+                    conflicting += [g for g in fixed_by[file_path] + [group] if g not in conflicting]
+                fixed_by[file_path].append(group)
+    if failed:
+        print(f"Fix proposal failed for {failed} of {len(groups)} error groups.")
+
+    if conflicting:
+        # the fixes overlap: one request for all of their errors replaces them
+        print(f"Fixes of {len(conflicting)} error groups conflict, asking for one fix covering all of them.")
+        errors = [error for group in conflicting for error in grouped_results[group]]
+        try:
+            merged = await _traced_propose_fix(llm, repo_path, errors, repo_index, limiter, use_cache, prompt_suffix)
+            all_fixes.update(merged)
+        except Exception as e:
+            print(f"Error processing the merged error groups: {e!r}")
+
+    return all_fixes
+
+def create_limiter() -> RateLimiter:
+    llm_settings = settings.get("llm", {})
+    return RateLimiter(
+        llm_settings.get("max_concurrency", 8),
+        llm_settings.get("requests_per_minute"),
+        llm_settings.get("tokens_per_minute")
+    )
+
+def set_max_llm_calls(max_calls: int | None) -> None:
+    """
+    Limits the LLM calls running at the same time across all pipelines of the process (e.g. in batch mode)
+    """
+    global _llm_slots
+    _llm_slots = threading.BoundedSemaphore(max_calls) if max_calls else None
+
+def _estimate_tokens(messages: list) -> int:
+    return sum(len(str(getattr(message, "content", message))) for message in messages) // 4
+
+def _llm_call_middleware(limiter: RateLimiter):
+    """
+    Agent middleware around every model call of an agent run (one per tool turn): waits for the request and
+    token budget of the limiter, times the call and settles the budget with the tokens the call reported
+    """
+    from langchain.agents.middleware import AgentMiddleware
+
+    class LLMCallMiddleware(AgentMiddleware):
+        async def awrap_model_call(self, request, handler):
+            estimated_tokens = _estimate_tokens([request.system_message, *request.messages]
+                                                if request.system_message else request.messages)
+            await limiter.wait_for_budget(estimated_tokens)
+            # only the call is timed: waiting for the limiter or its budget does not count against timeout_seconds
+            response = await asyncio.wait_for(handler(request), settings.get("llm", {}).get("timeout_seconds"))
+            replies = getattr(response, "result", [response])
+            usage = [getattr(message, "usage_metadata", None) or {} for message in replies]
+            if any(usage):
+                limiter.settle(estimated_tokens,
+                               sum(item.get("input_tokens", 0) + item.get("output_tokens", 0) for item in usage))
+            return response
+
+    return LLMCallMiddleware()
+
+async def _acquire_slot(slots: threading.BoundedSemaphore) -> None:
+    # polled instead of a blocking acquire in a worker thread, which would still take the slot
+    # after the waiting task is cancelled (e.g. by a timeout) and leak it
+    while not slots.acquire(blocking=False):
+        await asyncio.sleep(LLM_SLOT_POLL_SECONDS)
+
+async def _ainvoke(agent_exec, messages: list) -> dict:
+    slots = _llm_slots
+    if slots is None:
+        return await agent_exec.ainvoke({"messages": messages})
+    await _acquire_slot(slots)
+    try:
+        return await agent_exec.ainvoke({"messages": messages})
+    finally:
+        slots.release()
+
+async def _ainvoke_with_backoff(agent_exec, messages: list) -> dict:
+    # the rate limits are charged per model call, by the middleware of the agent (see _llm_call_middleware)
+    max_retries = settings.get("llm", {}).get("max_rate_limit_retries", 5)
+    for attempt in range(max_retries + 1):
+        try:
+            with span("llm_call", "llm", attempt=attempt) as trace:
+                response = await _ainvoke(agent_exec, messages)
+                _record_usage(trace, response["messages"][len(messages):])
+            return response
+        except Exception as exc:
+            if not is_rate_limit_error(exc) or attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt, exc)
+            print(f"Rate limited, retrying in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+def _record_usage(trace: dict, new_messages: list) -> None:
+    """
+    Adds the model calls and token usage of the messages produced by an agent run to the trace args
+    """
+    replies = [message for message in new_messages if getattr(message, "type", None) == "ai"]
+    usage = [message.usage_metadata or {} for message in replies]
+    trace["calls"] = len(replies)
+    trace["input_tokens"] = sum(item.get("input_tokens", 0) for item in usage)
+    trace["output_tokens"] = sum(item.get("output_tokens", 0) for item in usage)
+    fix_trace = _fix_trace.get()
+    if fix_trace is not None:
+        for key in ("calls", "input_tokens", "output_tokens"):
+            fix_trace[key] += trace[key]
+
+async def _validated_fixes(agent_exec, messages: list, repo_path: str, fixes: dict[str, str],
+                           repo_index: RepoIndex) -> dict[str, str]:
+    """
+    Re-prompts the agent with the validator errors until its fixes pass validation.
+    Files still rejected after max_reprompts attempts are dropped, so they never cost a build.
+    """
+    for attempt in range(max_reprompts() + 1):
+        with span("validate_fix", "validate", files=len(fixes), attempt=attempt) as trace:
+            errors = await asyncio.to_thread(validate_fixes, repo_path, fixes, repo_index)
+            trace["rejected"] = len(errors)
+        if not errors:
+            return fixes
+        if attempt == max_reprompts():
+            break
+        print(f"Fix rejected by validation for {', '.join(errors)}, asking again.")
+        followup = VALIDATION_PROMPT.format(errors="\n".join(f"{path}: {error}" for path, error in errors.items()))
+        response = await _ainvoke_with_backoff(agent_exec, messages + [("user", followup)])
+        messages = response["messages"]
+        retried, _ = _resolve_fixes(repo_path, _parse_fix_response(messages[-1].content))
+        fixes = {**fixes, **retried}
+
+    print(f"Dropping fixes that failed validation: {', '.join(errors)}.")
+    return {path: code for path, code in fixes.items() if path not in errors}
+
+async def _traced_propose_fix(llm, repo_path: str, errors: list[dict[str,str]], repo_index: RepoIndex,
+                              limiter: RateLimiter, use_cache: bool = True, prompt_suffix: str = "") -> dict[str, str]:
+    with span("propose_fix", "fix", file=errors[0]["file"], calls=0, input_tokens=0, output_tokens=0) as trace:
+        _fix_trace.set(trace)
+        return await _propose_fix(llm, repo_path, errors, repo_index, limiter, use_cache, prompt_suffix)
+
+async def _propose_fix(llm, repo_path: str, errors: list[dict[str,str]], repo_index: RepoIndex,
+                       limiter: RateLimiter, use_cache: bool = True, prompt_suffix: str = "") -> dict[str, str]:
+
+    key = cache_key(repo_path, errors, FIX_PROMPT + prompt_suffix, getattr(llm, "model_name", ""))
+    if use_cache:
+        cached = get_cached_fix(key, repo_path)
+        if cached is not None:
+            print(f"Reusing cached fix for {errors[0]['file']}.")
+            return cached
+
+    # LangChain is only imported once a fix is actually requested from the LLM
+    from langchain.agents import create_agent
+    from langchain_core.tools import tool
+
+    read_files = {}
+
+    @tool
+    def read_repo_file(relative_path: str) -> str:
+        """
+        Reads a file from the repo.
+        :param relative_path:
+        :return: content of the file
+        """
+        full_path = Path(repo_path) / relative_path
+        try:
+            content = full_path.read_text(encoding='utf-8')
+            read_files[relative_path] = content_hash(content)
+            return content
+        except Exception as e:
+            return f"Error reading file {full_path}: {str(e)}"
+
+    tools = [read_repo_file]
+    agent_exec = create_agent(llm, tools=tools, middleware=[_llm_call_middleware(limiter)])
+    relevant_paths = repo_index.relevant_paths(errors, settings.get("max_structure_paths", 200))
+    code_context, context_files = build_context_pack(
+        repo_path, errors, repo_index, settings.get("context_token_budget", 6000), relevant_paths
+    )
+    for file_path in context_files:
+        read_files[file_path] = content_hash((Path(repo_path) / file_path).read_text(encoding="utf-8"))
+    prompt = FIX_PROMPT.format(file_structure=repo_index.structure(relevant_paths), errors=errors,
+                               code_context=code_context or "(no source found for the failing tests)") + prompt_suffix
+
+    async with limiter:
+        print(f"Proposing a fix for {errors[0]['file']}.")
+        response = await _ainvoke_with_backoff(agent_exec, [("user", prompt)])
+
+        last_message = response["messages"][-1].content
+
+        fixes, conflicts = _resolve_fixes(repo_path, _parse_fix_response(last_message))
+        if conflicts:
+            print(f"Edits for {', '.join(conflicts)} could not be applied, asking for complete files.")
+            followup = FULL_FILE_FALLBACK_PROMPT.format(
+                conflicts="\n".join(f"{path}: {reason}" for path, reason in conflicts.items())
+            )
+            response = await _ainvoke_with_backoff(agent_exec, response["messages"] + [("user", followup)])
+            retried, _ = _resolve_fixes(repo_path, _parse_fix_response(response["messages"][-1].content))
+            fixes.update({path: code for path, code in retried.items() if path in conflicts})
+
+        if validation_enabled():
+            fixes = await _validated_fixes(agent_exec, response["messages"], repo_path, fixes, repo_index)
+
+    if fixes and use_cache:
+        store_fix(key, fixes, read_files)
+    return fixes
 
 
 def apply_fix(repo_path: str, fixes: dict[str, str], patch: int):
@@ -189,3 +487,5 @@ def apply_fix(repo_path: str, fixes: dict[str, str], patch: int):
         except Exception as e:
             print(f"Failed to apply fix to {file_path}: {e}")
 
+    get_repo_index(repo_path).invalidate(fixes)
+
@@ -1,17 +1,102 @@
+import hashlib
+import re
 import subprocess
+import threading
 from pathlib import Path
 
+from .settings import settings
+
 BASE_DIR = Path(__file__).resolve().parent.parent
+MIRRORS_DIR = BASE_DIR / "repos" / ".mirrors"
+COMMIT_PATTERN = re.compile(r"^[0-9a-f]{7,40}$")
+_target_lock = threading.Lock()
+_reserved_targets: set[Path] = set()
+_mirror_locks: dict[str, threading.Lock] = {}
+
+
+def _git(args: list[str], action: str) -> None:
+    try:
+        subprocess.run(["git", *args], check=True)
+    except subprocess.CalledProcessError as e:
+        raise Exception(f"git {action} failed with exit code {e.returncode}")
+
+
+def repo_key(repo_path: str) -> str:
+    """
+    Identifies the repo across runs: its origin URL (every run clones into a new directory) or its path
+    """
+    result = subprocess.run(["git", "config", "--get", "remote.origin.url"], cwd=repo_path,
+                            capture_output=True, text=True)
+    if result.returncode == 0 and result.stdout.strip():
+        return result.stdout.strip()
+    return str(Path(repo_path).resolve())
+
 
-def clone_repo(repo_url: str) -> str:
+def _mirror_lock(repo_url: str) -> threading.Lock:
+    with _target_lock:
+        return _mirror_locks.setdefault(repo_url, threading.Lock())
+
+
+def update_mirror(repo_url: str) -> Path:
+    """
+    Bare mirror of the repo shared by all runs: cloned once with `git clone --mirror`, then only fetched.
+    It is never garbage collected, since the checkouts of earlier runs (kept for --resume) borrow its objects,
+    including those no longer reachable after a fetch --prune.
+    """
+    repo_name = repo_url.rstrip("/").split("/")[-1]
+    mirror = MIRRORS_DIR / f"{repo_name}-{hashlib.sha256(repo_url.encode()).hexdigest()[:8]}"
+    with _mirror_lock(repo_url):
+        if (mirror / "HEAD").exists():
+            print(f"Fetching {repo_url} into the mirror cache.")
+            _git(["-C", str(mirror), "fetch", "--prune", "origin"], "fetch")
+        else:
+            MIRRORS_DIR.mkdir(parents=True, exist_ok=True)
+            _git(["clone", "--mirror", repo_url, str(mirror)], "clone --mirror")
+        _git(["-C", str(mirror), "config", "gc.auto", "0"], "config")
+        _git(["-C", str(mirror), "config", "gc.pruneExpire", "never"], "config")
+    return mirror
+
+
+def clone_repo(repo_url: str, ref: str | None = None) -> str:
+    """
+    Checks out the repo into a new repos/<name>_<n> directory. With the mirror cache enabled the checkout
+    borrows the objects of the local mirror (`--reference`), so only the working tree is written per run.
+    ref selects a branch, tag or commit; clone.depth and clone.filter in the settings make partial clones.
+    """
+    clone_settings = settings.get("clone", {})
     repos_dir = BASE_DIR / "repos"
     repos_dir.mkdir(exist_ok=True)
     repo_name = repo_url.split("/")[-1]
     counter = 1
-    while True:
-        target_dir = repos_dir / f"{repo_name[:-4]}_{counter}"
-        if not target_dir.exists():
-            break
-        counter += 1
-    subprocess.run(["git", "clone", repo_url, str(target_dir)])
-    return str(target_dir)
\ No newline at end of file
+    # concurrent pipelines (batch mode) must not pick the same target directory
+    with _target_lock:
+        while True:
+            target_dir = repos_dir / f"{repo_name[:-4]}_{counter}"
+            if not target_dir.exists() and target_dir not in _reserved_targets:
+                break
+            counter += 1
+        _reserved_targets.add(target_dir)
+
+    is_commit = ref is not None and COMMIT_PATTERN.match(ref) is not None
+    mirror_cache = clone_settings.get("mirror_cache", True)
+    # without the mirror, a commit outside the shallow history is fetched by its hash, which needs all of it
+    if is_commit and clone_settings.get("depth") and not mirror_cache and len(ref) != 40:
+        raise Exception(f"Checking out {ref} from a shallow clone without the mirror cache needs the full commit hash.")
+
+    command = ["clone"]
+    if mirror_cache:
+        command += ["--reference", str(update_mirror(repo_url))]
+    if clone_settings.get("depth"):
+        command += ["--depth", str(clone_settings["depth"])]
+    if clone_settings.get("filter"):
+        command += [f"--filter={clone_settings['filter']}"]
+    if ref and not is_commit:
+        command += ["--branch", ref]
+    _git([*command, repo_url, str(target_dir)], "clone")
+    if is_commit:
+        # the commit may be outside a shallow history: the mirror referenced by the clone has it, otherwise
+        # it is fetched
+        if clone_settings.get("depth") and not mirror_cache:
+            _git(["-C", str(target_dir), "fetch", "--depth", str(clone_settings["depth"]), "origin", ref], "fetch")
+        _git(["-C", str(target_dir), "checkout", "--detach", ref], "checkout")
+    return str(target_dir)
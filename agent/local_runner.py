@@ -0,0 +1,48 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+from .backends import ExecutionBackend
+from .docker_runner import _cpp_settings, _docker_job, _is_cpp, _repo_key, _step_timeout, _stream_command, log_path
+from .git_ops import BASE_DIR
+from .tracing import span
+
+LOCAL_IMAGE = "local"
+DEFAULT_BUILDS_DIR = BASE_DIR / "repos" / ".builds"
+
+
+class LocalBackend(ExecutionBackend):
+    """
+    Runs the steps as plain bash subprocesses in the repo directory, with the tools and packages of the
+    current environment. For hosts without Docker and for tests; nothing is isolated.
+    """
+
+    def prepare(self, repo_path: str) -> str:
+        return LOCAL_IMAGE
+
+    def image_available(self, repo_path: str, image: str) -> bool:
+        if image != LOCAL_IMAGE:
+            return False
+        # the default build dir is removed when the pipeline of the repo ends, see stop
+        if _is_cpp(repo_path) and not _cpp_settings().get("build_dir"):
+            return Path(self.default_build_dir(repo_path)).is_dir()
+        return True
+
+    def workspace(self, repo_path: str) -> str:
+        return str(Path(repo_path).resolve())
+
+    def default_build_dir(self, repo_path: str) -> str:
+        # out of the tree, so build outputs never show up in the repo index or the sandboxes
+        return str(DEFAULT_BUILDS_DIR / f"{Path(repo_path).name}-{_repo_key(repo_path)}")
+
+    def run(self, repo_path: str, image: str, script: str, phase: str = "exec", log_name: str | None = None,
+            outputs: tuple[str, ...] = (), **trace_args) -> subprocess.CompletedProcess:
+        with _docker_job(), span(f"local_{phase}", "docker", phase=phase, host="subprocess", **trace_args) as trace:
+            result = _stream_command(["bash", "-c", script], log_path(repo_path, log_name or phase),
+                                     _step_timeout(phase), cwd=repo_path)
+            trace["exit_code"] = result.returncode
+            return result
+
+    def stop(self, repo_path: str) -> None:
+        # every run checks out into a new path, so its build dir is never used again
+        shutil.rmtree(self.default_build_dir(repo_path), ignore_errors=True)
@@ -1,47 +1,161 @@
 import xml.etree.ElementTree as ET
 import re
-from typing import Any
+from typing import Any, Iterator
 from pathlib import Path
 
-def parse_test_logs(repo_path: str) -> dict[str, Any]:
-    # Standard location for the report
+from .settings import settings
+
+# path:line: as printed in tracebacks; the lookbehind only lets matches start at a path boundary,
+# which keeps the search linear on huge captured outputs
+FILE_LINE_PATTERN = re.compile(r"(?<![\w/.-])([\w/.-]+\.\w+):(\d+):")
+
+def _test_id(repo_path: str, classname: str, test_name: str) -> str:
+    """
+    Turns a JUnit classname (e.g. tests.test_calc.TestAdd) into a pytest node id
+    (tests/test_calc.py::TestAdd::test_name) when the module can be found in the repo.
+    Falls back to classname::test_name (e.g. for CTest reports).
+    """
+    parts = classname.split(".") if classname else []
+    for i in range(len(parts), 0, -1):
+        module_path = "/".join(parts[:i]) + ".py"
+        if (Path(repo_path) / module_path).is_file():
+            return "::".join([module_path, *parts[i:], test_name])
+    return f"{classname}::{test_name}"
+
+
+def merge_reports(repo_path: str, partial_report: str) -> None:
+    """
+    Merges the test cases of a partial JUnit report (e.g. from a targeted rerun) into report.xml,
+    replacing the previous results of the same tests.
+    """
     report_path = Path(repo_path) / "report.xml"
-    
+    partial_path = Path(repo_path) / partial_report
+    if not partial_path.exists():
+        print(f"Warning: Partial test report not found at {partial_path}")
+        return
     if not report_path.exists():
-        print(f"Warning: Test report not found at {report_path}")
-        return {
-            "failing_tests": [],
-            "error_types": set(),
-            "suspected_files": set(),
-            "errors": []
-        }
+        partial_path.replace(report_path)
+        return
 
     tree = ET.parse(report_path)
-    root = tree.getroot()
+    suites = list(tree.getroot().iter("testsuite")) or [tree.getroot()]
+    fresh = {(tc.get("classname", ""), tc.get("name")): tc for tc in ET.parse(partial_path).getroot().iter("testcase")}
 
-    errors = []
-    failing_tests = []
-    error_types = set()
-    suspected_files = set()
+    for suite in suites:
+        for i, testcase in enumerate(list(suite)):
+            key = (testcase.get("classname", ""), testcase.get("name"))
+            if testcase.tag == "testcase" and key in fresh:
+                suite.remove(testcase)
+                suite.insert(i, fresh.pop(key))
+    for testcase in fresh.values():
+        suites[0].append(testcase)
+
+    tree.write(report_path, encoding="utf-8", xml_declaration=True)
+    partial_path.unlink()
+
+
+def combine_reports(repo_path: str, partial_reports: list[str]) -> list[str]:
+    """
+    Combines the test suites of several JUnit reports (e.g. one per shard) into report.xml.
+    A missing report is recorded as an error, since its tests never ran; the missing reports are returned.
+    """
+    root = ET.Element("testsuites")
+    missing = []
+    for partial_report in partial_reports:
+        partial_path = Path(repo_path) / partial_report
+        if not partial_path.exists():
+            print(f"Warning: Partial test report not found at {partial_path}")
+            missing.append(partial_report)
+            suite = ET.SubElement(root, "testsuite", name=partial_path.stem, tests="1", errors="1")
+            testcase = ET.SubElement(suite, "testcase", classname=partial_path.stem, name="report")
+            ET.SubElement(testcase, "error", type="MissingReport").text = \
+                f"{partial_report} was not written: the test run crashed or did not start, see its log"
+            continue
+        partial_root = ET.parse(partial_path).getroot()
+        root.extend(partial_root.iter("testsuite") if partial_root.tag == "testsuites" else [partial_root])
+        partial_path.unlink()
+
+    ET.ElementTree(root).write(Path(repo_path) / "report.xml", encoding="utf-8", xml_declaration=True)
+    return missing
+
+
+def parse_test_durations(repo_path: str) -> dict[str, float]:
+    """
+    Returns the duration in seconds of every test in report.xml, keyed by test id
+    """
+    report_path = Path(repo_path) / "report.xml"
+    if not report_path.exists():
+        return {}
+
+    durations = {}
+    for testcase in ET.parse(report_path).getroot().iter("testcase"):
+        test_id = _test_id(repo_path, testcase.get("classname", ""), testcase.get("name"))
+        durations[test_id] = float(testcase.get("time") or 0)
+    return durations
+
+
+def parse_test_outcomes(repo_path: str) -> dict[str, bool]:
+    """
+    Returns whether every test of report.xml passed, keyed by test id. Skipped tests are left out.
+    """
+    report_path = Path(repo_path) / "report.xml"
+    if not report_path.exists():
+        return {}
 
-    for testcase in root.iter('testcase'):
-        issue = testcase.find('failure')
+    outcomes = {}
+    for _, element in ET.iterparse(report_path):
+        if element.tag != "testcase":
+            continue
+        if element.find("skipped") is None:
+            test_id = _test_id(repo_path, element.get("classname", ""), element.get("name"))
+            outcomes[test_id] = element.find("failure") is None and element.find("error") is None
+        element.clear()
+    return outcomes
+
+
+def _truncate(message: str, limit: int | None) -> str:
+    """
+    Keeps the beginning and the end of an oversized message, where the test and the raised error are reported
+    """
+    if not limit or len(message) <= limit:
+        return message
+    half = limit // 2
+    return f"{message[:half]}\n... [{len(message) - 2 * half} characters truncated] ...\n{message[-half:]}"
+
+
+def iter_test_errors(repo_path: str, max_message_chars: int | None = None) -> Iterator[dict[str, Any]]:
+    """
+    Streams the failed test cases of report.xml as error dicts.
+    Processed elements are discarded right away, so memory stays bounded for very large reports,
+    and messages longer than max_message_chars are truncated.
+    """
+    report_path = Path(repo_path) / "report.xml"
+    parents = []
+
+    for event, elem in ET.iterparse(report_path, events=("start", "end")):
+        if event == "start":
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag != "testcase":
+            continue
+
+        issue = elem.find('failure')
         if issue is None:
-            issue = testcase.find('error')
+            issue = elem.find('error')
 
         if issue is not None:
-            test_name = testcase.get('name')
-            classname = testcase.get('classname', '')
-            failing_tests.append(f"{classname}::{test_name}")
-            
+            test_name = elem.get('name')
+            classname = elem.get('classname', '')
+
             error_message = issue.text or issue.get('message', "unknown error")
             error_type = issue.get('type', "Failure")
 
-            file_path = testcase.get('file') or issue.get('file')
-            line_num_str = testcase.get('line') or issue.get('line')
-            
+            file_path = elem.get('file') or issue.get('file')
+            line_num_str = elem.get('line') or issue.get('line')
+
             if not file_path:
-                match = re.search(r"([\w/.-]+\.\w+):(\d+):", error_message)
+                match = FILE_LINE_PATTERN.search(error_message)
                 if match:
                     file_path = match.group(1)
                     line_num = int(match.group(2))
@@ -51,14 +165,43 @@ def parse_test_logs(repo_path: str) -> dict[str, Any]:
             else:
                 line_num = int(line_num_str) if line_num_str else 0
 
-            errors.append({
+            yield {
+                "test": _test_id(repo_path, classname, test_name),
                 "type": error_type,
-                "message": error_message.strip(),
+                "message": _truncate(error_message.strip(), max_message_chars),
                 "file": file_path,
                 "line": line_num
-            })
-            error_types.add(error_type)
-            suspected_files.add(file_path)
+            }
+
+        elem.clear()
+        if parents:
+            parents[-1].remove(elem)
+
+
+def parse_test_logs(repo_path: str, max_message_chars: int | None = None) -> dict[str, Any]:
+    # Standard location for the report
+    report_path = Path(repo_path) / "report.xml"
+    max_message_chars = max_message_chars or settings.get("max_error_message_chars")
+
+    if not report_path.exists():
+        print(f"Warning: Test report not found at {report_path}")
+        return {
+            "failing_tests": [],
+            "error_types": set(),
+            "suspected_files": set(),
+            "errors": []
+        }
+
+    errors = []
+    failing_tests = []
+    error_types = set()
+    suspected_files = set()
+
+    for error in iter_test_errors(repo_path, max_message_chars):
+        errors.append(error)
+        failing_tests.append(error["test"])
+        error_types.add(error["type"])
+        suspected_files.add(error["file"])
 
     return {
         "failing_tests": failing_tests,
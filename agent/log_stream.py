@@ -0,0 +1,103 @@
+import os
+import signal
+import subprocess
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Callable
+
+TIMEOUT_EXIT_CODE = 124
+# longer lines are split, so a single huge line never has to fit in memory
+MAX_LINE_CHARS = 64 * 1024
+
+
+class RotatingLog:
+    """
+    Append-only log file, rotated to <name>.1 ... <name>.<backups> once it grows over max_bytes
+    """
+
+    def __init__(self, path: Path, max_bytes: int, backups: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._size = path.stat().st_size
+
+    def write(self, text: str) -> None:
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            if self._size and self._size + size > self.max_bytes:
+                self._rotate()
+            self._file.write(text)
+            self._size += size
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{i}")
+            if older.exists():
+                older.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backups:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def stream_command(cmd: list[str], log: RotatingLog, timeout: float | None = None, tail_lines: int = 200,
+                   label: str | None = None, on_timeout: Callable[[], None] | None = None,
+                   cwd: str | Path | None = None) -> subprocess.CompletedProcess:
+    """
+    Runs a command, writing its output line by line to the log (and to the console prefixed by label)
+    while keeping only the last tail_lines lines of stdout and stderr in memory.
+    After timeout seconds on_timeout is called (e.g. to remove a hung container), the process is killed
+    and the exit code is TIMEOUT_EXIT_CODE.
+    """
+    # own process group, so a timeout also kills the children still holding the output pipes
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                               errors="replace", cwd=cwd, start_new_session=True)
+    tails = {"stdout": deque(maxlen=tail_lines), "stderr": deque(maxlen=tail_lines)}
+
+    def pump(stream, tail: deque) -> None:
+        for line in iter(lambda: stream.readline(MAX_LINE_CHARS), ""):
+            tail.append(line)
+            log.write(line)
+            if label is not None:
+                print(f"[{label}] {line.rstrip()}")
+        stream.close()
+
+    readers = [
+        threading.Thread(target=pump, args=(process.stdout, tails["stdout"]), daemon=True),
+        threading.Thread(target=pump, args=(process.stderr, tails["stderr"]), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    timed_out = False
+    try:
+        returncode = process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        if on_timeout is not None:
+            on_timeout()
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.wait()
+        returncode = TIMEOUT_EXIT_CODE
+    for reader in readers:
+        reader.join()
+
+    if timed_out:
+        message = f"Timed out after {timeout}s, the step was killed.\n"
+        tails["stderr"].append(message)
+        log.write(message)
+    return subprocess.CompletedProcess(cmd, returncode, "".join(tails["stdout"]), "".join(tails["stderr"]))
@@ -0,0 +1,89 @@
+import re
+
+EDIT_BLOCK_PATTERN = re.compile(
+    r"^[ \t]*<<<<<<< SEARCH\n(.*?)^[ \t]*=======\n(.*?)^[ \t]*>>>>>>> REPLACE", re.DOTALL | re.MULTILINE
+)
+
+
+class PatchConflictError(Exception):
+    pass
+
+
+def parse_edit_blocks(text: str) -> list[tuple[str, str]]:
+    """
+    Extracts the (search, replace) pairs of SEARCH/REPLACE blocks
+    """
+    return [(search, replace) for search, replace in EDIT_BLOCK_PATTERN.findall(text)]
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _indent_shift(file_line: str, search_line: str) -> tuple[str, int] | None:
+    """
+    The indentation to add to (or the number of characters to strip from) a search line to get the file line
+    """
+    file_indent, search_indent = _indent(file_line), _indent(search_line)
+    if file_indent.endswith(search_indent):
+        return file_indent[:len(file_indent) - len(search_indent)], 0
+    if search_indent.endswith(file_indent):
+        return "", len(search_indent) - len(file_indent)
+    return None
+
+
+def _find_fuzzy(lines: list[str], search: list[str]) -> list[tuple[int, tuple[str, int]]]:
+    """
+    Finds the line ranges matching `search` when trailing whitespace is ignored and the whole block
+    may be shifted by a consistent indentation. Returns (start line, indentation shift) per match.
+    """
+    matches = []
+    for start in range(len(lines) - len(search) + 1):
+        window = lines[start:start + len(search)]
+        if any(a.strip() != b.strip() for a, b in zip(window, search)):
+            continue
+        shifts = {_indent_shift(a, b) for a, b in zip(window, search) if a.strip()}
+        if len(shifts) == 1 and None not in shifts:
+            matches.append((start, shifts.pop()))
+    return matches
+
+
+def _shift_line(line: str, shift: tuple[str, int]) -> str:
+    if not line.strip():
+        return line
+    add, remove = shift
+    return add + line[min(remove, len(_indent(line))):]
+
+
+def apply_edit_blocks(original: str, blocks: list[tuple[str, str]]) -> str:
+    """
+    Applies SEARCH/REPLACE blocks in order. A block must match exactly once, either verbatim or,
+    failing that, ignoring trailing whitespace and a consistent indentation shift (which is then applied
+    to the replacement too). Missing or ambiguous matches raise PatchConflictError.
+    """
+    content = original
+    for i, (search, replace) in enumerate(blocks, start=1):
+        if not search.strip():
+            if content.strip():
+                raise PatchConflictError(f"edit {i} has an empty SEARCH section but the file is not empty")
+            content = replace
+            continue
+
+        occurrences = content.count(search)
+        if occurrences == 1:
+            content = content.replace(search, replace)
+            continue
+        if occurrences > 1:
+            raise PatchConflictError(f"edit {i} matches {occurrences} places in the file")
+
+        lines = content.splitlines(keepends=True)
+        search_lines = search.splitlines(keepends=True)
+        matches = _find_fuzzy(lines, search_lines)
+        if len(matches) != 1:
+            reason = "does not match" if not matches else f"matches {len(matches)} places in"
+            raise PatchConflictError(f"edit {i} {reason} the file")
+
+        start, shift = matches[0]
+        replacement = [_shift_line(line, shift) for line in replace.splitlines(keepends=True)]
+        content = "".join(lines[:start] + replacement + lines[start + len(search_lines):])
+    return content
@@ -1,27 +1,38 @@
-from typing import TypedDict, List, Dict, Any, Set
-from langgraph.graph import StateGraph, START, END
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
+import functools
+from pathlib import Path
+from typing import TypedDict, List, Dict, Any
 
+from .backends import get_backend
 from .git_ops import clone_repo
-from .docker_runner import build_image, run_tests
-from .log_parser import parse_test_logs
+from .checkpoint import get_step_result, store_step_result
+from .config import AgentConfig
+from .docker_runner import build_image, run_tests, dependency_image
+from .log_parser import parse_test_logs, parse_test_outcomes
 from .retry import retry_policy, patch_retry_policy
 from .fixer import propose_fix_parallel, apply_fix
-
-load_dotenv()
-llm = ChatOpenAI(model="gpt-5.1")
+from .repo_index import drop_repo_index, get_repo_index
+from .settings import settings
+from .speculative import candidate_count, propose_speculative_fix
+from .test_history import classify_failures, record_outcomes
+from .test_impact import select_impacted_tests
+from .tracing import span, traced_node
 
 class AgentState(TypedDict):
     repo_url: str
+    repo_ref: str
     repo_path: str
     build_logs: Dict[str, Any]
     test_logs: str
     failing_tests: List[str]
-    error_types: Set[str]
-    suspected_files: Set[str]
+    error_types: List[str]
+    suspected_files: List[str]
     test_results: Dict[str, Any]
     proposed_fixes: Dict[str, str]
+    rerun_tests: List[str]
+    flaky_tests: List[str]
+    deterministic_tests: List[str]
+    changed_files: List[str]
+    selective_run: bool
     patch: int
     retries: int
 
@@ -34,23 +45,42 @@ def _clone_repo_node(state: AgentState) -> AgentState:
             **state,
         }
 
-    repo_path = clone_repo(state["repo_url"])
+    repo_path = clone_repo(state["repo_url"], state.get("repo_ref"))
     return {
         **state,
         "repo_path": repo_path
     }
 
+MAX_CACHED_REPORT_BYTES = 5 * 1024 * 1024
+
+def _tree_key(repo_path: str) -> str:
+    """
+    Identifies the repo content and the dependency image it is built and tested with
+    """
+    return f"{get_repo_index(repo_path).tree_hash()}:{dependency_image(repo_path)}"
+
 def _build_node(state: AgentState) -> AgentState:
     """
     Node for compiling and building the repo
     """
-    result = build_image(state["repo_path"])
-    print(f"Built image with code {result.get('exit_code', 1)}")
-    if result.get("exit_code", 1) != 0:
-        print(result.get("stderr", "No build logs found."))
+    # build outputs are kept per repo path (checkout or build volume), so a build is only reusable for the same path
+    build_key = f"{_tree_key(state['repo_path'])}:{Path(state['repo_path']).resolve()}"
+    cached = get_step_result(build_key, "build")
+    if cached is not None and get_backend().image_available(state["repo_path"], cached["image"]):
+        print("Reusing the build of an unchanged tree.")
+        result = cached
+    else:
+        result = build_image(state["repo_path"])
+        print(f"Built image with code {result.get('exit_code', 1)}")
+        if result.get("exit_code", 1) != 0:
+            print(result.get("stderr", "No build logs found."))
+            print(f"Full build log: {result.get('log_path')}")
+        else:
+            store_step_result(build_key, "build", {**result, "stdout": result["stdout"][-10000:]})
     return {
         **state,
-        "build_logs": result
+        "build_logs": result,
+        "rerun_tests": []
     }
 
 def _run_tests_node(state: AgentState) -> AgentState:
@@ -63,17 +93,70 @@ def _run_tests_node(state: AgentState) -> AgentState:
     is_python = build_logs.get("python_detected", False)
     is_cpp = build_logs.get("cpp_detected", False)
 
-    result = run_tests(state["repo_path"], is_python, is_cpp)
+    rerun_tests = state.get("rerun_tests") or None
+    selective_run = state.get("selective_run", False)
+    if rerun_tests:
+        print(f"Rerunning {len(rerun_tests)} failing tests.")
+    elif is_python and state.get("changed_files") and not _full_run_due(state):
+        rerun_tests = _impacted_tests(state)
+        selective_run = bool(rerun_tests)
+        if selective_run:
+            print(f"Running {len(rerun_tests)} tests impacted by the last patch.")
+    else:
+        selective_run = False
+
+    full_run = not rerun_tests
+    tree_key = _tree_key(state["repo_path"]) if full_run else None
+    cached = get_step_result(tree_key, "tests") if full_run else None
+    if cached is not None:
+        print("Reusing the test results of an unchanged tree.")
+        (Path(state["repo_path"]) / "report.xml").write_text(cached["report"], encoding="utf-8")
+        result = {"stdout": cached["stdout"], "stderr": cached["stderr"]}
+    else:
+        result = run_tests(state["repo_path"], is_python, is_cpp, build_logs.get("image"), rerun_tests)
+        report_path = Path(state["repo_path"]) / "report.xml"
+        # a failed rerun is not merged into report.xml, which then only holds outdated outcomes
+        outcomes = parse_test_outcomes(state["repo_path"]) if full_run or result["exit_code"] == 0 else None
+        # the test steps exit with 0 whatever the tests do: only a report without failures is a passing run
+        if full_run and result["exit_code"] == 0 and report_path.exists() and all(outcomes.values()) \
+                and report_path.stat().st_size <= MAX_CACHED_REPORT_BYTES:
+            store_step_result(tree_key, "tests", {
+                "report": report_path.read_text(encoding="utf-8"),
+                "stdout": result["stdout"][-10000:],
+                "stderr": result["stderr"][-10000:],
+            })
+        if outcomes is not None:
+            if rerun_tests:
+                rerun = set(rerun_tests)
+                outcomes = {test: passed for test, passed in outcomes.items() if test in rerun}
+            record_outcomes(state["repo_path"], get_repo_index(state["repo_path"]).tree_hash(), outcomes)
 
     retries = 0 if state.get("retries") is None else state["retries"] + 1
     return {
         **state,
         "test_logs": result["stdout"] + "\n" + result["stderr"],
         "retries": retries,
+        "selective_run": selective_run,
     }
 
+def _full_run_due(state: AgentState) -> bool:
+    every = settings.get("full_test_run_every", 0)
+    return bool(every) and state.get("patch", 0) % every == 0
+
+def _impacted_tests(state: AgentState) -> List[str] | None:
+    """
+    Tests affected by the files changed in the last patch plus the previously failing ones,
+    or None if the full suite has to run
+    """
+    impacted = select_impacted_tests(state["repo_path"], state["changed_files"])
+    if impacted is None:
+        return None
+    previously_failing = [test for test in state.get("failing_tests", []) if test.split("::")[0] not in impacted]
+    return impacted + previously_failing
+
 def _analyze_test_logs_node(state: AgentState) -> AgentState:
-    parsed_tests = parse_test_logs(state["repo_path"])
+    with span("parse_report", "parse"):
+        parsed_tests = parse_test_logs(state["repo_path"])
 
     test_results = {
         "stage": "tests",
@@ -82,17 +165,28 @@ def _analyze_test_logs_node(state: AgentState) -> AgentState:
         "errors": parsed_tests["errors"],
     }
     print(f"Analyzed test logs. Status = {test_results['status']}, Errors = {len(test_results['errors'])}.")
+    flaky, deterministic = classify_failures(
+        state["repo_path"], get_repo_index(state["repo_path"]).tree_hash(), parsed_tests["failing_tests"]
+    )
+    if flaky:
+        print(f"{len(flaky)} failing tests are known to be flaky.")
 
     return {
         **state,
         "failing_tests": parsed_tests["failing_tests"],
-        "error_types": parsed_tests["error_types"],
-        "suspected_files": parsed_tests["suspected_files"],
-        "test_results": test_results
+        # sets are stored as sorted lists to keep the state serializable for checkpoints
+        "error_types": sorted(parsed_tests["error_types"]),
+        "suspected_files": sorted(parsed_tests["suspected_files"]),
+        "test_results": test_results,
+        "rerun_tests": parsed_tests["failing_tests"],
+        "flaky_tests": flaky,
+        "deterministic_tests": deterministic,
+        # a passing selective run is confirmed by a full run before the pipeline ends
+        "changed_files": [] if test_results["status"] == "success" else state.get("changed_files", [])
     }
 
 
-def _propose_fix_node(state: AgentState) -> AgentState:
+def _propose_fix_node(state: AgentState, agent_config: AgentConfig) -> AgentState:
     """
     Node for proposing or generating a fix using LLM
     """
@@ -100,7 +194,14 @@ def _propose_fix_node(state: AgentState) -> AgentState:
         print("No failing tests found, skipping fix proposal.")
         return state
 
-    fixes = propose_fix_parallel(llm, state["repo_path"], state["test_results"])
+    # failures of flaky tests are not bugs to fix
+    flaky = set(state.get("flaky_tests", []))
+    test_results = {**state["test_results"],
+                    "errors": [error for error in state["test_results"]["errors"] if error.get("test") not in flaky]}
+    if candidate_count() > 1:
+        fixes = propose_speculative_fix(agent_config.llm, state["repo_path"], test_results, state["patch"] + 1)
+    else:
+        fixes = propose_fix_parallel(agent_config.llm, state["repo_path"], test_results)
     print(f"Proposed {len(fixes)} fixes.")
     return {
         **state,
@@ -115,15 +216,31 @@ def _apply_patch_node(state: AgentState) -> AgentState:
         print("No proposed fixes found, skipping patch application.")
         return state
     apply_fix(state["repo_path"], proposed_fixes, state["patch"])
-    return state
+    return {
+        **state,
+        "changed_files": list(proposed_fixes)
+    }
+
 
+def _cleanup_node(state: AgentState) -> AgentState:
+    """
+    Node that tears down the worker (container) and the file index of the repo
+    """
+    if state.get("repo_path"):
+        get_backend().stop(state["repo_path"])
+        drop_repo_index(state["repo_path"])
+    return state
 
 
 def _check_retries(state: AgentState) -> str:
     if state["test_results"]["status"] == "success":
+        if state.get("selective_run"):
+            print("Impacted tests passed, confirming with a full test run.")
+            return "confirm"
         print("All tests passed! Ending pipeline...")
         return "end"
-    if retry_policy(state["retries"], state["error_types"]):
+    if retry_policy(state["retries"], state["error_types"], state["failing_tests"],
+                    state.get("flaky_tests"), state.get("deterministic_tests")):
         return "retry"
     else:
         return "abort"
@@ -151,14 +268,23 @@ def _check_build_failed(state: AgentState) -> str:
     build_logs = state.get("build_logs", {})
     return "abort" if build_logs.get("exit_code", 1) != 0 else "continue"
 
-def create_graph():
+def create_graph(checkpointer=None, config: AgentConfig | None = None):
+    """
+    Builds the pipeline graph. With a checkpointer (see checkpoint.create_checkpointer) the state is persisted
+    after every node, so a run invoked with the same thread_id can be resumed from the last completed node.
+    The config provides the LLM, created on first use (AgentConfig() with the default model if not given).
+    """
+    from langgraph.graph import StateGraph, START, END
+
+    config = config or AgentConfig()
     graph = StateGraph(state_schema=AgentState)
-    graph.add_node("CloneRepoNode", _clone_repo_node)
-    graph.add_node("BuildNode", _build_node)
-    graph.add_node("RunTestsNode", _run_tests_node)
-    graph.add_node("AnalyzeTestLogsNode", _analyze_test_logs_node)
-    graph.add_node("ProposeFixNode", _propose_fix_node)
-    graph.add_node("ApplyPatchNode", _apply_patch_node)
+    graph.add_node("CloneRepoNode", traced_node("CloneRepoNode", _clone_repo_node))
+    graph.add_node("BuildNode", traced_node("BuildNode", _build_node))
+    graph.add_node("RunTestsNode", traced_node("RunTestsNode", _run_tests_node))
+    graph.add_node("AnalyzeTestLogsNode", traced_node("AnalyzeTestLogsNode", _analyze_test_logs_node))
+    graph.add_node("ProposeFixNode", traced_node("ProposeFixNode", functools.partial(_propose_fix_node, agent_config=config)))
+    graph.add_node("ApplyPatchNode", traced_node("ApplyPatchNode", _apply_patch_node))
+    graph.add_node("CleanupNode", traced_node("CleanupNode", _cleanup_node))
     graph.add_conditional_edges(
         START,
         _check_repo_cloned,
@@ -174,7 +300,7 @@ def create_graph():
         _check_build_failed,
         {
             "continue": "RunTestsNode",
-            "abort": END
+            "abort": "CleanupNode"
         }
     )
     graph.add_edge("RunTestsNode", "AnalyzeTestLogsNode")
@@ -183,8 +309,9 @@ def create_graph():
         _check_retries,
         {
             "retry": "RunTestsNode",
+            "confirm": "RunTestsNode",
             "abort": "ProposeFixNode",
-            "end" : END
+            "end" : "CleanupNode"
         }
     )
     graph.add_edge("ProposeFixNode", "ApplyPatchNode")
@@ -193,8 +320,9 @@ def create_graph():
         _check_patch_retries,
         {
             "retry": "BuildNode",
-            "abort": END
+            "abort": "CleanupNode"
         }
     )
+    graph.add_edge("CleanupNode", END)
 
-    return graph.compile()
+    return graph.compile(checkpointer=checkpointer)
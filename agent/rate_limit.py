@@ -0,0 +1,86 @@
+import asyncio
+import random
+import time
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at `per_minute` tokens per minute.
+    Requests larger than the capacity are let through once the bucket is full, so they can not block forever.
+    """
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def charge(self, amount: float) -> None:
+        """
+        Takes (or with a negative amount gives back) tokens without waiting; the bucket may go into debt
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RateLimiter:
+    """
+    Limits LLM calls by concurrency, requests per minute and tokens per minute. The tokens of a model call are
+    estimated from its prompt before the call and settled with its reported usage after it.
+    """
+
+    def __init__(self, max_concurrency: int, requests_per_minute: float | None = None,
+                 tokens_per_minute: float | None = None):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+
+    async def wait_for_budget(self, estimated_tokens: int) -> None:
+        if self._requests:
+            await self._requests.acquire(1)
+        if self._tokens:
+            await self._tokens.acquire(estimated_tokens)
+
+    def settle(self, estimated_tokens: int, used_tokens: int) -> None:
+        if self._tokens:
+            self._tokens.charge(used_tokens - min(estimated_tokens, self._tokens.capacity))
+
+
+def is_rate_limit_error(exc: Exception) -> bool:
+    return getattr(exc, "status_code", None) == 429 or type(exc).__name__ == "RateLimitError"
+
+
+def backoff_delay(attempt: int, exc: Exception | None = None, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Exponential backoff with jitter, honoring a Retry-After header when the error carries one
+    """
+    response = getattr(exc, "response", None)
+    retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        if retry_after:
+            return min(cap, float(retry_after))
+    except ValueError:
+        pass
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)
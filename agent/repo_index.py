@@ -0,0 +1,140 @@
+import hashlib
+import os
+import re
+import subprocess
+import threading
+from pathlib import Path
+
+SOURCE_SUFFIXES = (".py", ".cpp", ".h", ".c")
+# files written by the pipeline itself, which must not change the tree hash
+GENERATED_FILES = ("report.xml", "rerun.xml", "report_shard_")
+GENERATED_DIRS = ("build/", "changes/", ".ci_shards/")
+SKIPPED_DIRS = {".git", "__pycache__", ".venv", "venv", "build", "node_modules", ".tox", ".pytest_cache", "changes"}
+
+_indexes: dict[str, "RepoIndex"] = {}
+_indexes_lock = threading.Lock()
+
+
+def _tokens(path: str) -> set[str]:
+    return {token for token in re.split(r"[/_.\-]+", path.lower()) if token and token not in ("py", "cpp", "h", "c")}
+
+
+def _tested_stem(path: Path) -> str:
+    return path.stem.removeprefix("test_").removesuffix("_test")
+
+
+class RepoIndex:
+    """
+    Index of the files of a repo, listed once with `git ls-files` (honoring .gitignore) or a filtered walk,
+    and updated incrementally for the paths touched by patches.
+    """
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self.files = self._list_files()
+        self._tree_hash: str | None = None
+
+    def _list_files(self) -> set[str]:
+        result = subprocess.run(
+            ["git", "ls-files", "--cached", "--others", "--exclude-standard"],
+            cwd=self.repo_path, capture_output=True, text=True
+        )
+        if result.returncode == 0:
+            files = {line for line in result.stdout.splitlines() if line}
+            return {path for path in files if (Path(self.repo_path) / path).is_file()}
+
+        files = set()
+        for root, dirs, names in os.walk(self.repo_path):
+            dirs[:] = [name for name in dirs if name not in SKIPPED_DIRS]
+            rel_root = Path(root).relative_to(self.repo_path)
+            files.update((rel_root / name).as_posix() for name in names)
+        return files
+
+    def invalidate(self, paths) -> None:
+        self._tree_hash = None
+        for path in paths:
+            if (Path(self.repo_path) / path).is_file():
+                self.files.add(Path(path).as_posix())
+            else:
+                self.files.discard(Path(path).as_posix())
+
+    def tree_hash(self) -> str:
+        """
+        Hash of the paths and contents of the repo files, ignoring the files generated by the pipeline.
+        Computed once until files are invalidated.
+        """
+        if self._tree_hash is not None:
+            return self._tree_hash
+        digest = hashlib.sha256()
+        for path in sorted(self.files):
+            if path.startswith(GENERATED_FILES) or path.startswith(GENERATED_DIRS):
+                continue
+            try:
+                content = (Path(self.repo_path) / path).read_bytes()
+            except OSError:
+                continue
+            digest.update(path.encode("utf-8") + b"\0")
+            digest.update(hashlib.sha256(content).digest())
+        self._tree_hash = digest.hexdigest()
+        return self._tree_hash
+
+    def source_files(self, suffixes: tuple[str, ...] = SOURCE_SUFFIXES) -> list[str]:
+        return sorted(path for path in self.files if path.endswith(suffixes))
+
+    def structure(self, paths: list[str] | None = None) -> str:
+        """
+        String representation of the source files of the repo (or of the given subset)
+        """
+        return "\n".join(sorted(paths) if paths is not None else self.source_files())
+
+    def relevant_paths(self, errors: list[dict], limit: int) -> list[str]:
+        """
+        Ranks the source files by relevance to a group of errors and keeps the `limit` best:
+        the failing files themselves, files mentioned in the messages, the code under test
+        (calc.py for test_calc.py), neighbours in the same directory and files sharing path tokens.
+        """
+        candidates = self.source_files()
+        if len(candidates) <= limit:
+            return candidates
+
+        error_files = {Path(error["file"]) for error in errors}
+        messages = "\n".join(error.get("message", "") for error in errors)
+        mentioned = set(re.findall(r"[\w/.-]+\.(?:py|cpp|h|c)\b", messages))
+        mentioned_names = {Path(path).name for path in mentioned}
+        tested_stems = {_tested_stem(path) for path in error_files}
+        error_dirs = {path.parent for path in error_files}
+        error_tokens = set().union(*(_tokens(str(path)) for path in error_files | mentioned))
+
+        def score(candidate: str) -> float:
+            path = Path(candidate)
+            total = 0.0
+            if path in error_files:
+                total += 100
+            if candidate in mentioned or path.name in mentioned_names:
+                total += 50
+            if path.stem in tested_stems or _tested_stem(path) in tested_stems:
+                total += 30
+            if path.parent in error_dirs:
+                total += 10
+            tokens = _tokens(candidate)
+            if tokens:
+                total += 10 * len(tokens & error_tokens) / len(tokens | error_tokens)
+            return total
+
+        return sorted(sorted(candidates, key=score, reverse=True)[:limit])
+
+
+def get_repo_index(repo_path: str) -> RepoIndex:
+    """
+    Returns the index of the repo, building it on first use in this run
+    """
+    with _indexes_lock:
+        index = _indexes.get(repo_path)
+        if index is None:
+            index = _indexes[repo_path] = RepoIndex(repo_path)
+        return index
+
+
+def drop_repo_index(repo_path: str) -> None:
+    with _indexes_lock:
+        _indexes.pop(repo_path, None)
@@ -1,16 +1,25 @@
-import json
-settings = json.load(open("settings/settings.json"))
-MAX_RETRIES = settings["max_retries"]
-MAX_PATCHES = settings["max_patches"]
+from .settings import settings
 
 RETRIABLE_TESTS = ["ConnectionError", "NetworkError", "TimeoutError", "NoSuchElementException", "ResourceUnavailable"]
 NON_RETRIABLE_TESTS = ["AssertionError", "ModuleNotFoundError"]
 
 
-def retry_policy(retries: int, error_types: list) -> bool:
-    if retries >= MAX_RETRIES:
+def retry_policy(retries: int, error_types: list, failing_tests: list | None = None,
+                 flaky_tests: list | None = None, deterministic_tests: list | None = None) -> bool:
+    """
+    Decides whether the failing tests are rerun before proposing a fix. When the test history classified them,
+    a deterministic failure goes straight to a fix and failures of only flaky tests are rerun;
+    otherwise the decision falls back to the exception types.
+    """
+    if retries >= settings["max_retries"]:
         return False
 
+    if failing_tests:
+        if any(test in (deterministic_tests or []) for test in failing_tests):
+            return False
+        if all(test in (flaky_tests or []) for test in failing_tests):
+            return True
+
     if any(err in NON_RETRIABLE_TESTS for err in error_types):
         return False
 
@@ -20,5 +29,5 @@ def retry_policy(retries: int, error_types: list) -> bool:
     return False
 
 def patch_retry_policy(patch: int) -> bool:
-    return patch >= MAX_PATCHES
+    return patch >= settings["max_patches"]
 
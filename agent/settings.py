@@ -0,0 +1,49 @@
+import json
+import os
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Iterator
+
+# settings/settings.json of the project, found independently of the working directory
+DEFAULT_SETTINGS_PATH = Path(__file__).resolve().parent.parent / "settings" / "settings.json"
+
+
+class LazySettings(MutableMapping):
+    """
+    The settings dictionary, read from CI_AGENT_SETTINGS (or settings/settings.json) on first access
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = path
+        self._data: dict[str, Any] | None = None
+
+    def _settings(self) -> dict[str, Any]:
+        if self._data is None:
+            path = Path(self.path or os.environ.get("CI_AGENT_SETTINGS") or DEFAULT_SETTINGS_PATH)
+            self._data = json.loads(path.read_text(encoding="utf-8"))
+        return self._data
+
+    def load(self, path: str | Path) -> None:
+        """
+        Switches to another settings file, read again on next access
+        """
+        self.path = path
+        self._data = None
+
+    def __getitem__(self, key: str) -> Any:
+        return self._settings()[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._settings()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._settings()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._settings())
+
+    def __len__(self) -> int:
+        return len(self._settings())
+
+
+settings = LazySettings()
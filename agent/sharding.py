@@ -0,0 +1,25 @@
+import heapq
+
+
+def split_into_shards(test_ids: list[str], shards: int, durations: dict[str, float] | None = None) -> list[list[str]]:
+    """
+    Splits test ids into at most `shards` groups.
+    With timing history the tests are balanced by duration (longest first onto the least loaded shard),
+    tests without history are assumed to take the average duration. Without history tests are dealt round-robin.
+    """
+    shards = max(1, min(shards, len(test_ids)))
+    if not durations:
+        return [test_ids[i::shards] for i in range(shards)]
+
+    known = [durations[test_id] for test_id in test_ids if test_id in durations]
+    default = sum(known) / len(known) if known else 1.0
+    ordered = sorted(test_ids, key=lambda test_id: durations.get(test_id, default), reverse=True)
+
+    groups = [[] for _ in range(shards)]
+    loads = [(0.0, i) for i in range(shards)]
+    for test_id in ordered:
+        load, i = heapq.heappop(loads)
+        groups[i].append(test_id)
+        heapq.heappush(loads, (load + durations.get(test_id, default), i))
+
+    return [group for group in groups if group]
@@ -0,0 +1,140 @@
+import asyncio
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any
+
+from .backends import get_backend
+from .docker_runner import build_image, run_tests
+from .git_ops import BASE_DIR
+from .fixer import CANDIDATE_PROMPT, create_limiter, propose_fix_async
+from .log_parser import parse_test_logs
+from .repo_index import drop_repo_index
+from .settings import settings
+from .tracing import in_current_context, span
+
+SANDBOX_IGNORED = shutil.ignore_patterns(".git", "build", ".ci_shards", "__pycache__", ".pytest_cache",
+                                         "report.xml", "rerun.xml", "report_shard_*.xml")
+
+
+def _speculative_settings() -> dict:
+    return settings.get("speculative", {})
+
+
+def candidate_count() -> int:
+    return _speculative_settings().get("candidates", 1)
+
+
+async def _propose_candidates(llm, repo_path: str, test_results: dict, candidates: int) -> list[dict[str, str]]:
+    # the candidates share one limiter, so K proposals stay within the same LLM rate limits as one
+    limiter = create_limiter()
+    results = await asyncio.gather(*(
+        propose_fix_async(llm, repo_path, test_results, use_cache=(i == 0), limiter=limiter,
+                          prompt_suffix=CANDIDATE_PROMPT.format(candidate=i + 1, candidates=candidates) if i else "")
+        for i in range(candidates)
+    ))
+    unique = []
+    for fixes in results:
+        if fixes and fixes not in unique:
+            unique.append(fixes)
+    return unique
+
+
+def _sandbox_dir(repo_path: str, patch: int, index: int) -> Path:
+    return BASE_DIR / "repos" / ".sandboxes" / f"{Path(repo_path).resolve().name}_{patch}_{index}"
+
+
+def validate_candidate(repo_path: str, fixes: dict[str, str], patch: int, index: int,
+                       stopped: threading.Event | None = None) -> dict[str, Any]:
+    """
+    Applies a candidate fix to a copy of the repo, builds and tests it in its own worker container,
+    and returns the number of failing tests (None if the build failed, or the test step failed or wrote no report,
+    or the validation was stopped)
+    """
+    sandbox = _sandbox_dir(repo_path, patch, index)
+    shutil.rmtree(sandbox, ignore_errors=True)
+    try:
+        with span(f"candidate_{index}", "speculative", candidate=index) as trace:
+            shutil.copytree(repo_path, sandbox, symlinks=True, ignore=SANDBOX_IGNORED)
+            for file_path, new_code in fixes.items():
+                full_path = sandbox / file_path
+                full_path.parent.mkdir(parents=True, exist_ok=True)
+                full_path.write_text(new_code, encoding="utf-8")
+            # the build directory is not copied with the sources; it is seeded from the repo instead
+            get_backend().seed(str(sandbox), repo_path)
+
+            if stopped is not None and stopped.is_set():
+                return {"index": index, "fixes": fixes, "failures": None}
+            build = build_image(str(sandbox))
+            if build["exit_code"] != 0 or (stopped is not None and stopped.is_set()):
+                trace["failures"] = None
+                return {"index": index, "fixes": fixes, "failures": None}
+            result = run_tests(str(sandbox), build["python_detected"], build["cpp_detected"], build["image"])
+            # a killed or broken test step leaves no report, which would otherwise read as zero failures
+            if result["exit_code"] != 0 or not (sandbox / "report.xml").is_file():
+                trace["failures"] = None
+                return {"index": index, "fixes": fixes, "failures": None}
+            failures = len(parse_test_logs(str(sandbox))["errors"])
+            trace["failures"] = failures
+            return {"index": index, "fixes": fixes, "failures": failures}
+    finally:
+        get_backend().stop(str(sandbox))
+        drop_repo_index(str(sandbox))
+        shutil.rmtree(sandbox, ignore_errors=True)
+
+
+def _rank(result: dict[str, Any]) -> tuple:
+    # passing first, then fewer failures; failed builds last; smaller patches break ties
+    failures = result["failures"]
+    return (failures is None, failures if failures is not None else 0,
+            sum(len(code) for code in result["fixes"].values()), result["index"])
+
+
+def propose_speculative_fix(llm, repo_path: str, test_results: dict, patch: int,
+                            candidates: int | None = None) -> dict[str, str]:
+    """
+    Asks for `candidates` fixes concurrently, validates each in its own sandbox copy of the repo in parallel
+    and returns the fix to promote: the first passing candidate (speculative.pick = "first") or the best
+    scoring one ("best"). Without a passing candidate the one with the fewest failures is returned.
+    """
+    candidates = candidates or candidate_count()
+    proposals = asyncio.run(_propose_candidates(llm, repo_path, test_results, candidates))
+    if len(proposals) <= 1:
+        return proposals[0] if proposals else {}
+
+    print(f"Validating {len(proposals)} candidate fixes in parallel sandboxes.")
+    pick_first = _speculative_settings().get("pick", "first") == "first"
+    results = []
+    winner = None
+    stopped = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(proposals))
+    futures = [executor.submit(in_current_context(validate_candidate), repo_path, fixes, patch, i, stopped)
+               for i, fixes in enumerate(proposals)]
+    try:
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Candidate validation failed: {e}")
+                continue
+            results.append(result)
+            print(f"Candidate {result['index'] + 1}: "
+                  f"{'build or test run failed' if result['failures'] is None else str(result['failures']) + ' failing tests'}.")
+            if pick_first and result["failures"] == 0:
+                winner = result
+                break
+    finally:
+        # stopping the workers of the remaining candidates ends the step they are in, and they skip the rest
+        stopped.set()
+        for i, future in enumerate(futures):
+            if not future.done():
+                get_backend().stop(str(_sandbox_dir(repo_path, patch, i)))
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if winner is None and results:
+        winner = min(results, key=_rank)
+    if winner is None:
+        return proposals[0]
+    print(f"Promoting candidate {winner['index'] + 1}.")
+    return winner["fixes"]
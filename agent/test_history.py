@@ -0,0 +1,119 @@
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from .git_ops import repo_key
+from .settings import settings
+
+DEFAULT_HISTORY_PATH = Path.home() / ".cache" / "autonomous-ci-agent" / "test_history.sqlite"
+DEFAULT_MAX_AGE_DAYS = 90
+
+
+def _history_settings() -> dict:
+    return settings.get("test_history", {})
+
+
+def history_enabled() -> bool:
+    return _history_settings().get("enabled", True)
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    path = Path(_history_settings().get("path") or DEFAULT_HISTORY_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS outcomes (
+                    repo TEXT NOT NULL,
+                    test TEXT NOT NULL,
+                    tree_hash TEXT NOT NULL,
+                    passed INTEGER NOT NULL,
+                    recorded REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS outcomes_by_test ON outcomes (repo, test)")
+            yield conn
+    finally:
+        conn.close()
+
+
+def record_outcomes(repo_path: str, tree_hash: str, outcomes: dict[str, bool]) -> None:
+    """
+    Appends the pass/fail outcome of every test of a run, dropping records older than max_age_days
+    """
+    if not history_enabled() or not outcomes:
+        return
+    repo = repo_key(repo_path)
+    now = time.time()
+    max_age = _history_settings().get("max_age_days", DEFAULT_MAX_AGE_DAYS) * 86400
+    with _connect() as conn:
+        conn.executemany(
+            "INSERT INTO outcomes (repo, test, tree_hash, passed, recorded) VALUES (?, ?, ?, ?, ?)",
+            [(repo, test, tree_hash, int(passed), now) for test, passed in outcomes.items()]
+        )
+        conn.execute("DELETE FROM outcomes WHERE recorded < ?", (now - max_age,))
+
+
+def _tree_stats(repo_path: str, tests: list[str]) -> dict[str, dict[str, tuple[int, int]]]:
+    """
+    (runs, passes) of every test per tree hash
+    """
+    stats = defaultdict(dict)
+    repo = repo_key(repo_path)
+    with _connect() as conn:
+        for i in range(0, len(tests), 500):
+            chunk = tests[i:i + 500]
+            rows = conn.execute(
+                f"SELECT test, tree_hash, COUNT(*), SUM(passed) FROM outcomes "
+                f"WHERE repo = ? AND test IN ({', '.join('?' * len(chunk))}) GROUP BY test, tree_hash",
+                (repo, *chunk)
+            )
+            for test, tree_hash, runs, passes in rows:
+                stats[test][tree_hash] = (runs, passes)
+    return stats
+
+
+def _score(by_tree: dict[str, tuple[int, int]]) -> float | None:
+    repeated = [(runs, passes) for runs, passes in by_tree.values() if runs > 1]
+    if not repeated:
+        return None
+    return sum(0 < passes < runs for runs, passes in repeated) / len(repeated)
+
+
+def flakiness_scores(repo_path: str, tests: list[str]) -> dict[str, float]:
+    """
+    Share of the tree hashes a test ran on more than once where it both passed and failed.
+    Tests that never ran twice on the same tree are left out: there is no evidence either way.
+    """
+    if not history_enabled() or not tests:
+        return {}
+    scores = {test: _score(by_tree) for test, by_tree in _tree_stats(repo_path, tests).items()}
+    return {test: score for test, score in scores.items() if score is not None}
+
+
+def classify_failures(repo_path: str, tree_hash: str, failing_tests: list[str]) -> tuple[list[str], list[str]]:
+    """
+    Splits the failing tests into flaky ones (flakiness score at least flaky_threshold) and deterministic ones
+    (failed every one of at least deterministic_runs runs on this tree). Tests without enough history are in neither.
+    """
+    if not history_enabled() or not failing_tests:
+        return [], []
+    threshold = _history_settings().get("flaky_threshold", 0.2)
+    deterministic_runs = _history_settings().get("deterministic_runs", 2)
+    stats = _tree_stats(repo_path, failing_tests)
+
+    flaky, deterministic = [], []
+    for test in failing_tests:
+        by_tree = stats.get(test, {})
+        score = _score(by_tree)
+        runs, passes = by_tree.get(tree_hash, (0, 0))
+        if score is not None and score >= threshold:
+            flaky.append(test)
+        elif runs >= deterministic_runs and passes == 0:
+            deterministic.append(test)
+    return flaky, deterministic
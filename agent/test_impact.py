@@ -0,0 +1,96 @@
+import ast
+from collections import deque
+from pathlib import Path
+
+from .repo_index import get_repo_index
+
+
+def _is_test_file(path: Path) -> bool:
+    return path.suffix == ".py" and (path.name.startswith("test_") or path.stem.endswith("_test"))
+
+
+def _python_files(repo_path: str) -> list[Path]:
+    return [Path(path) for path in get_repo_index(repo_path).source_files((".py",))]
+
+
+def _module_names(path: Path) -> list[str]:
+    """
+    All dotted names a file can be imported as, depending on which directory is on sys.path
+    (a/b/c.py -> a.b.c, b.c, c; a/b/__init__.py -> a.b, b)
+    """
+    parts = list(path.with_suffix("").parts)
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return [".".join(parts[i:]) for i in range(len(parts))]
+
+
+def _imported_modules(path: Path, source: str) -> set[str]:
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return set()
+
+    package = list(path.parent.parts)
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                parent = package[:len(package) - node.level + 1]
+                base = ".".join(parent + ([base] if base else []))
+            if base:
+                modules.add(base)
+            # `from pkg import module` imports a submodule rather than a symbol
+            modules.update(f"{base}.{alias.name}" if base else alias.name for alias in node.names)
+    return modules
+
+
+def build_impact_index(repo_path: str) -> dict[str, set[str]]:
+    """
+    Maps every Python file of the repo to the test files that import it, directly or transitively
+    """
+    files = _python_files(repo_path)
+    modules = {}
+    for path in files:
+        for name in _module_names(path):
+            modules.setdefault(name, set()).add(path)
+
+    imports = {}
+    for path in files:
+        source = (Path(repo_path) / path).read_text(encoding="utf-8", errors="ignore")
+        imported = set()
+        for module in _imported_modules(path, source):
+            # importing a.b.c also executes the a and a.b packages
+            parts = module.split(".")
+            for i in range(1, len(parts) + 1):
+                imported.update(modules.get(".".join(parts[:i]), ()))
+        imports[path] = imported
+
+    index = {}
+    for test_file in filter(_is_test_file, files):
+        seen = {test_file}
+        queue = deque([test_file])
+        while queue:
+            for dependency in imports[queue.popleft()] - seen:
+                seen.add(dependency)
+                queue.append(dependency)
+        for dependency in seen:
+            index.setdefault(str(dependency), set()).add(str(test_file))
+    return index
+
+
+def select_impacted_tests(repo_path: str, changed_files: list[str]) -> list[str] | None:
+    """
+    Returns the test files affected by the changed files, or None when the change
+    can not be mapped to tests (non-Python files, conftest.py) and the full suite has to run.
+    """
+    index = build_impact_index(repo_path)
+    selected = set()
+    for changed in changed_files:
+        path = Path(changed)
+        if path.suffix != ".py" or path.name == "conftest.py":
+            return None
+        selected.update(index.get(str(path), ()))
+    return sorted(selected)
@@ -0,0 +1,189 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable
+
+from .git_ops import BASE_DIR
+from .settings import settings
+
+DEFAULT_TRACES_DIR = BASE_DIR / "traces"
+
+# hooks receive every finished span as a Chrome trace "complete" event, see add_hook
+_hooks: list[Callable[[dict[str, Any]], None]] = []
+_recorder: contextvars.ContextVar["TraceRecorder | None"] = contextvars.ContextVar("trace_recorder", default=None)
+_epoch = time.perf_counter()
+
+
+def add_hook(hook: Callable[[dict[str, Any]], None]) -> None:
+    """
+    Registers a callable receiving every span of every run, e.g. to forward them to a metrics backend
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Callable[[dict[str, Any]], None]) -> None:
+    _hooks.remove(hook)
+
+
+class TraceRecorder:
+    """
+    Collects the spans of one pipeline run and exports them in the Chrome trace format (chrome://tracing, Perfetto)
+    """
+
+    def __init__(self, run_name: str):
+        self.run_name = run_name
+        self.start = time.perf_counter()
+        self.events: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, event: dict[str, Any]) -> None:
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self) -> dict[str, Any]:
+        """
+        Seconds spent per node, docker phase, report parsing and fix validation,
+        and the LLM calls and tokens per proposed fix
+        """
+        nodes = defaultdict(float)
+        docker = defaultdict(float)
+        llm = {"calls": 0, "seconds": 0.0, "input_tokens": 0, "output_tokens": 0}
+        fixes = []
+        parse_seconds = 0.0
+        validation = {"seconds": 0.0, "rejected": 0}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            seconds = event["dur"] / 1e6
+            args = event["args"]
+            if event["cat"] == "node":
+                nodes[event["name"]] += seconds
+            elif event["cat"] == "docker":
+                docker[args.get("phase", event["name"])] += seconds
+            elif event["cat"] == "llm":
+                llm["calls"] += args.get("calls", 0)
+                llm["seconds"] += seconds
+                llm["input_tokens"] += args.get("input_tokens", 0)
+                llm["output_tokens"] += args.get("output_tokens", 0)
+            elif event["cat"] == "fix":
+                fixes.append({"seconds": round(seconds, 3), **args})
+            elif event["cat"] == "parse":
+                parse_seconds += seconds
+            elif event["cat"] == "validate":
+                validation["seconds"] += seconds
+                validation["rejected"] += args.get("rejected", 0)
+
+        llm["seconds"] = round(llm["seconds"], 3)
+        validation["seconds"] = round(validation["seconds"], 3)
+        return {
+            "total_seconds": round(time.perf_counter() - self.start, 3),
+            "nodes": {name: round(seconds, 3) for name, seconds in nodes.items()},
+            "docker": {phase: round(seconds, 3) for phase, seconds in docker.items()},
+            "llm": llm,
+            "fixes": fixes,
+            "parse_seconds": round(parse_seconds, 3),
+            "validation": validation,
+        }
+
+    def export(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        trace = {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"run": self.run_name, "summary": self.summary()},
+        }
+        path.write_text(json.dumps(trace, indent=1, default=str), encoding="utf-8")
+        return path
+
+
+@contextlib.contextmanager
+def span(name: str, category: str, **args):
+    """
+    Times the enclosed block and reports it to the recorder of the current run and to the hooks.
+    Yields the args of the span, so values known only at the end (e.g. token usage) can be added.
+    """
+    recorder = _recorder.get()
+    if recorder is None and not _hooks:
+        yield args
+        return
+
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - _epoch) * 1e6),
+            "dur": round((time.perf_counter() - start) * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        if recorder is not None:
+            recorder(event)
+        for hook in list(_hooks):
+            hook(event)
+
+
+def traced_node(name: str, node: Callable) -> Callable:
+    """
+    Wraps a graph node so its wall-clock time is recorded
+    """
+    @functools.wraps(node)
+    def wrapper(state):
+        with span(name, "node"):
+            return node(state)
+    return wrapper
+
+
+def in_current_context(fn: Callable) -> Callable:
+    """
+    Makes fn report its spans to the current run when called from worker threads
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def traces_dir() -> Path:
+    return Path(settings.get("tracing", {}).get("dir") or DEFAULT_TRACES_DIR)
+
+
+@contextlib.contextmanager
+def trace_run(run_name: str):
+    """
+    Records the spans of a pipeline run and exports them to <traces dir>/<run_name>.json when it ends
+    """
+    recorder = TraceRecorder(run_name)
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+        if settings.get("tracing", {}).get("enabled", True):
+            path = recorder.export(traces_dir() / f"{run_name}.json")
+            print(f"Trace written to {path}.")
+
+
+def run_pipeline(graph, state: dict[str, Any] | None, config: dict[str, Any] | None = None,
+                 run_name: str | None = None) -> tuple[dict[str, Any], dict[str, Any]]:
+    """
+    Invokes the pipeline graph under a trace and returns its final state and the trace summary
+    """
+    run_name = run_name or f"run-{time.strftime('%Y%m%d%H%M%S')}"
+    with trace_run(run_name) as recorder:
+        final_state = graph.invoke(state, config)
+    return final_state, recorder.summary()
@@ -0,0 +1,102 @@
+import ast
+import shutil
+import subprocess
+from pathlib import Path, PurePosixPath
+
+from .repo_index import RepoIndex
+from .settings import settings
+
+C_SUFFIXES = (".c",)
+# file names that exist in many directories, so a new one is never a misspelled path
+COMMON_NAMES = {"__init__.py", "conftest.py"}
+CXX_SUFFIXES = (".cc", ".cpp", ".cxx", ".h", ".hh", ".hpp", ".hxx")
+
+
+def _validation_settings() -> dict:
+    return settings.get("validation", {})
+
+
+def validation_enabled() -> bool:
+    return _validation_settings().get("enabled", True)
+
+
+def max_reprompts() -> int:
+    return _validation_settings().get("max_reprompts", 2)
+
+
+def _check_path(file_path: str, repo_index: RepoIndex) -> str | None:
+    path = PurePosixPath(file_path)
+    if path.is_absolute() or ".." in path.parts:
+        return "the path is outside the repo, use a path relative to the repo root"
+    if file_path in repo_index.files or path.name in COMMON_NAMES:
+        return None
+    # a new file in an existing directory is fine; a new directory holding the only file of that name
+    # elsewhere in the repo is most likely a wrong path to that file
+    if any(path.parent in PurePosixPath(known).parents for known in repo_index.files):
+        return None
+    same_name = [known for known in repo_index.files if PurePosixPath(known).name == path.name]
+    if len(same_name) == 1:
+        return f"the file does not exist in the repo, did you mean {same_name[0]}?"
+    return None
+
+
+def _check_python(file_path: str, source: str) -> str | None:
+    try:
+        ast.parse(source, filename=file_path)
+    except SyntaxError as e:
+        return f"line {e.lineno}: {e.msg}"
+    return None
+
+
+def _syntax_only(repo_path: str, file_path: str, source: str) -> str | None:
+    """
+    Errors of `<compiler> -fsyntax-only` on the source, None if it compiles or no compiler is installed
+    """
+    validation = _validation_settings()
+    if file_path.endswith(C_SUFFIXES):
+        compiler, language, flags = validation.get("cc", "gcc"), "c", validation.get("c_flags", [])
+    else:
+        compiler, language, flags = validation.get("cxx", "g++"), "c++", validation.get("cxx_flags", ["-std=c++17"])
+    if shutil.which(compiler) is None:
+        return None
+    repo = Path(repo_path)
+    includes = [f"-iquote{(repo / file_path).parent}", f"-I{repo}", f"-I{repo / 'include'}"]
+    try:
+        result = subprocess.run([compiler, "-fsyntax-only", *flags, *includes, "-x", language, "-"],
+                                input=source, capture_output=True, text=True,
+                                timeout=validation.get("timeout_seconds", 30))
+    except subprocess.TimeoutExpired:
+        return None
+    if result.returncode == 0:
+        return None
+    return result.stderr.replace("<stdin>", file_path).strip() or f"{compiler} exited with {result.returncode}"
+
+
+def _check_c_cpp(repo_path: str, file_path: str, source: str) -> str | None:
+    error = _syntax_only(repo_path, file_path, source)
+    if error is None:
+        return None
+    # headers of dependencies only installed in the container make the check inconclusive:
+    # the fix is only rejected when the current file compiles locally
+    original = Path(repo_path) / file_path
+    if not original.is_file() or _syntax_only(repo_path, file_path, original.read_text(encoding="utf-8")) is not None:
+        return None
+    return error
+
+
+def validate_fixes(repo_path: str, fixes: dict[str, str], repo_index: RepoIndex) -> dict[str, str]:
+    """
+    Checks proposed fixes before anything is written or built: the paths must point into the repo
+    (and not be misspellings of indexed files), Python must parse and C/C++ must pass -fsyntax-only.
+    Returns the validation error of every rejected file.
+    """
+    errors = {}
+    for file_path, source in fixes.items():
+        error = _check_path(file_path, repo_index)
+        if error is None and file_path.endswith(".py"):
+            error = _check_python(file_path, source)
+        elif error is None and file_path.endswith(C_SUFFIXES + CXX_SUFFIXES):
+            error = _check_c_cpp(repo_path, file_path, source)
+        if error is not None:
+            errors[file_path] = error
+    return errors
@@ -0,0 +1,59 @@
+import itertools
+import subprocess
+
+from agent.docker_runner import CI_IMAGE_LABEL, _dockerfile_hash
+
+
+class FakeDocker:
+    """
+    Stand-in for the docker CLI: while active, `docker exec` scripts run with bash directly in the mounted
+    repo directory, images always exist and other docker commands succeed. Other commands run unchanged.
+    Covers both subprocess.run and the streamed subprocess.Popen commands.
+    """
+
+    def __init__(self):
+        self.commands: list[list[str]] = []
+        self._containers: dict[str, str] = {}
+        self._ids = itertools.count(1)
+        self._real_run = subprocess.run
+        self._real_popen = subprocess.Popen
+
+    def __enter__(self):
+        subprocess.run = self.run
+        subprocess.Popen = self.popen
+        return self
+
+    def __exit__(self, *exc_info):
+        subprocess.run = self._real_run
+        subprocess.Popen = self._real_popen
+
+    def _completed(self, cmd, stdout: str = "", returncode: int = 0) -> subprocess.CompletedProcess:
+        return subprocess.CompletedProcess(cmd, returncode, stdout, "")
+
+    def run(self, cmd, *args, **kwargs):
+        if not isinstance(cmd, list) or not cmd or cmd[0] != "docker":
+            return self._real_run(cmd, *args, **kwargs)
+
+        self.commands.append(cmd)
+        if cmd[1:3] == ["image", "inspect"]:
+            labels = _dockerfile_hash() if any(CI_IMAGE_LABEL in part for part in cmd) else ""
+            return self._completed(cmd, labels)
+        if cmd[1:3] == ["run", "-d"]:
+            container_id = f"fake{next(self._ids):060d}"
+            mount = cmd[cmd.index("-v") + 1]
+            self._containers[container_id] = mount.rsplit(":/workspace", 1)[0]
+            return self._completed(cmd, container_id + "\n")
+        if cmd[1] == "exec":
+            repo_path = self._containers[cmd[cmd.index("-w") + 2]]
+            return self._real_run(["bash", "-c", cmd[-1]], cwd=repo_path, capture_output=True, text=True)
+        return self._completed(cmd)
+
+    def popen(self, cmd, *args, **kwargs):
+        if not isinstance(cmd, list) or not cmd or cmd[0] != "docker":
+            return self._real_popen(cmd, *args, **kwargs)
+
+        self.commands.append(cmd)
+        if cmd[1] == "exec":
+            kwargs["cwd"] = self._containers[cmd[cmd.index("-w") + 2]]
+            return self._real_popen(["bash", "-c", cmd[-1]], *args, **kwargs)
+        return self._real_popen(["true"], *args, **kwargs)
@@ -0,0 +1,47 @@
+import re
+from typing import Any, Callable
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from .synthetic import module_source
+
+
+def synthetic_fix_responder(messages: list[BaseMessage]) -> str:
+    """
+    Canned SOURCE_FILE/FIXED_CODE answer repairing the synthetic modules whose tests fail in the prompt
+    """
+    prompt = "\n".join(str(message.content) for message in messages if message.type == "human")
+    # only the failing files of the errors list, not the file structure listing every test module
+    modules = sorted({int(i) for i in re.findall(r"'file': 'tests/test_mod_(\d+)\.py'", prompt)})
+    return "\n".join(
+        f"SOURCE_FILE: pkg/mod_{i}.py\nFIXED_CODE:\n```python\n{module_source(i, broken=False)}\n```"
+        for i in modules
+    )
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model answering every request with responder(messages) and reporting token usage
+    """
+
+    responder: Callable[[list[BaseMessage]], str] = synthetic_fix_responder
+    model_name: str = "fake-chat-model"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools, **kwargs: Any):
+        # the canned answers never call tools
+        return self
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        content = self.responder(messages)
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        output_tokens = len(content) // 4
+        message = AIMessage(content=content, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
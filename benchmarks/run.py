@@ -0,0 +1,127 @@
+import argparse
+import contextlib
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from agent.batch import initial_state, pipeline_result
+from agent.clustering import cluster_errors
+from agent.config import AgentConfig
+from agent.fixer import group_errors_by_file
+from agent.log_parser import parse_test_logs
+from agent.patching import apply_edit_blocks
+from agent.pipeline import create_graph
+from agent.repo_index import RepoIndex
+from agent.settings import settings
+from agent.tracing import run_pipeline
+
+from .fake_docker import FakeDocker
+from .fake_llm import FakeChatModel
+from .synthetic import make_report, make_repo
+
+
+@contextlib.contextmanager
+def offline_settings(trace_dir: Path):
+    """
+    Disables the caches that would skip work between repeated runs and sends the traces to trace_dir
+    """
+    overrides = {
+        "checkpoints": {"enabled": False, "reuse_results": False},
+        "fix_cache": {"enabled": False},
+        "test_history": {"enabled": False},
+        "tracing": {"enabled": True, "dir": str(trace_dir)},
+        "logs": {"dir": str(trace_dir.parent / "logs"), "live": False},
+    }
+    previous = {key: settings.get(key) for key in overrides}
+    settings.update(overrides)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                settings.pop(key, None)
+            else:
+                settings[key] = value
+
+
+def _best_of(repeat: int, fn) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return round(best, 4)
+
+
+def bench_pipeline(workdir: Path, modules: int, tests_per_module: int, failures: int,
+                   message_bytes: int) -> dict[str, Any]:
+    """
+    Runs the whole graph over a synthetic repo with the fake docker and LLM backends and returns
+    the final pipeline result with its per-stage trace summary
+    """
+    repo = make_repo(workdir / "repo", modules, tests_per_module, failures, message_bytes)
+    graph = create_graph(config=AgentConfig(llm=FakeChatModel()))
+    with offline_settings(workdir / "traces"), FakeDocker():
+        final_state, summary = run_pipeline(graph, initial_state(str(repo)), run_name="benchmark")
+    result = pipeline_result(final_state)
+    return {"status": result["status"], "patches": final_state.get("patch", 0), "trace": summary}
+
+
+def bench_components(workdir: Path, modules: int, tests_per_module: int, failures: int, message_bytes: int,
+                     repeat: int) -> dict[str, float]:
+    """
+    Best-of-`repeat` seconds of the pure-Python stages: report parsing, error grouping and clustering,
+    structure walking/ranking and patch application
+    """
+    tests = modules * tests_per_module
+    report_dir = workdir / "report"
+    make_report(report_dir, tests, failures, message_bytes)
+    errors = parse_test_logs(str(report_dir))["errors"]
+
+    repo = make_repo(workdir / "index_repo", modules, 1, 0, 0)
+    index = RepoIndex(str(repo))
+
+    source = "".join(f"def f_{i}(x):\n    return x + {i}\n\n" for i in range(5000))
+    blocks = [(f"def f_{i}(x):\n    return x + {i}\n", f"def f_{i}(x):\n    return x - {i}\n") for i in range(0, 5000, 50)]
+
+    return {
+        "parse_report": _best_of(repeat, lambda: parse_test_logs(str(report_dir))),
+        "group_errors": _best_of(repeat, lambda: group_errors_by_file(errors)),
+        "cluster_errors": _best_of(repeat, lambda: cluster_errors(errors)),
+        "index_repo": _best_of(repeat, lambda: RepoIndex(str(repo))),
+        "structure": _best_of(repeat, lambda: index.structure()),
+        "relevant_paths": _best_of(repeat, lambda: index.relevant_paths(errors[:20], 50)),
+        "apply_edits": _best_of(repeat, lambda: apply_edit_blocks(source, blocks)),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the pipeline overhead")
+    parser.add_argument("--modules", type=int, default=50, help="source modules of the synthetic repo")
+    parser.add_argument("--tests", type=int, default=10, help="tests per module")
+    parser.add_argument("--failures", type=int, default=5, help="broken modules (pipeline) / failing tests (report)")
+    parser.add_argument("--message-bytes", type=int, default=2000, help="size of each failure message")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions of the component benchmarks")
+    parser.add_argument("--skip-pipeline", action="store_true", help="only run the component benchmarks")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "parameters": {"modules": args.modules, "tests": args.tests, "failures": args.failures,
+                           "message_bytes": args.message_bytes},
+            "components": bench_components(Path(tmp), args.modules, args.tests, args.failures,
+                                           args.message_bytes, args.repeat),
+        }
+        if not args.skip_pipeline:
+            results["pipeline"] = bench_pipeline(Path(tmp), args.modules, args.tests, args.failures,
+                                                 args.message_bytes)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+    print(output)
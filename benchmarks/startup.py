@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BUDGET_SECONDS = 0.5
+# packages only needed once the LLM is called or the graph is compiled
+HEAVY_PACKAGES = ("langchain", "langchain_core", "langchain_openai", "langgraph", "openai", "dotenv")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy!r}))
+print(json.dumps({{"seconds": seconds, "heavy_modules": heavy}}))
+"""
+
+
+def measure_startup(module: str = "main", repeat: int = 5, cwd: str | Path | None = None) -> dict:
+    """
+    Imports the module in fresh interpreters (from cwd, outside the project by default) and returns
+    the best import time and the heavy packages the import pulled in
+    """
+    env = {**os.environ, "PYTHONPATH": str(PROJECT_DIR)}
+    env.pop("OPENAI_API_KEY", None)
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_PACKAGES)],
+                                cwd=cwd or Path.home(), env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Importing {module} failed: {result.stderr}")
+        runs.append(json.loads(result.stdout))
+    return {
+        "module": module,
+        "seconds": round(min(run["seconds"] for run in runs), 4),
+        "heavy_modules": runs[0]["heavy_modules"],
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import time of the CLI entry point")
+    parser.add_argument("--module", default="main", help="module to import (default: main)")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters to measure")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS, help="allowed import time in seconds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = measure_startup(args.module, args.repeat)
+    result["budget_seconds"] = args.budget
+    result["within_budget"] = result["seconds"] <= args.budget and not result["heavy_modules"]
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["within_budget"] else 1)
@@ -0,0 +1,55 @@
+import subprocess
+from pathlib import Path
+
+
+def module_source(i: int, broken: bool) -> str:
+    value = -1 if broken else i
+    return f"def value_{i}():\n    return {value}\n\n\ndef double_{i}(x):\n    return x * 2\n"
+
+
+def make_repo(path: Path, modules: int = 20, tests_per_module: int = 10, failures: int = 2,
+              message_bytes: int = 200) -> Path:
+    """
+    Writes a Python repo with `modules` source modules and `tests_per_module` tests each, where the first
+    `failures` modules are broken. Assertion messages are padded to `message_bytes` to scale the report size.
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "pkg").mkdir(exist_ok=True)
+    (path / "tests").mkdir(exist_ok=True)
+    (path / "requirements.txt").write_text("")
+    (path / "pytest.ini").write_text("[pytest]\npythonpath = .\n")
+    (path / "pkg" / "__init__.py").write_text("")
+    padding = "x" * message_bytes
+    for i in range(modules):
+        (path / "pkg" / f"mod_{i}.py").write_text(module_source(i, i < failures))
+        tests = [f"from pkg.mod_{i} import value_{i}, double_{i}\n"]
+        for j in range(tests_per_module):
+            tests.append(
+                f"\n\ndef test_value_{i}_{j}():\n"
+                f"    assert value_{i}() == {i}, \"{padding}\"\n"
+                f"    assert double_{i}({j}) == {2 * j}\n"
+            )
+        (path / "tests" / f"test_mod_{i}.py").write_text("".join(tests))
+    subprocess.run(["git", "init", "-q"], cwd=path, capture_output=True)
+    return path
+
+
+def make_report(path: Path, tests: int, failures: int, message_bytes: int) -> Path:
+    """
+    Writes a JUnit report.xml with `tests` testcases, `failures` of them failing with `message_bytes` of output
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    message = "E" * message_bytes
+    cases = []
+    for i in range(tests):
+        body = ""
+        if i < failures:
+            body = (f'<failure message="AssertionError: boom {i}">tests/test_mod_{i % 50}.py:{i % 200 + 1}: '
+                    f'AssertionError\n{message}</failure>')
+        cases.append(f'<testcase classname="tests.test_mod_{i % 50}" name="test_{i}" time="0.01">{body}</testcase>')
+    (path / "report.xml").write_text(
+        f'<?xml version="1.0" encoding="utf-8"?><testsuites><testsuite name="pytest" tests="{tests}" '
+        f'failures="{failures}">{"".join(cases)}</testsuite></testsuites>',
+        encoding="utf-8"
+    )
+    return path / "report.xml"
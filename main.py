@@ -1,23 +1,68 @@
+import argparse
+import uuid
+
+from agent.batch import initial_state, run_batch
+from agent.checkpoint import checkpoints_enabled, create_checkpointer, run_config
+from agent.config import AgentConfig
 from agent.pipeline import create_graph
-from pathlib import Path
+from agent.settings import settings
+from agent.tracing import run_pipeline
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Autonomous CI Agent")
+    parser.add_argument("--batch", metavar="MANIFEST", help="run the agent for every repo URL/path of the manifest")
+    parser.add_argument("--output", default="results", help="directory for the batch results (default: results)")
+    parser.add_argument("--max-pipelines", type=int, help="pipelines running at the same time in batch mode")
+    parser.add_argument("--max-docker-jobs", type=int, help="docker build/test steps running at the same time")
+    parser.add_argument("--max-llm-calls", type=int, help="LLM calls in flight at the same time")
+    parser.add_argument("--ref", help="branch, tag or commit to check out when cloning a repo URL")
+    parser.add_argument("--model", help="chat model proposing the fixes (default: gpt-5.1)")
+    parser.add_argument("--backend", choices=["docker", "docker_hosts", "local"],
+                        help="where build/test steps run: local docker, the docker hosts pool or local subprocesses")
+    parser.add_argument("--docker-host", action="append", metavar="HOST",
+                        help="docker endpoint (DOCKER_HOST syntax) of the docker_hosts backend, repeatable")
+    parser.add_argument("--settings", help="settings file to use instead of settings/settings.json")
+    parser.add_argument("--run-id", help="id to checkpoint the run under (default: a random id)")
+    parser.add_argument("--resume", metavar="RUN_ID", help="resume an interrupted run from its last completed step")
+    return parser.parse_args()
 
-state = {
-    "retries": 0,
-    "patch": 0,
-}
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.settings:
+        settings.load(args.settings)
+    if args.docker_host:
+        settings["execution"] = {**settings.get("execution", {}), "backend": "docker_hosts",
+                                 "docker_hosts": args.docker_host}
+    if args.backend:
+        settings["execution"] = {**settings.get("execution", {}), "backend": args.backend}
+    agent_config = AgentConfig(model=args.model)
     print("\033[92mAutonomous CI Agent started.")
-    repo = input("Enter repo URL or path: ")
-    graph = create_graph()
-    if repo.endswith(".git"):
-        state["repo_url"] = repo
-        graph.invoke(state)
-    else:
-        path = Path(repo)
-        if path.exists() and path.is_dir():
-            state["repo_path"] = repo
-            graph.invoke(state)
+    if args.batch:
+        run_batch(args.batch, args.output, args.max_pipelines, args.max_docker_jobs, args.max_llm_calls, config=agent_config)
+    elif args.resume:
+        graph = create_graph(create_checkpointer(), agent_config)
+        config = run_config(args.resume)
+        if not graph.get_state(config).next:
+            print(f"No interrupted run with id {args.resume}.")
         else:
+            print(f"Resuming run {args.resume}.")
+            _, summary = run_pipeline(graph, None, config, args.resume)
+            print(f"Timings: {summary}")
+    else:
+        repo = input("Enter repo URL or path: ")
+        state = initial_state(repo, args.ref)
+        if state is None:
             print("Invalid repo path or URL.")
-    print("\033[00m")
\ No newline at end of file
+        elif checkpoints_enabled():
+            run_id = args.run_id or uuid.uuid4().hex[:12]
+            print(f"Run id: {run_id} (resume with --resume {run_id})")
+            graph = create_graph(create_checkpointer(), agent_config)
+            _, summary = run_pipeline(graph, state, run_config(run_id), run_id)
+            print(f"Timings: {summary}")
+        else:
+            graph = create_graph(config=agent_config)
+            _, summary = run_pipeline(graph, state)
+            print(f"Timings: {summary}")
+    print("\033[00m")
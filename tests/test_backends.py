@@ -0,0 +1,151 @@
+import subprocess
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import agent.docker_runner as docker_runner
+from agent.backends import create_backend, set_backend
+from agent.docker_runner import DockerHostPool, _workers, run_tests
+from agent.local_runner import LocalBackend
+from agent.log_parser import parse_test_logs
+from agent.settings import settings
+
+
+@pytest.fixture(autouse=True)
+def reset_backend(tmp_path, monkeypatch):
+    monkeypatch.setitem(settings, "logs", {"dir": str(tmp_path / "logs"), "live": False})
+    _workers.clear()
+    docker_runner._worker_hosts.clear()
+    docker_runner._synced.clear()
+    docker_runner._sync_locks.clear()
+    yield
+    set_backend(None)
+    _workers.clear()
+    docker_runner._worker_hosts.clear()
+    docker_runner._synced.clear()
+
+
+def test_local_backend_runs_the_tests_in_the_repo(tmp_path):
+    repo = tmp_path / "calc"
+    (repo / "tests").mkdir(parents=True)
+    (repo / "calc.py").write_text("def add(a, b):\n    return a - b\n")
+    (repo / "tests" / "test_calc.py").write_text("from calc import add\n\n\ndef test_add():\n    assert add(1, 2) == 3\n")
+    (repo / "pytest.ini").write_text("[pytest]\npythonpath = .\n")
+    set_backend("local")
+
+    result = run_tests(str(repo), True, False)
+
+    assert result["exit_code"] == 0
+    assert [error["test"] for error in parse_test_logs(str(repo))["errors"]] == ["tests/test_calc.py::test_add"]
+
+
+def test_create_backend():
+    assert isinstance(create_backend("local"), LocalBackend)
+    with pytest.raises(Exception, match="Unknown execution backend"):
+        create_backend("kubernetes")
+
+
+@patch("subprocess.run")
+def test_pool_assigns_repos_to_the_least_loaded_reachable_host(mock_run):
+    running = {"ssh://a": "c1\nc2\nc3\n", "ssh://b": "c1\n"}
+
+    def docker_ps(cmd, **kwargs):
+        host = cmd[2]
+        if host == "ssh://down":
+            return MagicMock(returncode=1, stdout="", stderr="unreachable")
+        return MagicMock(returncode=0, stdout=running[host], stderr="")
+    mock_run.side_effect = docker_ps
+    pool = DockerHostPool(["ssh://a", "ssh://down", "ssh://b"])
+
+    assert pool.host_for("repo-1") == "ssh://b"
+    # the repo assigned to b counts as load until its worker shows up in docker ps
+    assert pool.host_for("repo-2") == "ssh://b"
+    assert pool.host_for("repo-3") == "ssh://a"
+    assert pool.host_for("repo-1") == "ssh://b"
+
+
+@patch("subprocess.run")
+def test_remote_worker_syncs_the_repo_instead_of_mounting_it(mock_run, tmp_path, monkeypatch):
+    (tmp_path / "app.py").write_text("x = 1\n")
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "HEAD").write_text("ref\n")
+    sent = []
+    monkeypatch.setattr(docker_runner, "_send_files", lambda repo, host, container, paths: sent.append(sorted(paths)))
+    monkeypatch.setattr(docker_runner, "_stream_command",
+                        lambda cmd, *args, cwd=None, **kwargs: subprocess.run(cmd, cwd=cwd, capture_output=True, text=True))
+    mock_run.return_value = MagicMock(returncode=0, stdout="worker-id", stderr="")
+    set_backend(DockerHostPool(["tcp://build-1:2376"]))
+
+    run_tests(str(tmp_path), True, False, image="ci-deps:abc")
+    (tmp_path / "app.py").write_text("x = 2\n")
+    (tmp_path / "new.py").write_text("y = 1\n")
+    run_tests(str(tmp_path), True, False, image="ci-deps:abc")
+
+    commands = [call.args[0] for call in mock_run.call_args_list]
+    started = next(cmd for cmd in commands if "run" in cmd and "-d" in cmd)
+    assert started[:3] == ["docker", "-H", "tcp://build-1:2376"]
+    assert not any(arg.endswith(":/workspace") for arg in started)
+    assert sent == [["app.py"], ["app.py", "new.py"]]
+    assert ["docker", "-H", "tcp://build-1:2376", "cp", "worker-id:/workspace/report.xml",
+            str(tmp_path / "report.xml")] in commands
+
+
+def test_concurrent_steps_sync_a_remote_worker_once(tmp_path, monkeypatch):
+    (tmp_path / "app.py").write_text("x = 1\n")
+    sent = []
+
+    def slow_send(repo, host, container, paths):
+        time.sleep(0.1)
+        sent.append(sorted(paths))
+    monkeypatch.setattr(docker_runner, "_send_files", slow_send)
+
+    shards = [threading.Thread(target=docker_runner._sync_workspace, args=(str(tmp_path), "ssh://a", "worker-id"))
+              for _ in range(4)]
+    for shard in shards:
+        shard.start()
+    for shard in shards:
+        shard.join()
+
+    assert sent == [["app.py"]]
+
+
+def test_probing_hosts_does_not_block_assigned_repos(monkeypatch):
+    probing = threading.Event()
+    release = threading.Event()
+
+    def slow_host_load(host):
+        probing.set()
+        release.wait(5)
+        return 0
+    monkeypatch.setattr(docker_runner, "host_load", slow_host_load)
+    pool = DockerHostPool(["ssh://a"])
+    pool._assigned["repo-1"] = "ssh://a"
+    assigning = threading.Thread(target=pool.host_for, args=("repo-2",))
+    assigning.start()
+    probing.wait(5)
+
+    started = time.monotonic()
+    assert pool.host_for("repo-1") == "ssh://a"
+    assert time.monotonic() - started < 1
+    release.set()
+    assigning.join()
+    assert pool.host_for("repo-2") == "ssh://a"
+
+
+def test_local_backend_removes_the_build_dir_on_stop(tmp_path, monkeypatch):
+    monkeypatch.setattr("agent.local_runner.DEFAULT_BUILDS_DIR", tmp_path / "builds")
+    repo = tmp_path / "calc"
+    repo.mkdir()
+    (repo / "CMakeLists.txt").write_text("project(calc)\n")
+    backend = LocalBackend()
+    build = Path(backend.default_build_dir(str(repo)))
+    (build / "CMakeFiles").mkdir(parents=True)
+
+    assert backend.image_available(str(repo), "local")
+    backend.stop(str(repo))
+
+    assert not build.exists()
+    assert not backend.image_available(str(repo), "local")
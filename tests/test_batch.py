@@ -0,0 +1,53 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from agent.batch import load_manifest, pipeline_result, run_batch
+from agent.docker_runner import set_max_docker_jobs
+from agent.fixer import set_max_llm_calls
+from agent.settings import settings
+
+
+@pytest.fixture(autouse=True)
+def reset_limits():
+    # run_batch installs process-wide limits on docker jobs and LLM calls
+    yield
+    set_max_docker_jobs(None)
+    set_max_llm_calls(None)
+
+
+def test_load_manifest_text_and_json(tmp_path):
+    text_manifest = tmp_path / "repos.txt"
+    text_manifest.write_text("# nightly\nhttps://github.com/user/calc.git\n\nexamples/calc_app\nhttps://github.com/other/calc.git\n")
+    json_manifest = tmp_path / "repos.json"
+    json_manifest.write_text(json.dumps(["examples/cpp_calc", {"repo": "examples/calc_app", "name": "py"}]))
+
+    assert [job["name"] for job in load_manifest(str(text_manifest))] == ["calc", "calc_app", "calc_2"]
+    assert [job["name"] for job in load_manifest(str(json_manifest))] == ["cpp_calc", "py"]
+
+def test_pipeline_result_for_build_failure():
+    result = pipeline_result({"retries": 0, "build_logs": {"exit_code": 2, "stderr": "cmake error"}})
+
+    assert result["stage"] == "build"
+    assert result["status"] == "failed"
+    assert result["errors"][0]["message"] == "cmake error"
+
+def test_run_batch_writes_results_and_summary(tmp_path, monkeypatch):
+    monkeypatch.setitem(settings, "tracing", {"enabled": True, "dir": str(tmp_path / "traces")})
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    manifest = tmp_path / "repos.txt"
+    manifest.write_text(f"{repo}\n{tmp_path / 'missing'}\n")
+    graph = MagicMock()
+    graph.invoke.return_value = {"test_results": {"stage": "tests", "status": "success", "attempt": 0, "errors": []}}
+
+    summary = run_batch(str(manifest), str(tmp_path / "results"), max_pipelines=2, graph=graph)
+
+    assert summary["total"] == 2
+    assert summary["succeeded"] == 1
+    assert json.loads((tmp_path / "results" / "repo.json").read_text())["status"] == "success"
+    assert json.loads((tmp_path / "results" / "missing.json").read_text())["stage"] == "setup"
+    assert (tmp_path / "results" / "summary.json").exists()
+    assert "nodes" in json.loads((tmp_path / "results" / "repo.json").read_text())["trace"]
+    assert (tmp_path / "traces" / "batch-repo.json").exists()
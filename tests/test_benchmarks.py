@@ -0,0 +1,42 @@
+from benchmarks.fake_docker import FakeDocker
+from benchmarks.run import bench_components, bench_pipeline
+from benchmarks.startup import measure_startup
+from benchmarks.synthetic import make_repo
+from agent.docker_runner import run_tests, stop_worker
+from agent.settings import settings
+
+
+def test_fake_docker_runs_scripts_in_the_mounted_repo(tmp_path, monkeypatch):
+    monkeypatch.setitem(settings, "logs", {"dir": str(tmp_path / "logs"), "live": False})
+    repo = make_repo(tmp_path / "repo", modules=2, tests_per_module=2, failures=1)
+
+    with FakeDocker() as docker:
+        result = run_tests(str(repo), True, False, "ci-deps:fake")
+        stop_worker(str(repo))
+
+    assert result["exit_code"] == 0
+    assert "2 failed, 2 passed" in result["stdout"]
+    assert (repo / "report.xml").exists()
+    assert [command[1] for command in docker.commands][:3] == ["rm", "run", "exec"]
+
+
+def test_component_benchmarks(tmp_path):
+    timings = bench_components(tmp_path, modules=5, tests_per_module=4, failures=3, message_bytes=100, repeat=1)
+
+    assert set(timings) == {"parse_report", "group_errors", "cluster_errors", "index_repo", "structure", "relevant_paths", "apply_edits"}
+
+
+def test_pipeline_benchmark_fixes_the_synthetic_repo(tmp_path):
+    result = bench_pipeline(tmp_path, modules=3, tests_per_module=2, failures=1, message_bytes=50)
+
+    assert result["status"] == "success"
+    assert result["patches"] == 1
+    assert result["trace"]["llm"]["calls"] == 1
+    assert {"BuildNode", "RunTestsNode", "ProposeFixNode"} <= set(result["trace"]["nodes"])
+
+
+def test_cli_startup_is_lazy(tmp_path):
+    result = measure_startup("main", repeat=1, cwd=tmp_path)
+
+    # the time budget is left to `python -m benchmarks.startup`, wall-clock times are too noisy for the unit suite
+    assert result["heavy_modules"] == []
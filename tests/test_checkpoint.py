@@ -0,0 +1,102 @@
+import subprocess
+from typing import TypedDict
+
+import pytest
+from langgraph.graph import StateGraph, START, END
+
+from agent import checkpoint
+from agent.checkpoint import create_checkpointer, get_step_result, run_config, store_step_result
+from agent.repo_index import RepoIndex
+from agent.settings import settings
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_file(tmp_path, monkeypatch):
+    monkeypatch.setitem(settings, "checkpoints", {"enabled": True, "path": str(tmp_path / "ckpt.sqlite"),
+                                                  "reuse_results": True})
+
+
+def test_step_results_are_keyed_by_tree_hash_and_step():
+    store_step_result("abc", "build", {"exit_code": 0, "image": "ci-deps:1"})
+
+    assert get_step_result("abc", "build") == {"exit_code": 0, "image": "ci-deps:1"}
+    assert get_step_result("abc", "tests") is None
+    assert get_step_result("def", "build") is None
+
+
+def test_step_results_disabled(monkeypatch, tmp_path):
+    store_step_result("abc", "build", {"exit_code": 0})
+    monkeypatch.setitem(settings, "checkpoints", {"path": str(tmp_path / "ckpt.sqlite"), "reuse_results": False})
+
+    assert get_step_result("abc", "build") is None
+
+
+def test_tree_hash_ignores_generated_files(tmp_path):
+    (tmp_path / "calc.py").write_text("def add(a, b):\n    return a + b\n")
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path)
+    before = RepoIndex(str(tmp_path)).tree_hash()
+
+    (tmp_path / "report.xml").write_text("<testsuite/>")
+    assert RepoIndex(str(tmp_path)).tree_hash() == before
+
+    (tmp_path / "calc.py").write_text("def add(a, b):\n    return a - b\n")
+    assert RepoIndex(str(tmp_path)).tree_hash() != before
+
+
+class _State(TypedDict):
+    steps: list[str]
+
+
+def test_interrupted_run_resumes_from_last_completed_node():
+    calls = []
+
+    def first(state):
+        calls.append("first")
+        return {"steps": state["steps"] + ["first"]}
+
+    def second(state):
+        calls.append("second")
+        if calls.count("second") == 1:
+            raise Exception("worker died")
+        return {"steps": state["steps"] + ["second"]}
+
+    graph = StateGraph(_State)
+    graph.add_node("first", first)
+    graph.add_node("second", second)
+    graph.add_edge(START, "first")
+    graph.add_edge("first", "second")
+    graph.add_edge("second", END)
+    compiled = graph.compile(checkpointer=create_checkpointer())
+
+    with pytest.raises(Exception, match="worker died"):
+        compiled.invoke({"steps": []}, run_config("run-1"))
+    final = compiled.invoke(None, run_config("run-1"))
+
+    assert final["steps"] == ["first", "second"]
+    assert calls == ["first", "second", "second"]
+    assert checkpoint.checkpoint_path().exists()
+
+
+@pytest.mark.parametrize("report, cached", [
+    ('<testsuite><testcase classname="tests.test_calc" name="test_add"/></testsuite>', True),
+    ('<testsuite><testcase classname="tests.test_calc" name="test_add">'
+     '<failure message="AssertionError">tests/test_calc.py:5: AssertionError</failure></testcase></testsuite>', False),
+])
+def test_only_passing_full_test_runs_are_stored(report, cached, tmp_path, monkeypatch):
+    from agent import pipeline
+
+    repo = tmp_path / "calc"
+    repo.mkdir()
+    (repo / "calc.py").write_text("def add(a, b):\n    return a + b\n")
+
+    def fake_run_tests(repo_path, is_python, is_cpp, image=None, test_ids=None):
+        # failing tests do not fail the step, see run_tests
+        (repo / "report.xml").write_text(report)
+        return {"exit_code": 0, "stdout": "", "stderr": ""}
+    monkeypatch.setattr(pipeline, "run_tests", fake_run_tests)
+    monkeypatch.setattr(pipeline, "dependency_image", lambda repo_path: "ci-deps:abc")
+    monkeypatch.setattr(pipeline, "record_outcomes", lambda *args: None)
+
+    pipeline._run_tests_node({"repo_path": str(repo), "build_logs": {"exit_code": 0, "python_detected": True}})
+
+    assert (get_step_result(pipeline._tree_key(str(repo)), "tests") is not None) == cached
@@ -0,0 +1,59 @@
+from agent.clustering import cluster_errors, fingerprint, innermost_source_frame, normalize_message
+from agent.fixer import group_errors_by_file
+
+
+def _error(test_file, message, error_type="AssertionError"):
+    return {"test": f"{test_file}::t", "type": error_type, "message": message, "file": test_file, "line": 3}
+
+
+def test_normalize_message_strips_addresses_paths_and_numbers():
+    first = normalize_message(
+        "def test_a():\n>       assert parse(3) is None\n"
+        "E       AssertionError: <Node object at 0x7f3a2c> from /tmp/run_1/data.json line 42\n"
+    )
+    second = normalize_message(
+        "def test_b():\n>       assert parse(7) is None\n"
+        "E       AssertionError: <Node object at 0x10beef> from /tmp/run_9/other.json line 7\n"
+    )
+
+    assert first == second == "AssertionError: <Node object at <addr>> from <path> line <n>"
+    assert normalize_message("E   assert value_1() == 1") != normalize_message("E   assert value_2() == 2")
+
+
+def test_innermost_frame_skips_test_and_external_frames():
+    error = _error("tests/test_calc.py", (
+        "tests/test_calc.py:3: in test_add\n"
+        "/workspace/pkg/helpers.py:10: in convert\n"
+        "/usr/lib/python3.12/json/decoder.py:337: in decode\n"
+        "tests/conftest.py:5: ValueError"
+    ), "ValueError")
+
+    assert innermost_source_frame(error) == ("pkg/helpers.py", 10)
+    assert fingerprint(error) == "ValueError at pkg/helpers.py:10"
+
+
+def test_cluster_errors_groups_by_root_cause_with_samples():
+    helper = [
+        _error(f"tests/test_mod_{i}.py", f'File "/workspace/pkg/helpers.py", line 10, in convert\nE   KeyError: {i}',
+               "KeyError")
+        for i in range(400)
+    ]
+    own = _error("tests/test_other.py", "E       assert 1 == 2")
+
+    clusters = cluster_errors({"errors": helper + [own]}, max_samples=3)
+
+    assert len(clusters) == 2
+    samples = clusters["KeyError at pkg/helpers.py:10"]
+    assert [sample["file"] for sample in samples] == ["tests/test_mod_0.py", "tests/test_mod_1.py", "tests/test_mod_2.py"]
+    assert all(sample["cluster_size"] == 400 for sample in samples)
+    assert clusters["AssertionError: assert <n> == <n>"] == [own]
+    assert "cluster_size" not in helper[0]
+
+
+def test_group_errors_by_file_keeps_order():
+    errors = [_error("a.py", "x"), _error("b.py", "y"), _error("a.py", "z")]
+
+    grouped = group_errors_by_file(iter(errors))
+
+    assert [e["message"] for e in grouped["a.py"]] == ["x", "z"]
+    assert grouped["b.py"] == [errors[1]]
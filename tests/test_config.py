@@ -0,0 +1,29 @@
+import json
+
+from agent.config import AgentConfig
+from agent.pipeline import create_graph
+from agent.settings import LazySettings
+
+
+def test_settings_are_read_on_first_access(tmp_path, monkeypatch):
+    path = tmp_path / "settings.json"
+    monkeypatch.setenv("CI_AGENT_SETTINGS", str(path))
+    lazy = LazySettings()
+    path.write_text(json.dumps({"max_retries": 1}))
+
+    assert lazy["max_retries"] == 1
+    assert lazy.get("max_patches", 3) == 3
+
+    other = tmp_path / "other.json"
+    other.write_text(json.dumps({"max_retries": 7}))
+    lazy.load(other)
+    assert lazy["max_retries"] == 7
+
+
+def test_graph_is_built_without_creating_the_llm():
+    config = AgentConfig(model="gpt-test")
+
+    create_graph(config=config)
+
+    assert config._llm is None
+    assert AgentConfig(llm="fake").llm == "fake"
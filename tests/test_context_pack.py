@@ -0,0 +1,49 @@
+from agent.context_pack import build_context_pack
+from agent.repo_index import RepoIndex
+
+FILES = {
+    "logic/calc.py": "import math\n\n\ndef add(a, b):\n    return a + b + 1\n\n\ndef sub(a, b):\n    return a - b\n",
+    "logic/helpers.py": "def clamp(x):\n    return max(0, x)\n",
+    "tests/test_calc.py": "from logic.calc import add\n\n\ndef test_add():\n    assert add(2, 2) == 4\n\n\ndef test_other():\n    assert True\n",
+    "logic/calc.cpp": "#include \"calc.h\"\n\nint mul(int a, int b) {\n    return a * b + 1;\n}\n",
+    "tests/test_calc.cpp": "#include <gtest/gtest.h>\n\nTEST(Calc, Mul) {\n    EXPECT_EQ(mul(2, 2), 4);\n}\n",
+}
+
+
+def _repo(tmp_path):
+    for name, content in FILES.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    return str(tmp_path), RepoIndex(str(tmp_path))
+
+
+def test_context_pack_includes_test_function_and_called_definitions(tmp_path):
+    repo_path, index = _repo(tmp_path)
+    errors = [{"file": "tests/test_calc.py", "line": 5, "message": "tests/test_calc.py:5: AssertionError"}]
+
+    context, files = build_context_pack(repo_path, errors, index, budget_tokens=1000)
+
+    assert "--- tests/test_calc.py (lines 4-5, failing test) ---" in context
+    assert "--- logic/calc.py (lines 4-5, definition of add) ---" in context
+    assert "def sub" not in context
+    assert "test_other" not in context
+    assert files == ["tests/test_calc.py", "logic/calc.py"]
+
+def test_context_pack_finds_cpp_definitions(tmp_path):
+    repo_path, index = _repo(tmp_path)
+    errors = [{"file": "tests/test_calc.cpp", "line": 4, "message": "tests/test_calc.cpp:4: Failure"}]
+
+    context, files = build_context_pack(repo_path, errors, index, budget_tokens=1000)
+
+    assert "definition of mul" in context
+    assert "return a * b + 1;" in context
+
+def test_context_pack_respects_budget(tmp_path):
+    repo_path, index = _repo(tmp_path)
+    errors = [{"file": "tests/test_calc.py", "line": 5, "message": ""}]
+
+    context, files = build_context_pack(repo_path, errors, index, budget_tokens=30)
+
+    assert files == ["tests/test_calc.py"]
+    assert len(context) <= 120
@@ -1,6 +1,33 @@
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 from unittest.mock import patch, MagicMock
 from agent.docker_runner import *
+import agent.docker_runner as docker_runner
+from agent.log_parser import parse_test_logs
+from agent.docker_runner import _dependency_hash, _dockerfile_hash, _workers
+
+
+@pytest.fixture(autouse=True)
+def clear_workers():
+    _workers.clear()
+    docker_runner._ci_images_ready.clear()
+    yield
+    _workers.clear()
+    docker_runner._ci_images_ready.clear()
+
+
+@pytest.fixture(autouse=True)
+def stream_through_subprocess_run(monkeypatch):
+    # the streamed docker commands go through the mocked subprocess.run in these tests, see test_log_stream
+    monkeypatch.setattr(docker_runner, "_stream_command",
+                        lambda cmd, *args, cwd=None, **kwargs: subprocess.run(cmd, cwd=cwd, capture_output=True, text=True))
+
+
+def _mounted_repos(mock_run):
+    return [arg for call in mock_run.call_args_list for arg in call.args[0] if arg.endswith(":/workspace")]
 
 @patch("subprocess.run")
 @patch("pathlib.Path.joinpath")
@@ -22,7 +49,8 @@ def test_build_image(mock_joinpath, mock_run):
     command_list = args[0]
 
     assert "docker" in command_list
-    assert "tests/test_repo:/workspace" in command_list
+    assert "exec" in command_list
+    assert "tests/test_repo:/workspace" in _mounted_repos(mock_run)
 
     assert result["python_detected"] is True
     assert result["cpp_detected"] is False
@@ -38,7 +66,8 @@ def test_run_tests_python(mock_run):
     command_list = args[0]
     test_script = command_list[-1]
     assert "docker" in command_list
-    assert "tests/test_repo:/workspace" in command_list
+    assert "exec" in command_list
+    assert "tests/test_repo:/workspace" in _mounted_repos(mock_run)
     assert "pip install pytest" in test_script
     assert "pytest" in test_script
     assert result["exit_code"] == 0
@@ -53,7 +82,242 @@ def test_run_tests_cpp(mock_run):
     command_list = args[0]
     test_script = command_list[-1]
     assert "docker" in command_list
-    assert "tests/test_repo:/workspace" in command_list
+    assert "exec" in command_list
+    assert "tests/test_repo:/workspace" in _mounted_repos(mock_run)
     assert "ctest --output-on-failure" in test_script
     assert "pytest" not in test_script
-    assert result["exit_code"] == 0
\ No newline at end of file
+    assert result["exit_code"] == 0
+
+def test_dependency_hash_ignores_source_changes(tmp_path):
+    (tmp_path / "requirements.txt").write_text("requests\n")
+    (tmp_path / "app.py").write_text("x = 1\n")
+    before = _dependency_hash(str(tmp_path))
+
+    (tmp_path / "app.py").write_text("x = 2\n")
+    assert _dependency_hash(str(tmp_path)) == before
+
+    (tmp_path / "requirements.txt").write_text("requests\nnumpy\n")
+    assert _dependency_hash(str(tmp_path)) != before
+
+@patch("subprocess.run")
+def test_ensure_deps_image_reuses_existing(mock_run, tmp_path):
+    mock_run.return_value = MagicMock(returncode=0, stdout="", stderr="")
+
+    image = ensure_deps_image(str(tmp_path))
+
+    assert image.startswith("ci-deps:")
+    assert mock_run.call_count == 1
+    args, _ = mock_run.call_args
+    assert args[0][:3] == ["docker", "image", "inspect"]
+
+@patch("subprocess.run")
+def test_concurrent_pipelines_build_a_dependency_image_once(mock_run, tmp_path):
+    committed = []
+
+    def docker(cmd, **kwargs):
+        if cmd[1:3] == ["image", "inspect"]:
+            return MagicMock(returncode=0 if committed else 1, stdout="", stderr="")
+        if cmd[1] == "run":
+            time.sleep(0.1)
+        if cmd[1] == "commit":
+            committed.append(cmd)
+        return MagicMock(returncode=0, stdout="", stderr="")
+    mock_run.side_effect = docker
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        images = list(executor.map(lambda _: ensure_deps_image(str(tmp_path)), range(4)))
+
+    installs = [call.args[0] for call in mock_run.call_args_list if call.args[0][1] == "run"]
+    assert len(set(images)) == 1
+    assert len(installs) == 1 and len(committed) == 1
+    assert installs[0][installs[0].index("--name") + 1].startswith(f"ci-deps-build-{images[0].split(':')[1]}-")
+
+
+@patch("subprocess.run")
+def test_worker_is_reused_between_steps(mock_run):
+    mock_run.return_value = MagicMock(returncode=0, stdout="worker-id", stderr="")
+
+    run_tests("tests/test_repo", True, False, image="ci-deps:abc")
+    run_tests("tests/test_repo", True, False, image="ci-deps:abc")
+
+    started = [call for call in mock_run.call_args_list if call.args[0][:3] == ["docker", "run", "-d"]]
+    assert len(started) == 1
+    assert _workers["tests/test_repo"] == ("worker-id", "ci-deps:abc")
+
+    stop_worker("tests/test_repo")
+    assert "tests/test_repo" not in _workers
+
+@patch("subprocess.run")
+def test_ensure_ci_image_skips_build_when_label_matches(mock_run):
+    mock_run.return_value = MagicMock(returncode=0, stdout=_dockerfile_hash() + "\n", stderr="")
+
+    ensure_ci_image_exists()
+    ensure_ci_image_exists()
+
+    commands = [call.args[0] for call in mock_run.call_args_list]
+    assert len(commands) == 1
+    assert commands[0][:3] == ["docker", "image", "inspect"]
+
+@patch("subprocess.run")
+def test_ensure_ci_image_rebuilds_on_dockerfile_change(mock_run):
+    mock_run.return_value = MagicMock(returncode=0, stdout="outdated-hash", stderr="")
+
+    ensure_ci_image_exists()
+
+    args, kwargs = mock_run.call_args
+    assert args[0][:2] == ["docker", "build"]
+    assert f"ci.dockerfile.hash={_dockerfile_hash()}" in args[0]
+    assert kwargs["cwd"] == docker_runner.DOCKER_DIR
+
+@patch("agent.docker_runner.merge_reports")
+@patch("subprocess.run")
+def test_run_tests_reruns_only_given_tests(mock_run, mock_merge):
+    mock_run.return_value = MagicMock(returncode=0, stdout="worker-id", stderr="")
+
+    run_tests("tests/test_repo", True, False, image="ci-deps:abc",
+              test_ids=["tests/test_net.py::TestClient::test_fetch"])
+
+    test_script = mock_run.call_args.args[0][-1]
+    assert "--junitxml=rerun.xml tests/test_net.py::TestClient::test_fetch" in test_script
+    mock_merge.assert_called_once_with("tests/test_repo", "rerun.xml")
+
+@patch("agent.docker_runner.merge_reports")
+@patch("subprocess.run")
+def test_run_tests_reruns_only_given_ctest_tests(mock_run, mock_merge):
+    mock_run.return_value = MagicMock(returncode=0, stdout="worker-id", stderr="")
+
+    run_tests("tests/test_repo", False, True, image="ci-deps:abc", test_ids=["CalcAddTest::CalcAddTest"])
+
+    test_script = mock_run.call_args.args[0][-1]
+    assert "-R '^(CalcAddTest)$'" in test_script
+
+@patch("subprocess.run")
+def test_run_tests_python_shards(mock_run, tmp_path):
+    def run_side_effect(cmd, **kwargs):
+        if "--collect-only" in cmd[-1]:
+            return MagicMock(returncode=0, stdout="t.py::a\nt.py::b\nt.py::c\n\n3 tests collected", stderr="")
+        if "report_shard_" in cmd[-1]:
+            shard = cmd[-1].split("report_shard_")[1].split(".xml")[0]
+            (tmp_path / f"report_shard_{shard}.xml").write_text(
+                f'<testsuites><testsuite><testcase classname="t" name="shard{shard}" /></testsuite></testsuites>')
+        return MagicMock(returncode=0, stdout="worker-id", stderr="")
+    mock_run.side_effect = run_side_effect
+
+    result = run_tests(str(tmp_path), True, False, image="ci-deps:abc", shards=2)
+
+    shard_scripts = [call.args[0][-1] for call in mock_run.call_args_list if "report_shard_" in call.args[0][-1]]
+    assert len(shard_scripts) == 2
+    assert result["exit_code"] == 0
+    assert (tmp_path / "report.xml").read_text().count("<testcase") == 2
+    assert not (tmp_path / ".ci_shards").exists()
+
+
+@patch("subprocess.run")
+def test_shard_without_report_fails_the_test_step(mock_run, tmp_path):
+    def run_side_effect(cmd, **kwargs):
+        if "--collect-only" in cmd[-1]:
+            return MagicMock(returncode=0, stdout="t.py::a\nt.py::b\n\n2 tests collected", stderr="")
+        if "report_shard_0" in cmd[-1]:
+            (tmp_path / "report_shard_0.xml").write_text(
+                '<testsuites><testsuite><testcase classname="t" name="a" /></testsuite></testsuites>')
+        # shard 1 crashes before writing its report, and `|| true` hides the exit code of pytest
+        return MagicMock(returncode=0, stdout="worker-id", stderr="")
+    mock_run.side_effect = run_side_effect
+
+    result = run_tests(str(tmp_path), True, False, image="ci-deps:abc", shards=2)
+
+    shard_scripts = [call.args[0][-1] for call in mock_run.call_args_list if "report_shard_" in call.args[0][-1]]
+    assert not any("@.ci_shards" in script for script in shard_scripts)
+    assert result["exit_code"] == 1
+    assert [error["test"] for error in parse_test_logs(str(tmp_path))["errors"]] == ["report_shard_1::report"]
+
+@patch("subprocess.run")
+def test_cpp_worker_mounts_build_and_ccache_volumes(mock_run, tmp_path):
+    (tmp_path / "CMakeLists.txt").write_text("project(calc)\n")
+    mock_run.return_value = MagicMock(returncode=0, stdout="worker-id", stderr="")
+
+    build_image(str(tmp_path))
+
+    run_command = next(call.args[0] for call in mock_run.call_args_list if call.args[0][:3] == ["docker", "run", "-d"])
+    volumes = [run_command[i + 1] for i, arg in enumerate(run_command) if arg == "-v"]
+    assert any(volume.startswith("ci-build-") and volume.endswith(":/build") for volume in volumes)
+    assert any(volume.startswith("ci-ccache-") and volume.endswith(":/ccache") for volume in volumes)
+    build_script = mock_run.call_args.args[0][-1]
+    assert "cmake --build /build -j $(nproc)" in build_script
+    assert "CMAKE_CXX_COMPILER_LAUNCHER=ccache" in build_script
+    assert "-G Ninja" in build_script
+
+@patch("subprocess.run")
+def test_configured_in_tree_build_dir(mock_run, tmp_path, monkeypatch):
+    monkeypatch.setitem(docker_runner.settings, "cpp_build", {"build_dir": "build", "jobs": 4, "ccache": False})
+    (tmp_path / "CMakeLists.txt").write_text("project(calc)\n")
+    mock_run.return_value = MagicMock(returncode=0, stdout="worker-id", stderr="")
+
+    build_image(str(tmp_path))
+    run_command = next(call.args[0] for call in mock_run.call_args_list if call.args[0][:3] == ["docker", "run", "-d"])
+    run_tests(str(tmp_path), False, True, image="ci-deps:abc")
+
+    assert not any(arg.startswith(("ci-build-", "ci-ccache-")) for arg in run_command)
+    test_script = mock_run.call_args.args[0][-1]
+    assert "cd build;" in test_script
+    assert "--output-junit /workspace/report.xml" in test_script
+
+def test_ccache_is_shared_by_clones_and_build_volume_removed_on_stop(tmp_path):
+    clones = []
+    for name in ("calc_1", "calc_2"):
+        clone = tmp_path / name
+        clone.mkdir()
+        (clone / "CMakeLists.txt").write_text("project(calc)\n")
+        subprocess.run(["git", "init", "-q"], cwd=clone)
+        subprocess.run(["git", "remote", "add", "origin", "https://example.com/calc.git"], cwd=clone)
+        clones.append(str(clone))
+
+    with patch("subprocess.run") as mock_run:
+        mock_run.return_value = MagicMock(returncode=0, stdout="worker-id", stderr="")
+        mounts = [docker_runner._cache_mounts(clone) for clone in clones]
+        DockerBackend().stop(clones[0])
+
+    ccache = [next(arg for arg in m if arg.endswith(":/ccache")) for m in mounts]
+    builds = [next(arg for arg in m if arg.endswith(":/build")) for m in mounts]
+    assert ccache[0] == ccache[1]
+    assert builds[0] != builds[1]
+    assert ["docker", "volume", "rm", "-f", builds[0].split(":")[0]] in [c.args[0] for c in mock_run.call_args_list]
+
+
+def test_sandbox_build_is_seeded_from_the_repo(tmp_path):
+    repo, sandbox = tmp_path / "calc", tmp_path / "calc_1_0"
+    for path in (repo, sandbox):
+        path.mkdir()
+        (path / "CMakeLists.txt").write_text("project(calc)\n")
+    docker_runner._ci_images_ready.add(None)
+
+    with patch("subprocess.run") as mock_run:
+        mock_run.return_value = MagicMock(returncode=0, stdout="", stderr="")
+        DockerBackend().seed(str(sandbox), str(repo))
+        mounts = docker_runner._cache_mounts(str(sandbox))
+        DockerBackend().stop(str(sandbox))
+
+    copy = next(c.args[0] for c in mock_run.call_args_list if "cp" in c.args[0])
+    assert f"{docker_runner._build_volume(str(repo))}:/from:ro" in copy
+    assert f"{docker_runner._build_volume(str(sandbox))}:/to" in copy
+    assert f"ci-ccache-{docker_runner._ccache_key(str(repo))}:/ccache" in mounts
+    assert str(sandbox) not in docker_runner._seed_sources
+
+
+@patch("subprocess.run")
+def test_timed_out_step_is_killed_without_its_worker(mock_run, monkeypatch):
+    mock_run.return_value = MagicMock(returncode=0, stdout="worker-id", stderr="")
+
+    def time_out(cmd, path, timeout=None, on_timeout=None, cwd=None):
+        on_timeout()
+        return subprocess.CompletedProcess(cmd, 124, "", "Timed out")
+    monkeypatch.setattr(docker_runner, "_stream_command", time_out)
+
+    result = docker_runner._exec("tests/test_repo", "ci-deps:abc", "sleep 600", "test")
+
+    commands = [call.args[0] for call in mock_run.call_args_list]
+    kill = commands[-1]
+    assert result.returncode == 124
+    assert kill[:3] == ["docker", "exec", "worker-id"] and "kill -KILL -- -$(cat /tmp/ci-step-" in kill[-1]
+    assert ["docker", "rm", "-f", "worker-id"] not in commands
+    assert _workers["tests/test_repo"][0] == "worker-id"
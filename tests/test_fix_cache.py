@@ -0,0 +1,51 @@
+import pytest
+
+from agent.fix_cache import cache_key, content_hash, get_cached_fix, store_fix
+from agent.settings import settings
+
+ERRORS = [{"type": "AssertionError", "message": "assert 3 == 4", "file": "tests/test_calc.py", "line": 5}]
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setitem(settings, "fix_cache", {"enabled": True, "path": str(tmp_path / "cache.sqlite")})
+    repo_path = tmp_path / "repo"
+    (repo_path / "tests").mkdir(parents=True)
+    (repo_path / "logic").mkdir()
+    (repo_path / "tests" / "test_calc.py").write_text("assert add(2, 2) == 4\n")
+    (repo_path / "logic" / "calc.py").write_text("def add(a, b):\n    return a + b + 1\n")
+    return repo_path
+
+
+def test_cache_hit_for_same_errors_and_files(repo):
+    key = cache_key(str(repo), ERRORS, "prompt")
+    fixes = {"logic/calc.py": "def add(a, b):\n    return a + b\n"}
+    store_fix(key, fixes, {"logic/calc.py": content_hash((repo / "logic" / "calc.py").read_text())})
+
+    assert get_cached_fix(key, str(repo)) == fixes
+
+def test_cache_miss_when_error_file_changes(repo):
+    key = cache_key(str(repo), ERRORS, "prompt")
+    (repo / "tests" / "test_calc.py").write_text("assert add(2, 3) == 5\n")
+
+    assert cache_key(str(repo), ERRORS, "prompt") != key
+    assert cache_key(str(repo), ERRORS, "other prompt") != cache_key(str(repo), ERRORS, "prompt")
+
+def test_cache_miss_when_read_file_changes(repo):
+    key = cache_key(str(repo), ERRORS, "prompt")
+    store_fix(key, {"logic/calc.py": "fixed"}, {"logic/calc.py": content_hash((repo / "logic" / "calc.py").read_text())})
+
+    (repo / "logic" / "calc.py").write_text("def add(a, b):\n    return a - b\n")
+
+    assert get_cached_fix(key, str(repo)) is None
+
+def test_cache_evicts_least_recently_used(repo, monkeypatch):
+    monkeypatch.setitem(settings["fix_cache"], "max_bytes", 70)
+    store_fix("old", {"a.py": "x" * 20}, {})
+    store_fix("recent", {"b.py": "y" * 20}, {})
+    get_cached_fix("old", str(repo))
+    store_fix("new", {"c.py": "z" * 20}, {})
+
+    assert get_cached_fix("recent", str(repo)) is None
+    assert get_cached_fix("old", str(repo)) is not None
+    assert get_cached_fix("new", str(repo)) is not None
@@ -0,0 +1,197 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from agent import fixer
+from agent.fixer import _parse_fix_response, _resolve_fixes, _validated_fixes
+from agent.rate_limit import RateLimiter
+from agent.repo_index import RepoIndex
+from agent.settings import settings
+
+RESPONSE = """The bug is in add.
+
+SOURCE_FILE: logic/calc.py
+EDITS:
+    <<<<<<< SEARCH
+        return a + b + 1
+    =======
+        return a + b
+    >>>>>>> REPLACE
+
+SOURCE_FILE: logic/broken.py
+EDITS:
+<<<<<<< SEARCH
+    return missing
+=======
+    return found
+>>>>>>> REPLACE
+
+SOURCE_FILE: logic/new.py
+FIXED_CODE:
+```python
+X = 1
+```
+"""
+
+
+def test_resolve_fixes_applies_edits_and_reports_conflicts(tmp_path):
+    (tmp_path / "logic").mkdir()
+    (tmp_path / "logic" / "calc.py").write_text("def add(a, b):\n    return a + b + 1\n")
+    (tmp_path / "logic" / "broken.py").write_text("def f():\n    return other\n")
+
+    fixes, conflicts = _resolve_fixes(str(tmp_path), _parse_fix_response(RESPONSE))
+
+    assert fixes["logic/calc.py"] == "def add(a, b):\n    return a + b\n"
+    assert fixes["logic/new.py"] == "X = 1"
+    assert list(conflicts) == ["logic/broken.py"]
+
+
+class _ScriptedAgent:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+
+    async def ainvoke(self, state):
+        self.prompts.append(state["messages"][-1][1])
+        return {"messages": state["messages"] + [SimpleNamespace(type="ai", content=self.replies.pop(0),
+                                                                   usage_metadata=None)]}
+
+
+def _index(tmp_path):
+    (tmp_path / "calc.py").write_text("def add(a, b):\n    return a - b\n")
+    return RepoIndex(str(tmp_path))
+
+
+def test_validated_fixes_reprompts_with_the_validator_error(tmp_path):
+    agent = _ScriptedAgent(["SOURCE_FILE: calc.py\nFIXED_CODE:\n```python\ndef add(a, b):\n    return a + b\n```"])
+
+    fixes = asyncio.run(_validated_fixes(agent, [], str(tmp_path), {"calc.py": "def add(a, b)\n    return a + b\n"},
+                                         _index(tmp_path)))
+
+    assert fixes == {"calc.py": "def add(a, b):\n    return a + b"}
+    assert "calc.py: line 1" in agent.prompts[0]
+
+
+def test_validated_fixes_drops_files_still_rejected(tmp_path, monkeypatch):
+    monkeypatch.setitem(settings, "validation", {"max_reprompts": 1})
+    agent = _ScriptedAgent(["SOURCE_FILE: calc.py\nFIXED_CODE:\n```python\ndef add(\n```"])
+
+    fixes = asyncio.run(_validated_fixes(agent, [], str(tmp_path), {"calc.py": "def add(\n", "new.py": "X = 1\n"},
+                                         _index(tmp_path)))
+
+    assert fixes == {"new.py": "X = 1\n"}
+    assert len(agent.prompts) == 1
+
+
+CALC = "def add(a, b):\n    return a - b\n\n\ndef pad():\n    pass\n\n\n\ndef mul(a, b):\n    return a + b\n"
+
+
+def _two_clusters(tmp_path, monkeypatch, fixes_by_frame):
+    (tmp_path / "calc.py").write_text(CALC)
+    errors = [
+        {"test": f"tests/test_calc.py::test_{name}", "type": "AssertionError", "file": "tests/test_calc.py", "line": 1,
+         "message": f"calc.py:{line}: in {name}\nE   AssertionError"}
+        for name, line in (("add", 2), ("mul", 11))
+    ]
+    requests = []
+
+    async def fake_propose(llm, repo_path, errors, repo_index, limiter, use_cache=True, prompt_suffix=""):
+        requests.append([error["test"] for error in errors])
+        key = tuple(sorted(error["message"].split(":")[1] for error in errors))
+        return fixes_by_frame[key]
+    monkeypatch.setattr(fixer, "_traced_propose_fix", fake_propose)
+    fixes = asyncio.run(fixer.propose_fix_async(None, str(tmp_path), {"errors": errors}, use_cache=False))
+    return fixes, requests
+
+
+def test_fixes_of_one_file_from_two_clusters_are_merged(tmp_path, monkeypatch):
+    fixes, requests = _two_clusters(tmp_path, monkeypatch, {
+        ("2",): {"calc.py": CALC.replace("a - b", "a + b")},
+        ("11",): {"calc.py": CALC.replace("return a + b\n", "return a * b\n")},
+    })
+
+    assert len(requests) == 2
+    assert fixes == {"calc.py": "def add(a, b):\n    return a + b\n\n\ndef pad():\n    pass\n\n\n\n"
+                                "def mul(a, b):\n    return a * b\n"}
+
+
+def test_conflicting_fixes_of_two_clusters_are_requested_again_together(tmp_path, monkeypatch):
+    merged = {"calc.py": "def add(a, b):\n    return a + b\n"}
+    fixes, requests = _two_clusters(tmp_path, monkeypatch, {
+        ("2",): {"calc.py": CALC.replace("a - b", "b + a")},
+        ("11",): {"calc.py": CALC.replace("a - b", "a + b")},
+        ("11", "2"): merged,
+    })
+
+    assert fixes == merged
+    assert sorted(requests[-1]) == ["tests/test_calc.py::test_add", "tests/test_calc.py::test_mul"]
+
+
+def test_cancelled_wait_for_an_llm_slot_does_not_leak_it():
+    class Agent:
+        async def ainvoke(self, state):
+            return {"messages": []}
+
+    async def scenario():
+        fixer.set_max_llm_calls(1)
+        slots = fixer._llm_slots
+        slots.acquire()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(fixer._ainvoke(Agent(), []), 0.1)
+        slots.release()
+        await asyncio.sleep(0.2)
+        # the slot is free again: a leaked acquire would block this call
+        await asyncio.wait_for(fixer._ainvoke(Agent(), []), 1)
+        assert slots.acquire(blocking=False)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        fixer.set_max_llm_calls(None)
+
+
+def test_llm_timeout_does_not_count_the_wait_for_the_limiter(monkeypatch):
+    monkeypatch.setitem(settings, "llm", {"timeout_seconds": 0.3})
+
+    def model(seconds):
+        async def call(request):
+            await asyncio.sleep(seconds)
+            return AIMessage(content="done")
+        return call
+
+    async def queued_call(limiter, handler):
+        async with limiter:
+            return await fixer._llm_call_middleware(limiter).awrap_model_call(
+                SimpleNamespace(system_message=None, messages=[("user", "fix it")]), handler)
+
+    async def scenario():
+        # one request per 0.2s: the last call waits 0.4s for the limiter and its budget, and still succeeds
+        limiter = RateLimiter(1, requests_per_minute=300)
+        limiter._requests.capacity = limiter._requests.tokens = 1
+        await asyncio.gather(*(queued_call(limiter, model(0.1)) for _ in range(3)))
+        with pytest.raises(asyncio.TimeoutError):
+            await queued_call(limiter, model(1))
+
+    asyncio.run(scenario())
+
+
+def test_every_model_call_is_charged_with_its_token_usage():
+    limiter = RateLimiter(1, requests_per_minute=60, tokens_per_minute=6000)
+    middleware = fixer._llm_call_middleware(limiter)
+
+    async def model(request):
+        return AIMessage(content="done", usage_metadata={"input_tokens": 100, "output_tokens": 900,
+                                                        "total_tokens": 1000})
+
+    async def agent_run():
+        # a tool turn makes the agent call the model twice in one run
+        for _ in range(2):
+            await middleware.awrap_model_call(SimpleNamespace(system_message=None, messages=[("user", "x" * 400)]),
+                                              model)
+
+    asyncio.run(agent_run())
+
+    assert limiter._requests.tokens == pytest.approx(58, abs=0.1)
+    assert limiter._tokens.tokens == pytest.approx(4000, abs=1)
@@ -1,7 +1,11 @@
+import subprocess
+from pathlib import Path
+
 import pytest
 from unittest.mock import patch, MagicMock
 
 from agent.git_ops import *
+from agent.settings import settings
 
 
 @patch("subprocess.run")
@@ -18,3 +22,72 @@ def test_clone_repo(mock_mkdir, mock_run, tmp_path):
     assert repo_url in command_list
     assert result_path.endswith("GraphEngine_1") is True
 
+
+def _git(*args, cwd=None):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch):
+    monkeypatch.setattr("agent.git_ops.BASE_DIR", tmp_path / "base")
+    monkeypatch.setattr("agent.git_ops.MIRRORS_DIR", tmp_path / "base" / "repos" / ".mirrors")
+    (tmp_path / "base").mkdir()
+    work = tmp_path / "work"
+    work.mkdir()
+    _git("init", "-q", "-b", "main", cwd=work)
+    (work / "calc.py").write_text("VERSION = 1\n")
+    _git("add", ".", cwd=work)
+    _git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "v1", cwd=work)
+    first = _git("rev-parse", "HEAD", cwd=work)
+    (work / "calc.py").write_text("VERSION = 2\n")
+    _git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qam", "v2", cwd=work)
+    url = str(tmp_path / "calc.git")
+    _git("clone", "-q", "--bare", str(work), url)
+    return url, first
+
+
+def test_clone_repo_reuses_mirror(upstream):
+    url, _ = upstream
+
+    first = Path(clone_repo(url))
+    second = Path(clone_repo(url))
+
+    assert first.name == "calc_1" and second.name == "calc_2"
+    assert (second / "calc.py").read_text() == "VERSION = 2\n"
+    mirrors = list(mirror_dir.name for mirror_dir in (first.parent / ".mirrors").iterdir())
+    assert len(mirrors) == 1
+    alternates = (second / ".git" / "objects" / "info" / "alternates").read_text()
+    assert ".mirrors" in alternates
+
+
+def test_clone_repo_checks_out_commit(upstream):
+    url, first_commit = upstream
+
+    target = Path(clone_repo(url, first_commit))
+
+    assert (target / "calc.py").read_text() == "VERSION = 1\n"
+
+
+def test_mirror_is_never_garbage_collected(upstream):
+    url, _ = upstream
+
+    mirror = update_mirror(url)
+
+    assert _git("config", "gc.auto", cwd=mirror) == "0"
+    assert _git("config", "gc.pruneExpire", cwd=mirror) == "never"
+
+
+def test_shallow_clone_without_mirror_fetches_the_commit(upstream, monkeypatch):
+    url, first_commit = upstream
+    monkeypatch.setitem(settings, "clone", {"mirror_cache": False, "depth": 1})
+
+    target = Path(clone_repo(f"file://{url}", first_commit))
+
+    assert (target / "calc.py").read_text() == "VERSION = 1\n"
+    with pytest.raises(Exception, match="full commit hash"):
+        clone_repo(f"file://{url}", first_commit[:10])
+
+
+def test_clone_repo_failure_raises(upstream, tmp_path):
+    with pytest.raises(Exception, match="git clone --mirror failed"):
+        clone_repo(str(tmp_path / "missing.git"))
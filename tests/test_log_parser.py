@@ -1,4 +1,18 @@
-from agent.log_parser import parse_test_logs
+from agent.log_parser import parse_test_logs, merge_reports, combine_reports, parse_test_durations, iter_test_errors
+
+REPORT = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites><testsuite name="pytest">
+<testcase classname="tests.test_net.TestClient" name="test_fetch"><failure message="boom">tests/test_net.py:7: ConnectionError</failure></testcase>
+<testcase classname="tests.test_net" name="test_parse"><failure message="bad">tests/test_net.py:12: AssertionError</failure></testcase>
+<testcase classname="tests.test_net" name="test_ok" />
+</testsuite></testsuites>
+"""
+
+RERUN = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites><testsuite name="pytest">
+<testcase classname="tests.test_net.TestClient" name="test_fetch" />
+</testsuite></testsuites>
+"""
 
 def test_parse_simple_failure():
     log_output = """
@@ -79,3 +93,52 @@ FAILED examples/calc_app/tests/test_calc.py::test_add - assert 3 == 4
     error_entry = next((e for e in result["errors"] if e["type"] == "AssertionError" and e["file"] == "examples/calc_app/tests/test_calc.py"), None)
     assert error_entry is not None
     assert error_entry["line"] == 5
+
+
+def test_failing_tests_are_pytest_node_ids(tmp_path):
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "test_net.py").write_text("")
+    (tmp_path / "report.xml").write_text(REPORT)
+
+    result = parse_test_logs(str(tmp_path))
+
+    assert result["failing_tests"] == ["tests/test_net.py::TestClient::test_fetch", "tests/test_net.py::test_parse"]
+
+def test_merge_reports_replaces_rerun_results(tmp_path):
+    (tmp_path / "report.xml").write_text(REPORT)
+    (tmp_path / "rerun.xml").write_text(RERUN)
+
+    merge_reports(str(tmp_path), "rerun.xml")
+    result = parse_test_logs(str(tmp_path))
+
+    assert not (tmp_path / "rerun.xml").exists()
+    assert result["failing_tests"] == ["tests.test_net::test_parse"]
+    assert len(result["errors"]) == 1
+
+def test_combine_reports_merges_shards(tmp_path):
+    (tmp_path / "report_shard_0.xml").write_text(REPORT)
+    (tmp_path / "report_shard_1.xml").write_text(RERUN.replace("test_fetch", "test_other"))
+
+    combine_reports(str(tmp_path), ["report_shard_0.xml", "report_shard_1.xml"])
+    result = parse_test_logs(str(tmp_path))
+
+    assert not (tmp_path / "report_shard_0.xml").exists()
+    assert len(result["failing_tests"]) == 2
+    assert len(parse_test_durations(str(tmp_path))) == 4
+
+def test_iter_test_errors_truncates_long_messages(tmp_path):
+    captured = "x" * 10000
+    (tmp_path / "report.xml").write_text(
+        f'<testsuites><testsuite><testcase classname="t" name="test_big">'
+        f'<failure message="m">{captured}\ntests/test_big.py:3: AssertionError</failure></testcase>'
+        f'<testcase classname="t" name="test_ok" /></testsuite></testsuites>')
+
+    errors = iter_test_errors(str(tmp_path), max_message_chars=200)
+    error = next(errors)
+
+    assert len(error["message"]) < 300
+    assert "characters truncated" in error["message"]
+    assert error["message"].endswith("AssertionError")
+    assert error["file"] == "tests/test_big.py"
+    assert error["line"] == 3
+    assert next(errors, None) is None
@@ -0,0 +1,43 @@
+import sys
+
+from agent.log_stream import TIMEOUT_EXIT_CODE, RotatingLog, stream_command
+
+
+def test_output_is_logged_and_only_the_tail_kept(tmp_path):
+    log = RotatingLog(tmp_path / "test.log", max_bytes=1024 * 1024, backups=1)
+    script = "import sys\nfor i in range(1000): print(f'line {i}')\nprint('oops', file=sys.stderr)"
+
+    result = stream_command([sys.executable, "-c", script], log, tail_lines=10)
+    log.close()
+
+    assert result.returncode == 0
+    assert result.stdout.splitlines() == [f"line {i}" for i in range(990, 1000)]
+    assert result.stderr == "oops\n"
+    logged = (tmp_path / "test.log").read_text()
+    assert "line 0\n" in logged and "line 999\n" in logged and "oops\n" in logged
+
+
+def test_log_is_rotated(tmp_path):
+    log = RotatingLog(tmp_path / "build.log", max_bytes=100, backups=2)
+    for i in range(5):
+        log.write(f"{i}" * 60 + "\n")
+    log.close()
+
+    assert (tmp_path / "build.log").read_text() == "4" * 60 + "\n"
+    assert (tmp_path / "build.log.1").read_text() == "3" * 60 + "\n"
+    assert (tmp_path / "build.log.2").read_text() == "2" * 60 + "\n"
+    assert not (tmp_path / "build.log.3").exists()
+
+
+def test_timeout_kills_the_step(tmp_path):
+    log = RotatingLog(tmp_path / "test.log", max_bytes=1024, backups=0)
+    killed = []
+
+    result = stream_command(["bash", "-c", "echo started; sleep 30"], log, timeout=0.5,
+                            on_timeout=lambda: killed.append(True))
+    log.close()
+
+    assert result.returncode == TIMEOUT_EXIT_CODE
+    assert killed == [True]
+    assert result.stdout == "started\n"
+    assert "Timed out after 0.5s" in result.stderr
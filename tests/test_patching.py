@@ -0,0 +1,53 @@
+import pytest
+
+from agent.patching import PatchConflictError, apply_edit_blocks, parse_edit_blocks
+
+ORIGINAL = """def add(a, b):
+    return a + b + 1
+
+
+def sub(a, b):
+    return a - b
+"""
+
+
+def test_parse_edit_blocks():
+    text = """SOURCE_FILE: logic/calc.py
+EDITS:
+<<<<<<< SEARCH
+    return a + b + 1
+=======
+    return a + b
+>>>>>>> REPLACE
+"""
+
+    assert parse_edit_blocks(text) == [("    return a + b + 1\n", "    return a + b\n")]
+
+def test_apply_exact_edit():
+    patched = apply_edit_blocks(ORIGINAL, [("    return a + b + 1\n", "    return a + b\n")])
+
+    assert patched == ORIGINAL.replace("a + b + 1", "a + b")
+
+def test_apply_edit_with_indentation_shift():
+    search = "        def add(a, b):\n            return a + b + 1\n"
+    replace = "        def add(a, b):\n            return a + b\n"
+
+    patched = apply_edit_blocks(ORIGINAL, [(search, replace)])
+
+    assert patched == ORIGINAL.replace("a + b + 1", "a + b")
+
+def test_apply_edit_ignores_trailing_whitespace():
+    patched = apply_edit_blocks(ORIGINAL, [("def sub(a, b):  \n    return a - b\n", "def sub(a, b):\n    return b - a\n")])
+
+    assert "return b - a" in patched
+
+def test_ambiguous_edit_conflicts():
+    with pytest.raises(PatchConflictError, match="matches 2 places"):
+        apply_edit_blocks(ORIGINAL, [("(a, b):\n", "(x, y):\n")])
+
+def test_missing_edit_conflicts():
+    with pytest.raises(PatchConflictError, match="does not match"):
+        apply_edit_blocks(ORIGINAL, [("    return a * b\n", "    return a / b\n")])
+
+def test_empty_search_creates_new_file():
+    assert apply_edit_blocks("", [("", "X = 1\n")]) == "X = 1\n"
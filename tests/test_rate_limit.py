@@ -0,0 +1,82 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from agent.fixer import _ainvoke_with_backoff
+from agent.rate_limit import RateLimiter, TokenBucket, backoff_delay, is_rate_limit_error
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FlakyAgent:
+    def __init__(self, failures: int, exc: Exception):
+        self.failures = failures
+        self.exc = exc
+        self.calls = 0
+
+    async def ainvoke(self, payload):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.exc
+        return {"messages": ["done"]}
+
+
+def test_token_bucket_throttles_after_capacity():
+    async def take():
+        bucket = TokenBucket(per_minute=600, capacity=2)
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(take()) >= 0.09
+
+def test_rate_limiter_bounds_concurrency():
+    running = 0
+    peak = 0
+
+    async def job(limiter):
+        nonlocal running, peak
+        async with limiter:
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def main():
+        limiter = RateLimiter(max_concurrency=2)
+        await asyncio.gather(*(job(limiter) for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2
+
+def test_backoff_delay_honors_retry_after():
+    class Response:
+        headers = {"retry-after": "3"}
+
+    exc = RateLimitError()
+    exc.response = Response()
+
+    assert is_rate_limit_error(exc)
+    assert backoff_delay(0, exc) == 3.0
+    assert 2.0 <= backoff_delay(2) <= 4.0
+
+@patch("agent.fixer.backoff_delay", return_value=0)
+def test_ainvoke_retries_rate_limited_calls(mock_delay):
+    agent = FlakyAgent(failures=2, exc=RateLimitError())
+
+    response = asyncio.run(_ainvoke_with_backoff(agent, [("user", "prompt")]))
+
+    assert response == {"messages": ["done"]}
+    assert agent.calls == 3
+
+def test_ainvoke_does_not_retry_other_errors():
+    agent = FlakyAgent(failures=1, exc=ValueError("bad request"))
+
+    with pytest.raises(ValueError):
+        asyncio.run(_ainvoke_with_backoff(agent, [("user", "prompt")]))
+    assert agent.calls == 1
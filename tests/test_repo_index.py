@@ -0,0 +1,56 @@
+import subprocess
+
+from agent.repo_index import RepoIndex, get_repo_index, drop_repo_index
+
+
+def _write(root, files):
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
+def test_index_honors_gitignore(tmp_path):
+    _write(tmp_path, {
+        ".gitignore": "build/\n",
+        "logic/calc.py": "",
+        "build/generated.cpp": "",
+        "node_modules/lib.c": "",
+    })
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+
+    index = RepoIndex(str(tmp_path))
+
+    assert "logic/calc.py" in index.files
+    assert "build/generated.cpp" not in index.files
+
+def test_index_walk_skips_vendored_dirs(tmp_path, monkeypatch):
+    _write(tmp_path, {"logic/calc.py": "", "node_modules/lib.c": "", ".venv/site.py": ""})
+    monkeypatch.setenv("GIT_DIR", str(tmp_path / "missing"))
+
+    index = RepoIndex(str(tmp_path))
+
+    assert index.source_files() == ["logic/calc.py"]
+
+def test_invalidate_tracks_patched_paths(tmp_path):
+    _write(tmp_path, {"logic/calc.py": ""})
+    index = get_repo_index(str(tmp_path))
+
+    _write(tmp_path, {"logic/new.py": ""})
+    (tmp_path / "logic" / "calc.py").unlink()
+    index.invalidate(["logic/new.py", "logic/calc.py"])
+
+    assert get_repo_index(str(tmp_path)) is index
+    assert index.source_files() == ["logic/new.py"]
+    drop_repo_index(str(tmp_path))
+    assert get_repo_index(str(tmp_path)) is not index
+
+def test_relevant_paths_ranks_code_under_test_first(tmp_path):
+    files = {f"pkg{i}/module_{i}.py": "" for i in range(20)}
+    files.update({"tests/test_calc.py": "", "logic/calc.py": "", "logic/helpers.py": "", "docs/conf.py": ""})
+    _write(tmp_path, files)
+    errors = [{"file": "tests/test_calc.py", "message": "logic/helpers.py:3: in clamp"}]
+
+    paths = RepoIndex(str(tmp_path)).relevant_paths(errors, limit=3)
+
+    assert paths == ["logic/calc.py", "logic/helpers.py", "tests/test_calc.py"]
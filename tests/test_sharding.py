@@ -0,0 +1,21 @@
+from agent.sharding import split_into_shards
+
+
+def test_split_round_robin_without_history():
+    shards = split_into_shards(["a", "b", "c", "d", "e"], 2)
+
+    assert shards == [["a", "c", "e"], ["b", "d"]]
+
+def test_split_balances_by_duration():
+    durations = {"slow": 10.0, "medium": 6.0, "fast_1": 2.0, "fast_2": 2.0}
+
+    shards = split_into_shards(["fast_1", "slow", "fast_2", "medium"], 2, durations)
+
+    loads = sorted(sum(durations[test_id] for test_id in shard) for shard in shards)
+    assert loads == [10.0, 10.0]
+
+def test_split_never_returns_empty_shards():
+    shards = split_into_shards(["a", "b"], 8, {"a": 1.0})
+
+    assert len(shards) == 2
+    assert sorted(test_id for shard in shards for test_id in shard) == ["a", "b"]
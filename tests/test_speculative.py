@@ -0,0 +1,132 @@
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from agent import speculative
+from agent.backends import ExecutionBackend
+from agent.speculative import propose_speculative_fix
+
+PASSING = '<testsuite><testcase classname="tests.test_calc" name="test_add"/></testsuite>'
+FAILING = ('<testsuite><testcase classname="tests.test_calc" name="test_add">'
+           '<failure message="AssertionError">tests/test_calc.py:5: AssertionError</failure></testcase></testsuite>')
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setattr(speculative, "BASE_DIR", tmp_path / "base")
+    repo = tmp_path / "calc"
+    (repo / "tests").mkdir(parents=True)
+    (repo / "calc.py").write_text("def add(a, b):\n    return a - b\n")
+    (repo / "tests" / "test_calc.py").write_text("")
+    return repo
+
+
+def _fake_candidates(fixes_by_candidate):
+    async def fake_propose(llm, repo_path, test_results, use_cache=True, limiter=None, prompt_suffix=""):
+        candidate = int(prompt_suffix.split("candidate ")[1].split()[0]) - 1 if prompt_suffix else 0
+        return fixes_by_candidate[candidate]
+    return fake_propose
+
+
+def _fake_run_tests(repo_path, is_python, is_cpp, image=None, test_ids=None, shards=None):
+    passing = "a + b" in (Path(repo_path) / "calc.py").read_text()
+    (Path(repo_path) / "report.xml").write_text(PASSING if passing else FAILING)
+    return {"exit_code": 0, "stdout": "", "stderr": ""}
+
+
+@patch("agent.speculative.run_tests", side_effect=_fake_run_tests)
+@patch("agent.speculative.build_image",
+       return_value={"exit_code": 0, "image": "ci-deps:abc", "python_detected": True, "cpp_detected": False})
+def test_passing_candidate_is_promoted(mock_build, mock_tests, repo, monkeypatch):
+    monkeypatch.setitem(speculative.settings, "speculative", {"candidates": 3, "pick": "best"})
+    monkeypatch.setattr(speculative, "propose_fix_async", _fake_candidates([
+        {"calc.py": "def add(a, b):\n    return a * b\n"},
+        {"calc.py": "def add(a, b):\n    return a + b\n"},
+        {"calc.py": "def add(a, b):\n    return a * b\n"},
+    ]))
+
+    fixes = propose_speculative_fix(None, str(repo), {"errors": []}, patch=1)
+
+    assert fixes == {"calc.py": "def add(a, b):\n    return a + b\n"}
+    # duplicate candidates are validated once, and the repo itself is left untouched
+    assert mock_build.call_count == 2
+    assert "a - b" in (repo / "calc.py").read_text()
+    assert not list((repo.parent / "base" / "repos" / ".sandboxes").iterdir())
+
+
+@patch("agent.speculative.run_tests", side_effect=_fake_run_tests)
+@patch("agent.speculative.build_image")
+def test_failed_builds_rank_last(mock_build, mock_tests, repo, monkeypatch):
+    def fake_build(repo_path):
+        broken = "syntax" in (Path(repo_path) / "calc.py").read_text()
+        return {"exit_code": 2 if broken else 0, "image": "ci-deps:abc", "python_detected": True, "cpp_detected": False}
+    mock_build.side_effect = fake_build
+    monkeypatch.setitem(speculative.settings, "speculative", {"candidates": 2, "pick": "first"})
+    monkeypatch.setattr(speculative, "propose_fix_async", _fake_candidates([
+        {"calc.py": "syntax error"},
+        {"calc.py": "def add(a, b):\n    return a * b\n"},
+    ]))
+
+    fixes = propose_speculative_fix(None, str(repo), {"errors": []}, patch=1)
+
+    assert fixes == {"calc.py": "def add(a, b):\n    return a * b\n"}
+
+
+@patch("agent.speculative.build_image",
+       return_value={"exit_code": 0, "image": "ci-deps:abc", "python_detected": False, "cpp_detected": True})
+def test_test_step_without_report_is_not_passing(mock_build, repo, monkeypatch):
+    def fake_run_tests(repo_path, is_python, is_cpp, image=None, test_ids=None, shards=None):
+        if "a + b" in (Path(repo_path) / "calc.py").read_text():
+            (Path(repo_path) / "report.xml").write_text(PASSING)
+            return {"exit_code": 0, "stdout": "", "stderr": ""}
+        # timed out: killed before writing any report
+        return {"exit_code": 124, "stdout": "", "stderr": "Timed out"}
+    monkeypatch.setattr(speculative, "run_tests", fake_run_tests)
+    monkeypatch.setitem(speculative.settings, "speculative", {"candidates": 2, "pick": "best"})
+    monkeypatch.setattr(speculative, "propose_fix_async", _fake_candidates([
+        # smaller than the passing fix, so it would win if it counted as passing
+        {"calc.py": "def add(a, b):\n    hang()\n"},
+        {"calc.py": "def add(a, b):\n    return a + b\n"},
+    ]))
+
+    fixes = propose_speculative_fix(None, str(repo), {"errors": []}, patch=1)
+
+    assert fixes == {"calc.py": "def add(a, b):\n    return a + b\n"}
+
+
+@patch("agent.speculative.build_image",
+       return_value={"exit_code": 0, "image": "ci-deps:abc", "python_detected": True, "cpp_detected": False})
+def test_losing_candidates_are_stopped(mock_build, repo, monkeypatch):
+    stopped = threading.Event()
+    seeded = []
+
+    class FakeBackend(ExecutionBackend):
+        def seed(self, repo_path, source_path):
+            seeded.append(source_path)
+
+        def stop(self, repo_path):
+            if "hang" in (Path(repo_path) / "calc.py").read_text():
+                stopped.set()
+
+    def fake_run_tests(repo_path, is_python, is_cpp, image=None, test_ids=None, shards=None):
+        if "hang" in (Path(repo_path) / "calc.py").read_text():
+            # a long test step, ended by stopping its worker
+            assert stopped.wait(5)
+            return {"exit_code": 137, "stdout": "", "stderr": "Killed"}
+        return _fake_run_tests(repo_path, is_python, is_cpp)
+    monkeypatch.setattr(speculative, "run_tests", fake_run_tests)
+    monkeypatch.setattr(speculative, "get_backend", FakeBackend)
+    monkeypatch.setitem(speculative.settings, "speculative", {"candidates": 2, "pick": "first"})
+    monkeypatch.setattr(speculative, "propose_fix_async", _fake_candidates([
+        {"calc.py": "def add(a, b):\n    hang()\n"},
+        {"calc.py": "def add(a, b):\n    return a + b\n"},
+    ]))
+
+    fixes = propose_speculative_fix(None, str(repo), {"errors": []}, patch=1)
+
+    assert fixes == {"calc.py": "def add(a, b):\n    return a + b\n"}
+    assert stopped.is_set()
+    assert seeded == [str(repo), str(repo)]
+    assert not list((repo.parent / "base" / "repos" / ".sandboxes").iterdir())
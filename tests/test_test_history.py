@@ -0,0 +1,63 @@
+import pytest
+
+from agent.log_parser import parse_test_outcomes
+from agent.retry import retry_policy
+from agent.settings import settings
+from agent.test_history import classify_failures, flakiness_scores, record_outcomes
+
+REPORT = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites><testsuite name="pytest">
+<testcase classname="tests.test_calc" name="test_add"/>
+<testcase classname="tests.test_calc" name="test_sub"><failure message="AssertionError">boom</failure></testcase>
+<testcase classname="tests.test_calc" name="test_div"><skipped message="todo"/></testcase>
+</testsuite></testsuites>
+"""
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setitem(settings, "test_history", {"path": str(tmp_path / "history.sqlite"),
+                                                   "flaky_threshold": 0.2, "deterministic_runs": 2})
+    repo = tmp_path / "repo"
+    (repo / "tests").mkdir(parents=True)
+    (repo / "tests" / "test_calc.py").write_text("")
+    return str(repo)
+
+
+def test_parse_test_outcomes(repo, tmp_path):
+    (tmp_path / "repo" / "report.xml").write_text(REPORT)
+
+    assert parse_test_outcomes(repo) == {"tests/test_calc.py::test_add": True, "tests/test_calc.py::test_sub": False}
+
+
+def test_flakiness_needs_repeated_runs_on_a_tree(repo):
+    record_outcomes(repo, "tree-1", {"flaky": True, "broken": False, "once": False})
+    record_outcomes(repo, "tree-1", {"flaky": False, "broken": False})
+    record_outcomes(repo, "tree-2", {"flaky": True, "broken": False})
+    record_outcomes(repo, "tree-2", {"flaky": True, "broken": False})
+
+    assert flakiness_scores(repo, ["flaky", "broken", "once", "unknown"]) == {"flaky": 0.5, "broken": 0.0}
+
+
+def test_classify_failures(repo):
+    record_outcomes(repo, "tree-1", {"flaky": True, "broken": False, "new": False})
+    record_outcomes(repo, "tree-1", {"flaky": False, "broken": False})
+
+    assert classify_failures(repo, "tree-1", ["flaky", "broken", "new"]) == (["flaky"], ["broken"])
+
+
+def test_history_disabled(repo, monkeypatch):
+    monkeypatch.setitem(settings, "test_history", {"enabled": False})
+    record_outcomes(repo, "tree-1", {"broken": False})
+
+    assert classify_failures(repo, "tree-1", ["broken"]) == ([], [])
+
+
+def test_retry_policy_uses_history():
+    # a flaky AssertionError is rerun instead of being fixed
+    assert retry_policy(0, ["AssertionError"], ["t1"], flaky_tests=["t1"]) is True
+    # a deterministic TimeoutError goes straight to a fix
+    assert retry_policy(0, ["TimeoutError"], ["t1"], deterministic_tests=["t1"]) is False
+    # without history the exception types decide
+    assert retry_policy(0, ["TimeoutError"], ["t1"]) is True
+    assert retry_policy(0, ["AssertionError"], ["t1", "t2"], flaky_tests=["t1"]) is False
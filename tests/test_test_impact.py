@@ -0,0 +1,38 @@
+from agent.test_impact import build_impact_index, select_impacted_tests
+
+
+def _make_repo(tmp_path):
+    files = {
+        "logic/__init__.py": "",
+        "logic/calc.py": "from .helpers import clamp\n\ndef add(a, b):\n    return clamp(a + b)\n",
+        "logic/helpers.py": "def clamp(x):\n    return x\n",
+        "logic/unused.py": "X = 1\n",
+        "tests/test_calc.py": "from logic.calc import add\n",
+        "tests/test_other.py": "import logic\n",
+    }
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    return str(tmp_path)
+
+
+def test_index_follows_transitive_imports(tmp_path):
+    index = build_impact_index(_make_repo(tmp_path))
+
+    assert index["logic/helpers.py"] == {"tests/test_calc.py"}
+    assert index["logic/__init__.py"] == {"tests/test_calc.py", "tests/test_other.py"}
+    assert "logic/unused.py" not in index
+
+def test_select_impacted_tests(tmp_path):
+    repo_path = _make_repo(tmp_path)
+
+    assert select_impacted_tests(repo_path, ["logic/calc.py"]) == ["tests/test_calc.py"]
+    assert select_impacted_tests(repo_path, ["tests/test_other.py"]) == ["tests/test_other.py"]
+    assert select_impacted_tests(repo_path, ["logic/unused.py"]) == []
+
+def test_select_requires_full_run_for_unmapped_changes(tmp_path):
+    repo_path = _make_repo(tmp_path)
+
+    assert select_impacted_tests(repo_path, ["logic/calc.cpp"]) is None
+    assert select_impacted_tests(repo_path, ["tests/conftest.py"]) is None
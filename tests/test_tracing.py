@@ -0,0 +1,107 @@
+import asyncio
+import json
+import threading
+from typing import TypedDict
+
+from langchain_core.messages import AIMessage
+from langgraph.graph import StateGraph, START, END
+
+from agent.fixer import _ainvoke_with_backoff, _traced_propose_fix
+from agent.rate_limit import RateLimiter
+from agent.settings import settings
+from agent.tracing import add_hook, in_current_context, remove_hook, run_pipeline, span, trace_run, traced_node
+
+
+def test_spans_are_recorded_and_summarized(tmp_path, monkeypatch):
+    monkeypatch.setitem(settings, "tracing", {"enabled": True, "dir": str(tmp_path)})
+
+    with trace_run("run-1") as recorder:
+        with span("BuildNode", "node"):
+            with span("docker_build", "docker", phase="build"):
+                pass
+        with span("parse_report", "parse"):
+            pass
+
+    summary = recorder.summary()
+    assert set(summary["nodes"]) == {"BuildNode"}
+    assert set(summary["docker"]) == {"build"}
+    trace = json.loads((tmp_path / "run-1.json").read_text())
+    assert [event["name"] for event in trace["traceEvents"]] == ["docker_build", "BuildNode", "parse_report"]
+    assert all(event["ph"] == "X" and "ts" in event and "dur" in event for event in trace["traceEvents"])
+    assert trace["otherData"]["summary"]["nodes"] == summary["nodes"]
+
+
+def test_hooks_receive_spans_outside_runs():
+    events = []
+    add_hook(events.append)
+    try:
+        with span("docker_test", "docker", phase="test") as trace:
+            trace["exit_code"] = 1
+    finally:
+        remove_hook(events.append)
+
+    assert events[0]["args"] == {"phase": "test", "exit_code": 1}
+
+
+def test_spans_of_worker_threads_belong_to_the_run(tmp_path, monkeypatch):
+    monkeypatch.setitem(settings, "tracing", {"enabled": False})
+
+    def shard(i):
+        with span(f"shard_{i}", "docker", phase="test"):
+            pass
+
+    with trace_run("run-2") as recorder:
+        threads = [threading.Thread(target=in_current_context(shard), args=(i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert sorted(event["name"] for event in recorder.events) == ["shard_0", "shard_1", "shard_2"]
+    assert not (tmp_path / "run-2.json").exists()
+
+
+class _State(TypedDict):
+    value: int
+
+
+def test_run_pipeline_times_graph_nodes(tmp_path, monkeypatch):
+    monkeypatch.setitem(settings, "tracing", {"enabled": True, "dir": str(tmp_path)})
+    graph = StateGraph(_State)
+    graph.add_node("Double", traced_node("Double", lambda state: {"value": state["value"] * 2}))
+    graph.add_edge(START, "Double")
+    graph.add_edge("Double", END)
+
+    final_state, summary = run_pipeline(graph.compile(), {"value": 2}, run_name="graph")
+
+    assert final_state == {"value": 4}
+    assert list(summary["nodes"]) == ["Double"]
+    assert (tmp_path / "graph.json").exists()
+
+
+class _FakeAgent:
+    async def ainvoke(self, payload):
+        reply = AIMessage(content="done", usage_metadata={"input_tokens": 120, "output_tokens": 30, "total_tokens": 150})
+        return {"messages": payload["messages"] + [reply]}
+
+
+def test_llm_usage_is_recorded_per_fix(monkeypatch):
+    monkeypatch.setitem(settings, "tracing", {"enabled": False})
+
+    async def fake_propose_fix(llm, repo_path, errors, repo_index, limiter, use_cache, prompt_suffix=""):
+        response = await _ainvoke_with_backoff(_FakeAgent(), [("user", "fix it")])
+        await _ainvoke_with_backoff(_FakeAgent(), response["messages"] + [("user", "again")])
+        return {}
+
+    monkeypatch.setattr("agent.fixer._propose_fix", fake_propose_fix)
+    errors = [{"file": "calc.py", "message": "boom"}]
+
+    with trace_run("run-3") as recorder:
+        asyncio.run(_traced_propose_fix(None, "repo", errors, None, RateLimiter(1)))
+
+    summary = recorder.summary()
+    assert summary["llm"]["calls"] == 2
+    assert summary["llm"]["input_tokens"] == 240
+    assert summary["fixes"][0]["file"] == "calc.py"
+    assert summary["fixes"][0]["calls"] == 2
+    assert summary["fixes"][0]["output_tokens"] == 60
@@ -0,0 +1,62 @@
+import shutil
+
+import pytest
+
+from agent.repo_index import RepoIndex
+from agent.validation import validate_fixes
+
+
+@pytest.fixture
+def repo(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "calc.py").write_text("def add(a, b):\n    return a - b\n")
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "calc.cpp").write_text("int add(int a, int b) { return a - b; }\n")
+    (tmp_path / "src" / "uses_dep.cpp").write_text("#include <not_installed/dep.h>\nint f() { return dep(); }\n")
+    return tmp_path
+
+
+def test_python_syntax_and_paths(repo):
+    errors = validate_fixes(str(repo), {
+        "pkg/calc.py": "def add(a, b):\n    return a +\n",
+        "core/calc.py": "X = 1\n",
+        "../outside.py": "X = 1\n",
+        "pkg/new_module.py": "X = 1\n",
+    }, RepoIndex(str(repo)))
+
+    assert errors["pkg/calc.py"].startswith("line 2")
+    assert "did you mean pkg/calc.py" in errors["core/calc.py"]
+    assert "outside the repo" in errors["../outside.py"]
+    assert "pkg/new_module.py" not in errors
+
+
+def test_new_files_are_not_flagged_as_misspellings(repo):
+    (repo / "tests" / "unit").mkdir(parents=True)
+    (repo / "tests" / "unit" / "conftest.py").write_text("")
+    (repo / "pkg" / "__init__.py").write_text("")
+    (repo / "pkg" / "util.py").write_text("")
+    (repo / "src" / "util.py").write_text("")
+
+    errors = validate_fixes(str(repo), {
+        "newpkg/__init__.py": "",
+        "tests/sub/conftest.py": "",
+        "lib/util.py": "X = 1\n",
+        "src/calc.py": "X = 1\n",
+        "lib/calc.py": "X = 1\n",
+    }, RepoIndex(str(repo)))
+
+    # a name used in several directories, or a new file next to existing ones, is not a wrong path;
+    # the only calc.py moved into a directory that does not exist is
+    assert list(errors) == ["lib/calc.py"]
+    assert "did you mean pkg/calc.py" in errors["lib/calc.py"]
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="no C++ compiler")
+def test_cpp_syntax_only(repo):
+    index = RepoIndex(str(repo))
+
+    errors = validate_fixes(str(repo), {"src/calc.cpp": "int add(int a, int b) { return a + b }\n"}, index)
+    assert "src/calc.cpp" in errors["src/calc.cpp"]
+    assert validate_fixes(str(repo), {"src/calc.cpp": "int add(int a, int b) { return a + b; }\n"}, index) == {}
+    # the current file does not compile locally either (missing dependency): inconclusive, not rejected
+    assert validate_fixes(str(repo), {"src/uses_dep.cpp": "#include <not_installed/dep.h>\nint f() {\n"}, index) == {}